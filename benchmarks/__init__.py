@@ -0,0 +1,15 @@
+"""
+Замеры производительности основных операций базы.
+
+Для каждого размера таблицы (по умолчанию 1 000, 100 000 и 1 000 000
+строк) создается синтетическая таблица по типам столбцов create_table,
+и замеряются insert, select по ID, select с фильтром, update и delete -
+через функции core и через команды сеанса (как в консоли, engine).
+Результаты сохраняются в JSON, а режим сравнения отмечает операции,
+ставшие медленнее сохраненного базового замера.
+
+Запуск из корня проекта:
+
+    python -m benchmarks --output baseline.json
+    python -m benchmarks --compare baseline.json
+"""
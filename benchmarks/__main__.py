@@ -0,0 +1,151 @@
+"""
+Командная строка замеров: python -m benchmarks --help
+"""
+import argparse
+import json
+import sys
+
+from benchmarks import persistence
+from benchmarks.suite import (
+    DEFAULT_POINT_REPEAT,
+    DEFAULT_SCAN_REPEAT,
+    DEFAULT_SIZES,
+    DEFAULT_THRESHOLD,
+    PATHS,
+    compare,
+    run_suite,
+)
+from primitive_db.constants import ENCODING, TABLE_FORMATS
+
+
+# Разбор аргументов командной строки
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="Замеры производительности операций базы.",
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        metavar="N",
+        help="размеры таблиц в строках (по умолчанию 1000 100000 1000000, "
+        "с --persistence - 100000 1000000)",
+    )
+    parser.add_argument(
+        "--paths",
+        nargs="+",
+        choices=PATHS,
+        default=list(PATHS),
+        help="пути выполнения: core - функции, engine - команды сеанса",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=DEFAULT_POINT_REPEAT,
+        help="повторов точечных операций",
+    )
+    parser.add_argument(
+        "--scan-repeat",
+        type=int,
+        help="повторов select с фильтром (полный просмотр); с --persistence - "
+        f"повторов сохранения и загрузки (по умолчанию {DEFAULT_SCAN_REPEAT} "
+        f"и {persistence.DEFAULT_REPEAT})",
+    )
+    parser.add_argument(
+        "--format",
+        choices=sorted(TABLE_FORMATS),
+        default="json",
+        help="формат хранения таблицы замеров",
+    )
+    parser.add_argument(
+        "--persistence",
+        action="store_true",
+        help="замерить сохранение и загрузку таблицы в режимах записи JSON "
+        "(стиль, библиотека, сжатие) вместо операций",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="зерно генератора")
+    parser.add_argument(
+        "-o",
+        "--output",
+        metavar="FILE",
+        help="сохранить результаты в JSON (по умолчанию - в stdout)",
+    )
+    parser.add_argument(
+        "--compare",
+        metavar="BASELINE",
+        help="сравнить с базовым замером и отметить замедления",
+    )
+    parser.add_argument(
+        "--current",
+        metavar="FILE",
+        help="с --compare: взять текущий замер из файла, а не выполнять заново",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="допустимое замедление медианы (доля, по умолчанию 0.2)",
+    )
+    return parser.parse_args(argv)
+
+# Читает сохраненные результаты замеров
+def _load_results(filepath):
+    with open(filepath, "r", encoding=ENCODING) as file:
+        return json.load(file)
+
+# Выводит сравнение с базовым замером; возвращает число замедлений
+def _print_comparison(comparison, threshold):
+    regressions = 0
+    for (path, operation, rows), base, current, ratio, regressed in comparison:
+        mark = "ЗАМЕДЛЕНИЕ" if regressed else ""
+        regressions += regressed
+        print(
+            f"{path:<7} {operation:<14} {rows:>9} "
+            f"{base * 1000:>10.3f} мс -> {current * 1000:>10.3f} мс "
+            f"x{ratio:.2f} {mark}".rstrip()
+        )
+    print(
+        f"Сравнено операций: {len(comparison)}, замедлений "
+        f"более чем на {threshold:.0%}: {regressions}"
+    )
+    return regressions
+
+def main(argv=None):
+    args = _parse_args(argv)
+
+    if args.current:
+        results = _load_results(args.current)
+    elif args.persistence:
+        results = persistence.run_persistence(
+            args.sizes or persistence.DEFAULT_SIZES,
+            args.scan_repeat or persistence.DEFAULT_REPEAT,
+            args.seed,
+            progress=lambda message: print(message, file=sys.stderr),
+        )
+    else:
+        results = run_suite(
+            args.sizes or DEFAULT_SIZES,
+            args.paths,
+            args.repeat,
+            args.scan_repeat or DEFAULT_SCAN_REPEAT,
+            args.seed,
+            args.format,
+            progress=lambda message: print(message, file=sys.stderr),
+        )
+
+    if args.output:
+        with open(args.output, "w", encoding=ENCODING) as file:
+            json.dump(results, file, indent=4, ensure_ascii=False)
+    elif not args.compare:
+        json.dump(results, sys.stdout, indent=4, ensure_ascii=False)
+        print()
+
+    if args.compare:
+        comparison = compare(_load_results(args.compare), results, args.threshold)
+        if _print_comparison(comparison, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
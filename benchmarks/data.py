@@ -0,0 +1,51 @@
+"""
+Синтетические таблицы для замеров.
+"""
+import random
+import string
+
+from primitive_db.constants import META_FILE
+from primitive_db.core import create_table
+from primitive_db.utils import save_metadata, save_table_data
+
+# Столбцы таблицы замеров: по одному на каждый тип create_table
+BENCH_COLUMNS = ["name:str", "age:int", "active:bool"]
+
+# Диапазон значений столбца age (по нему строятся фильтры select)
+AGE_RANGE = (18, 90)
+
+
+# Генерирует значение столбца указанного типа
+def generate_value(col_type, rng):
+    if col_type == "int":
+        return rng.randint(*AGE_RANGE)
+    if col_type == "bool":
+        return rng.random() < 0.5
+    if col_type == "str":
+        return "".join(rng.choices(string.ascii_lowercase, k=8))
+    raise ValueError(f"нет генератора для типа {col_type}")
+
+# Генерирует значения одной строки в порядке столбцов
+def generate_row(columns, rng):
+    return [generate_value(col.split(":")[1], rng) for col in columns]
+
+# Создает таблицу и заполняет её rows синтетическими строками
+def create_synthetic_table(table_name, rows, seed=0, table_format="json"):
+    """
+    Работает в текущей директории: метаданные пишутся в META_FILE,
+    данные - одним сохранением основного файла, без журнала. Возвращает
+    метаданные.
+    """
+    rng = random.Random(seed)
+    metadata = {}
+    create_table(metadata, table_name, BENCH_COLUMNS, table_format)
+    save_metadata(META_FILE, metadata)
+
+    names = [col.split(":")[0] for col in BENCH_COLUMNS]
+    records = []
+    for record_id in range(1, rows + 1):
+        record = dict(zip(names, generate_row(BENCH_COLUMNS, rng)))
+        record["ID"] = record_id
+        records.append(record)
+    save_table_data(table_name, {"next_id": rows + 1, "records": records})
+    return metadata
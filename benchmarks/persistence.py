@@ -0,0 +1,127 @@
+"""
+Замеры сохранения и загрузки таблиц в формате JSON в разных режимах
+записи: стиль (compact, pretty), библиотека JSON (json, orjson)
+и сжатие сегментов (none, gzip, zstd). Режимы без установленной
+библиотеки пропускаются.
+
+Для каждого режима таблица целиком сохраняется (save_table_data)
+в пустую директорию и загружается (load_table_data) repeat раз.
+Результаты - в том же виде, что у run_suite: путь - режим
+("стиль/библиотека/сжатие"), операции save и load, а также размер
+файлов таблицы на диске в байтах.
+"""
+import contextlib
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from benchmarks.data import BENCH_COLUMNS, generate_row
+from benchmarks.suite import TABLE_NAME, summarize
+from primitive_db import serializer
+from primitive_db.constants import DATA_DIR
+from primitive_db.utils import load_table_data, save_table_data
+
+# Размеры таблиц по умолчанию
+DEFAULT_SIZES = (100_000, 1_000_000)
+
+# Повторов сохранения и загрузки в каждом режиме
+DEFAULT_REPEAT = 3
+
+
+# Доступные режимы записи: (стиль, библиотека, сжатие)
+def available_modes():
+    backends = ["json"] + (["orjson"] if serializer.has_orjson() else [])
+    methods = ["none", "gzip"] + (["zstd"] if serializer.has_zstd() else [])
+    modes = [("pretty", "json", "none")]
+    for backend in backends:
+        modes.extend(("compact", backend, method) for method in methods)
+    return modes
+
+# Записи синтетической таблицы
+def _make_records(rows, seed):
+    rng = random.Random(seed)
+    names = [col.split(":")[0] for col in BENCH_COLUMNS]
+    records = []
+    for record_id in range(1, rows + 1):
+        record = dict(zip(names, generate_row(BENCH_COLUMNS, rng)))
+        record["ID"] = record_id
+        records.append(record)
+    return records
+
+# Размер файлов таблицы в директории данных
+def _stored_size():
+    total = 0
+    for root, _, files in os.walk(DATA_DIR):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total
+
+# Замеряет сохранение и загрузку таблицы в одном режиме
+def _run_mode(records, compression, repeat):
+    saves = []
+    loads = []
+    size = 0
+    for _ in range(repeat):
+        shutil.rmtree(DATA_DIR, ignore_errors=True)
+        data = {"next_id": len(records) + 1, "compression": compression}
+        data["records"] = records
+        start = time.perf_counter()
+        save_table_data(TABLE_NAME, data)
+        saves.append(time.perf_counter() - start)
+        size = _stored_size()
+
+        start = time.perf_counter()
+        loaded = load_table_data(TABLE_NAME)
+        loads.append(time.perf_counter() - start)
+        if len(loaded["records"]) != len(records):
+            raise RuntimeError(
+                f"загружено {len(loaded['records'])} записей вместо {len(records)}"
+            )
+    return saves, loads, size
+
+# Выполняет замеры всех доступных режимов
+def run_persistence(sizes=DEFAULT_SIZES, repeat=DEFAULT_REPEAT, seed=0, progress=None):
+    """
+    progress - функция для сообщений о ходе замеров. Возвращает словарь
+    для сохранения в JSON (как run_suite).
+    """
+    results = []
+    settings = serializer.get_settings(resolve=False)
+    directory = tempfile.mkdtemp(prefix="primitive-db-bench-persistence-")
+    try:
+        with contextlib.chdir(directory):
+            for rows in sizes:
+                records = _make_records(rows, seed)
+                for style, backend, compression in available_modes():
+                    mode = f"{style}/{backend}/{compression}"
+                    if progress:
+                        progress(f"Таблица {rows} строк: режим {mode}...")
+                    serializer.configure(style, backend)
+                    saves, loads, size = _run_mode(records, compression, repeat)
+                    for operation, timings in (("save", saves), ("load", loads)):
+                        results.append(
+                            {
+                                "path": mode,
+                                "operation": operation,
+                                "rows": rows,
+                                "bytes": size,
+                                **summarize(timings),
+                            }
+                        )
+    finally:
+        serializer.configure(settings["style"], settings["backend"])
+        shutil.rmtree(directory, ignore_errors=True)
+
+    return {
+        "environment": {
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "benchmark": "persistence",
+            "columns": BENCH_COLUMNS,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
@@ -0,0 +1,267 @@
+"""
+Сценарии замеров, запуск и сравнение результатов.
+
+Каждая операция выполняется repeat раз, время каждого выполнения
+замеряется отдельно (time.perf_counter), в результат попадают
+минимум, среднее, медиана (p50), p95 и число операций в секунду.
+Вывод команд (сообщения и log_time) отправляется в os.devnull, но его
+стоимость остается в замере - как и в консоли.
+"""
+import contextlib
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from benchmarks.data import AGE_RANGE, BENCH_COLUMNS, create_synthetic_table
+from primitive_db.core import clear_select_cache, delete, insert, select, update
+from primitive_db.decorators import get_confirmation_mode, set_confirmation_mode
+from primitive_db.engine import close_session, execute_command, new_session
+from primitive_db.planner import compile_where_text
+from primitive_db.utils import load_table_data
+
+# Размеры таблиц по умолчанию
+DEFAULT_SIZES = (1_000, 100_000, 1_000_000)
+
+# Повторов точечных операций (insert, select/update/delete по ID)
+DEFAULT_POINT_REPEAT = 200
+
+# Повторов операций с полным просмотром таблицы (select с фильтром)
+DEFAULT_SCAN_REPEAT = 5
+
+# Допустимое замедление медианы относительно базового замера (доля)
+DEFAULT_THRESHOLD = 0.2
+
+# Пути выполнения: функции core напрямую и команды сеанса engine
+PATHS = ("core", "engine")
+
+# Имя таблицы замеров
+TABLE_NAME = "bench"
+
+
+# Значение перцентиля по отсортированному списку (метод ближайшего ранга)
+def _percentile(values, fraction):
+    index = max(0, min(len(values) - 1, round(fraction * len(values)) - 1))
+    return values[index]
+
+# Сводка по времени отдельных выполнений операции
+def summarize(timings):
+    timings = sorted(timings)
+    mean = sum(timings) / len(timings)
+    return {
+        "repeat": len(timings),
+        "min": timings[0],
+        "mean": mean,
+        "p50": _percentile(timings, 0.5),
+        "p95": _percentile(timings, 0.95),
+        "ops_per_sec": 1 / mean if mean else None,
+    }
+
+# Замеряет время каждого вызова func(argument) по списку аргументов
+def _measure(func, arguments):
+    timings = []
+    for argument in arguments:
+        start = time.perf_counter()
+        func(argument)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+# Аргументы операций: новые строки, ID для чтения, изменения и удаления,
+# пороги фильтров
+def _plan_arguments(rows, point_repeat, scan_repeat, seed):
+    rng = random.Random(seed + 1)
+    count = min(point_repeat, rows // 2)
+    ids = rng.sample(range(1, rows + 1), count * 2)
+    low, high = AGE_RANGE
+    return {
+        # Значения в виде строк, как после разбора команды
+        "insert": [
+            ["new", str(rng.randint(low, high)), "true"]
+            for _ in range(point_repeat)
+        ],
+        "select_id": ids[:count],
+        # Разные пороги около середины диапазона, чтобы замер не сводился
+        # к попаданию в кэш select
+        "select_filter": [
+            (low + high) // 2 + i % ((high - low) // 2) for i in range(scan_repeat)
+        ],
+        "update": ids[:count],
+        # Удаляем другие записи, чтобы удаление не зависело от обновления
+        "delete": ids[count:],
+    }
+
+# Операции через функции core
+def _core_operations(metadata):
+    table_data = load_table_data(TABLE_NAME)
+    return {
+        "insert": lambda values: insert(metadata, TABLE_NAME, values, table_data),
+        "select_id": lambda record_id: select(
+            table_data, {"ID": record_id}, TABLE_NAME
+        ),
+        "select_filter": lambda age: select(
+            table_data, compile_where_text(f"age > {age}"), TABLE_NAME
+        ),
+        "update": lambda record_id: update(
+            table_data, {"age": AGE_RANGE[0]}, {"ID": record_id}, TABLE_NAME
+        ),
+        "delete": lambda record_id: delete(
+            table_data, {"ID": record_id}, TABLE_NAME
+        ),
+    }, None
+
+# Операции через команды сеанса, как в консоли (engine.run)
+def _engine_operations(metadata):
+    session = new_session()
+
+    def run(command):
+        execute_command(session, command)
+
+    # Загружаем таблицу в пул заранее, как core, чтобы чтение файла
+    # не попало в замер первой операции
+    run(f"select {TABLE_NAME} WHERE ID = 0")
+
+    return {
+        "insert": lambda values: run(
+            f'insert {TABLE_NAME} "{values[0]}" {values[1]} {values[2]}'
+        ),
+        "select_id": lambda record_id: run(
+            f"select {TABLE_NAME} WHERE ID = {record_id}"
+        ),
+        "select_filter": lambda age: run(f"select {TABLE_NAME} WHERE age > {age}"),
+        "update": lambda record_id: run(
+            f"update {TABLE_NAME} SET age = {AGE_RANGE[0]} WHERE ID = {record_id}"
+        ),
+        "delete": lambda record_id: run(
+            f"delete {TABLE_NAME} WHERE ID = {record_id}"
+        ),
+    }, session
+
+# Готовит директорию с таблицей заданного размера
+def _prepare_template(rows, seed, table_format):
+    directory = tempfile.mkdtemp(prefix=f"primitive-db-bench-{rows}-")
+    with contextlib.chdir(directory):
+        with open(os.devnull, "w") as devnull:
+            with contextlib.redirect_stdout(devnull):
+                metadata = create_synthetic_table(
+                    TABLE_NAME, rows, seed, table_format
+                )
+    return directory, metadata
+
+# Проверяет, что операции замера выполнились, а не завершились ошибкой
+def _check_table(rows, arguments):
+    expected = rows + len(arguments["insert"]) - len(arguments["delete"])
+    actual = len(load_table_data(TABLE_NAME)["records"])
+    if actual != expected:
+        raise RuntimeError(
+            f"после замеров в таблице {actual} записей вместо {expected}: "
+            f"часть операций завершилась ошибкой"
+        )
+
+# Замеряет все операции одного пути на копии подготовленной таблицы
+def _run_path(path, template, metadata, rows, arguments):
+    directory = template + f"-{path}"
+    shutil.copytree(template, directory)
+    clear_select_cache()
+    timings = {}
+    try:
+        with contextlib.chdir(directory):
+            factory = _core_operations if path == "core" else _engine_operations
+            operations, session = factory(metadata)
+            for name, func in operations.items():
+                timings[name] = _measure(func, arguments[name])
+            if session is not None:
+                close_session(session)
+            _check_table(rows, arguments)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return timings
+
+# Выполняет замеры
+def run_suite(
+    sizes=DEFAULT_SIZES,
+    paths=PATHS,
+    point_repeat=DEFAULT_POINT_REPEAT,
+    scan_repeat=DEFAULT_SCAN_REPEAT,
+    seed=0,
+    table_format="json",
+    progress=None,
+):
+    """
+    progress - функция для сообщений о ходе замеров (например, print
+    в stderr). Возвращает словарь для сохранения в JSON: сведения
+    об окружении и список результатов по операциям.
+    """
+    results = []
+    mode = get_confirmation_mode()
+    set_confirmation_mode("yes")
+    try:
+        for rows in sizes:
+            if progress:
+                progress(f"Таблица {rows} строк: подготовка...")
+            template, metadata = _prepare_template(rows, seed, table_format)
+            arguments = _plan_arguments(rows, point_repeat, scan_repeat, seed)
+            try:
+                for path in paths:
+                    if progress:
+                        progress(f"Таблица {rows} строк: замеры {path}...")
+                    with open(os.devnull, "w") as devnull:
+                        with contextlib.redirect_stdout(devnull):
+                            timings = _run_path(
+                                path, template, metadata, rows, arguments
+                            )
+                    for operation, values in timings.items():
+                        results.append(
+                            {
+                                "path": path,
+                                "operation": operation,
+                                "rows": rows,
+                                **summarize(values),
+                            }
+                        )
+            finally:
+                shutil.rmtree(template, ignore_errors=True)
+    finally:
+        set_confirmation_mode(mode)
+
+    return {
+        "environment": {
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "table_format": table_format,
+            "columns": BENCH_COLUMNS,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+
+# Ключ результата для сравнения замеров
+def result_key(result):
+    return result["path"], result["operation"], result["rows"]
+
+# Сравнивает замеры с базовыми по медиане
+def compare(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """
+    Возвращает список строк сравнения: (ключ, базовая p50, текущая p50,
+    отношение, замедление ли это). Операции, которых нет в одном
+    из замеров, пропускаются.
+    """
+    base_results = {result_key(result): result for result in baseline["results"]}
+    comparison = []
+    for result in current["results"]:
+        base = base_results.get(result_key(result))
+        if base is None:
+            continue
+        ratio = result["p50"] / base["p50"] if base["p50"] else float("inf")
+        comparison.append(
+            (
+                result_key(result),
+                base["p50"],
+                result["p50"],
+                ratio,
+                ratio > 1 + threshold,
+            )
+        )
+    return comparison
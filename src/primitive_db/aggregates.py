@@ -0,0 +1,109 @@
+"""
+Агрегатные функции select: COUNT, SUM, MIN, MAX, AVG и GROUP BY.
+
+Записи перебираются один раз, для каждой группы хранится только
+состояние её агрегатов (счетчик, сумма, минимум...), поэтому память
+зависит от числа групп, а не записей. Отсутствующие значения
+в агрегатах по столбцу не учитываются, как NULL в SQL: SUM, MIN, MAX
+и AVG без значений дают None. Группы выводятся в порядке первой
+встречи (записи перебираются по возрастанию ID).
+"""
+
+
+# Заголовок столбца результата для элемента списка select
+def aggregate_label(item):
+    func, column = item
+    if func is None:
+        return column
+    return f"{func.upper()}({'*' if column is None else column})"
+
+# Проверяет, есть ли в списке столбцов агрегатные функции или группировка
+def is_aggregate_query(columns, group_by):
+    return group_by is not None or (
+        columns is not None and any(func is not None for func, _ in columns)
+    )
+
+# Проверяет, что запрос - один COUNT(*) без группировки
+def is_count_only(columns, group_by):
+    return group_by is None and columns == [("count", None)]
+
+# COUNT(столбец): число записей со значением
+def _update_count(state, value):
+    return state + 1
+
+# SUM: сумма значений
+def _update_sum(state, value):
+    return value if state is None else state + value
+
+# MIN: наименьшее значение
+def _update_min(state, value):
+    return value if state is None or value < state else state
+
+# MAX: наибольшее значение
+def _update_max(state, value):
+    return value if state is None or value > state else state
+
+# AVG: сумма и число значений
+def _update_avg(state, value):
+    return (state[0] + value, state[1] + 1)
+
+# Начальное состояние и функция обновления для каждого агрегата
+_AGGREGATES = {
+    "count": (0, _update_count),
+    "sum": (None, _update_sum),
+    "min": (None, _update_min),
+    "max": (None, _update_max),
+    "avg": ((0, 0), _update_avg),
+}
+
+# Итоговое значение агрегата по состоянию
+def _finish(func, state):
+    if func == "avg":
+        total, count = state
+        return total / count if count else None
+    return state
+
+# Вычисляет агрегаты по записям за один проход
+def aggregate(records, columns, group_by=None):
+    """
+    records - итерируемый набор записей (уже отфильтрованных по WHERE),
+    columns - список (функция, столбец) из parser.parse_select,
+    group_by - столбец группировки или None (одна группа на все записи).
+    Возвращает список строк результата {заголовок: значение}.
+    """
+    # Агрегаты без столбцов группировки: (номер, функция, столбец)
+    updates = [
+        (position, _AGGREGATES[func][1], column)
+        for position, (func, column) in enumerate(columns)
+        if func is not None
+    ]
+    initial = [
+        _AGGREGATES[func][0] if func is not None else None for func, _ in columns
+    ]
+
+    groups = {}
+    for record in records:
+        key = record.get(group_by) if group_by is not None else None
+        state = groups.get(key)
+        if state is None:
+            state = groups[key] = list(initial)
+        for position, update, column in updates:
+            if column is None:
+                state[position] += 1
+                continue
+            value = record.get(column)
+            if value is not None:
+                state[position] = update(state[position], value)
+
+    # Без группировки результат - одна строка, даже если записей нет
+    if group_by is None and not groups:
+        groups[None] = list(initial)
+
+    labels = [aggregate_label(item) for item in columns]
+    rows = []
+    for key, state in groups.items():
+        row = {}
+        for label, (func, _), value in zip(labels, columns, state):
+            row[label] = key if func is None else _finish(func, value)
+        rows.append(row)
+    return rows
@@ -0,0 +1,261 @@
+"""
+Пул буферов: разобранные таблицы остаются в памяти между командами.
+
+Для каждой таблицы пул хранит её данные (с индексами), оценку размера,
+признак "грязная" и подпись файлов таблицы на момент последнего чтения
+или записи. Если подпись изменилась не через пул (таблицу правил другой
+процесс или человек), таблица перечитывается.
+
+Изменения таблиц к моменту отметки уже записаны в журнал, а "грязная"
+означает, что основной файл отстает от журнала: он обновляется лениво,
+при сбросе пула или вытеснении таблицы.
+
+Когда суммарный размер таблиц превышает бюджет, давно не использованные
+таблицы вытесняются (LRU); грязные перед этим сохраняются.
+
+Таблицы, закрепленные транзакцией (pin_table), содержат незафиксированные
+изменения: их нельзя сохранять на диск и вытеснять до COMMIT или ROLLBACK.
+
+Пулом могут пользоваться несколько потоков (серверный режим). Его
+внутренние структуры защищены блокировкой пула, которая никогда не
+удерживается во время ожидания блокировки таблицы: писатели берут
+блокировку таблицы, а затем пула, и обратный порядок привел бы
+к взаимной блокировке. Поэтому таблица изредка может загрузиться
+дважды или быть вытеснена сразу после изменения - это безопасно,
+так как все изменения к этому моменту уже в журнале.
+"""
+import threading
+from collections import OrderedDict
+
+from primitive_db import metrics
+from primitive_db.constants import BUFFER_POOL_BYTES
+from primitive_db.utils import (
+    approximate_size,
+    get_table_signature,
+    load_table_data,
+    save_table_data,
+    table_lock,
+)
+
+
+# Создает пустой пул буферов
+def create_buffer_pool(max_bytes=BUFFER_POOL_BYTES):
+    """
+    max_bytes - бюджет памяти пула в байтах (None - без ограничения).
+    """
+    return {
+        "tables": OrderedDict(),
+        "lock": threading.RLock(),
+        "pinned": {},
+        "max_bytes": max_bytes,
+        "bytes": 0,
+        "hits": 0,
+        "misses": 0,
+        "reloads": 0,
+        "evictions": 0,
+        "writebacks": 0,
+    }
+
+# Оценивает размер таблицы в памяти по размеру её записей
+def _estimate_size(table_data):
+    return approximate_size(table_data.get("records", []))
+
+# Сохраняет грязную таблицу на диск
+def _write_back(pool, table_name, entry):
+    """
+    Если после нашей записи таблицу менял другой процесс, данные в памяти
+    устарели: сохранять их нельзя, а наши изменения уже есть в журнале,
+    так что таблица просто считается чистой.
+    """
+    if not entry["dirty"]:
+        return True
+    with table_lock(table_name):
+        if entry["signature"] == get_table_signature(table_name):
+            if not save_table_data(table_name, entry["data"]):
+                return False
+            entry["signature"] = get_table_signature(table_name)
+            with pool["lock"]:
+                pool["writebacks"] += 1
+        entry["dirty"] = False
+    return True
+
+# Убирает таблицу из пула без сохранения
+def _drop_entry(pool, table_name, expected=None):
+    """
+    expected - убрать, только если в пуле всё еще эта запись (а не
+    загруженная заново другим потоком).
+    """
+    with pool["lock"]:
+        entry = pool["tables"].get(table_name)
+        if entry is None or (expected is not None and entry is not expected):
+            return None
+        del pool["tables"][table_name]
+        pool["bytes"] -= entry["size"]
+        return entry
+
+# Выбирает давно не использованную таблицу для вытеснения
+def _pick_victim(pool, keep, skip):
+    with pool["lock"]:
+        if pool["max_bytes"] is None or pool["bytes"] <= pool["max_bytes"]:
+            return None, None
+        for table_name, entry in pool["tables"].items():
+            if (
+                table_name != keep
+                and table_name not in skip
+                and table_name not in pool["pinned"]
+            ):
+                return table_name, entry
+        return None, None
+
+# Вытесняет давно не использованные таблицы, пока пул не уложится в бюджет
+def _evict(pool, keep=None):
+    """
+    keep - таблица, которую вытеснять нельзя (только что запрошенная).
+    """
+    skip = set()
+    while True:
+        table_name, entry = _pick_victim(pool, keep, skip)
+        if table_name is None:
+            return
+        # Не удалось сохранить - оставляем таблицу в памяти, чтобы не потерять
+        if not _write_back(pool, table_name, entry):
+            skip.add(table_name)
+        elif _drop_entry(pool, table_name, entry) is not None:
+            with pool["lock"]:
+                pool["evictions"] += 1
+
+# Возвращает данные таблицы из пула, при необходимости загружая их
+def get_table(pool, table_name, index_defs=None):
+    """
+    index_defs - определения индексов для загрузки (см. load_table_data).
+    Таблица перечитывается, если её файлы изменились извне.
+    """
+    # Подпись берем до чтения, чтобы не пропустить запись во время загрузки
+    signature = get_table_signature(table_name)
+    with pool["lock"]:
+        entry = pool["tables"].get(table_name)
+        if entry is not None:
+            if entry["signature"] == signature:
+                pool["hits"] += 1
+                pool["tables"].move_to_end(table_name)
+                return entry["data"]
+            # Файлы таблицы изменены не через пул - перечитываем. Наши
+            # изменения к этому моменту уже в журнале, ничего не теряется
+            _drop_entry(pool, table_name)
+            pool["reloads"] += 1
+        pool["misses"] += 1
+
+    with metrics.stage("загрузка таблицы в пул") as current:
+        table_data = load_table_data(table_name, index_defs)
+        current.set_rows(len(table_data["records"]))
+    size = _estimate_size(table_data)
+    with pool["lock"]:
+        _drop_entry(pool, table_name)
+        pool["tables"][table_name] = {
+            "data": table_data,
+            "signature": signature,
+            "size": size,
+            "row_size": size / max(len(table_data["records"]), 1),
+            "dirty": False,
+        }
+        pool["bytes"] += size
+    _evict(pool, keep=table_name)
+    return table_data
+
+# Возвращает данные таблицы, если она уже в пуле (без загрузки)
+def peek_table(pool, table_name):
+    with pool["lock"]:
+        entry = pool["tables"].get(table_name)
+    return None if entry is None else entry["data"]
+
+# Отмечает, что таблица в пуле изменена
+def mark_dirty(pool, table_name):
+    """
+    Вызывается сразу после записи изменений в журнал, под той же
+    блокировкой таблицы: пул обновляет подпись файлов, чтобы не принять
+    свою запись за правку извне.
+    """
+    signature = get_table_signature(table_name)
+    with pool["lock"]:
+        entry = pool["tables"].get(table_name)
+        if entry is None:
+            return
+        entry["dirty"] = True
+        entry["signature"] = signature
+
+        # Размер пересчитываем по числу строк, не обходя все записи
+        size = int(entry["row_size"] * len(entry["data"]["records"]))
+        pool["bytes"] += size - entry["size"]
+        entry["size"] = size
+    _evict(pool, keep=table_name)
+
+# Сохраняет грязные таблицы пула (все или одну)
+def flush(pool, table_name=None):
+    with pool["lock"]:
+        if table_name is None:
+            entries = list(pool["tables"].items())
+        else:
+            entries = [(table_name, pool["tables"].get(table_name))]
+        # Незафиксированные изменения транзакций на диск не попадают
+        entries = [
+            (name, entry) for name, entry in entries if name not in pool["pinned"]
+        ]
+    for name, entry in entries:
+        if entry is not None:
+            _write_back(pool, name, entry)
+
+# Сохраняет таблицу, если она грязная, и убирает её из пула
+def release_table(pool, table_name):
+    """
+    Нужна перед операциями, которые работают с файлами таблицы
+    напрямую (пакетная вставка, смена формата, слияние журнала).
+    """
+    with pool["lock"]:
+        if table_name in pool["pinned"]:
+            return
+        entry = pool["tables"].get(table_name)
+    if entry is not None and _write_back(pool, table_name, entry):
+        _drop_entry(pool, table_name, entry)
+
+# Убирает таблицу из пула без сохранения (например, после удаления таблицы)
+def discard_table(pool, table_name):
+    _drop_entry(pool, table_name)
+
+# Закрепляет таблицу в пуле: до открепления она не сохраняется и не вытесняется
+def pin_table(pool, table_name):
+    with pool["lock"]:
+        pool["pinned"][table_name] = pool["pinned"].get(table_name, 0) + 1
+
+# Снимает закрепление таблицы (см. pin_table)
+def unpin_table(pool, table_name):
+    with pool["lock"]:
+        count = pool["pinned"].get(table_name, 0) - 1
+        if count > 0:
+            pool["pinned"][table_name] = count
+        else:
+            pool["pinned"].pop(table_name, None)
+
+# Изменяет бюджет памяти пула
+def set_budget(pool, max_bytes):
+    with pool["lock"]:
+        pool["max_bytes"] = max_bytes
+    _evict(pool)
+
+# Статистика пула: таблицы, размер и счетчики обращений
+def get_pool_stats(pool):
+    with pool["lock"]:
+        lookups = pool["hits"] + pool["misses"]
+        return {
+            "tables": {
+                name: {"bytes": entry["size"], "dirty": entry["dirty"]}
+                for name, entry in pool["tables"].items()
+            },
+            "bytes": pool["bytes"],
+            "max_bytes": pool["max_bytes"],
+            "hits": pool["hits"],
+            "misses": pool["misses"],
+            "reloads": pool["reloads"],
+            "evictions": pool["evictions"],
+            "writebacks": pool["writebacks"],
+            "hit_ratio": pool["hits"] / lookups if lookups else 0.0,
+        }
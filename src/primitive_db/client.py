@@ -0,0 +1,215 @@
+"""
+Клиент серверного режима (database serve) с пулом соединений.
+
+Пример:
+
+    from primitive_db.client import connect
+
+    with connect("db.sock") as db:
+        db.execute('insert users "John" 28 true')
+        users = db.select("select users WHERE age > 18")
+
+Клиент можно использовать из нескольких потоков: каждый запрос берет
+свободное соединение из пула (или открывает новое, пока соединений
+меньше pool_size) и возвращает его после ответа.
+
+Транзакция принадлежит соединению, поэтому её команды выполняются
+через Client.transaction - на одном соединении:
+
+    with db.transaction() as tx:
+        tx.execute('update accounts SET balance = 70 WHERE ID = 1')
+        tx.execute('update accounts SET balance = 80 WHERE ID = 2')
+"""
+import json
+import socket
+import threading
+from contextlib import contextmanager
+
+from primitive_db.constants import (
+    CLIENT_POOL_SIZE,
+    ENCODING,
+    SERVER_HOST,
+    SERVER_SOCKET,
+)
+
+
+class DatabaseError(Exception):
+    """Команда выполнена сервером с ошибкой"""
+
+    def __init__(self, messages):
+        super().__init__("\n".join(messages) or "ошибка выполнения команды")
+        self.messages = messages
+
+
+class Client:
+    """
+    Пул соединений с сервером. Адрес - Unix-сокет socket_path или,
+    если задан port, TCP-порт на host.
+    """
+
+    def __init__(
+        self,
+        socket_path=None,
+        host=None,
+        port=None,
+        pool_size=CLIENT_POOL_SIZE,
+        timeout=None,
+    ):
+        if port is None:
+            self._address = (socket.AF_UNIX, socket_path or SERVER_SOCKET)
+        else:
+            self._address = (socket.AF_INET, (host or SERVER_HOST, port))
+        self._timeout = timeout
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(pool_size)
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # Открывает новое соединение с сервером
+    def _connect(self):
+        family, address = self._address
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.settimeout(self._timeout)
+        try:
+            sock.connect(address)
+        except OSError:
+            sock.close()
+            raise
+        return sock, sock.makefile("rb")
+
+    # Берет соединение из пула (ждет, если все заняты)
+    def _acquire(self):
+        if self._closed:
+            raise RuntimeError("клиент закрыт")
+        self._slots.acquire()
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        try:
+            return self._connect()
+        except OSError:
+            self._slots.release()
+            raise
+
+    # Возвращает соединение в пул или закрывает его, если оно неисправно
+    def _release(self, connection, broken):
+        with self._lock:
+            if broken or self._closed:
+                _close_connection(connection)
+            else:
+                self._idle.append(connection)
+        self._slots.release()
+
+    # Отправляет команду и читает ответ
+    def _request(self, command):
+        connection = self._acquire()
+        broken = True
+        try:
+            reply = _send(connection, command)
+            broken = False
+            return reply
+        finally:
+            self._release(connection, broken)
+
+    def execute(self, command):
+        """
+        Выполняет команду и возвращает ответ сервера: словарь с ключами
+        ok, messages и records (записи select, для остальных команд пусто).
+        """
+        return self._request(command)
+
+    def select(self, command):
+        """
+        Выполняет select и возвращает список записей.
+        При ошибке выбрасывает DatabaseError.
+        """
+        reply = self._request(command)
+        if not reply["ok"]:
+            raise DatabaseError(reply["messages"])
+        return reply["records"]
+
+    @contextmanager
+    def transaction(self):
+        """
+        Открывает транзакцию на одном соединении пула и возвращает объект
+        с методами execute и select. При выходе из блока транзакция
+        фиксируется, при исключении - откатывается. Если COMMIT
+        не выполнен, выбрасывается DatabaseError.
+        """
+        connection = self._acquire()
+        broken = True
+        try:
+            transaction = Transaction(connection)
+            transaction.execute("BEGIN", check=True)
+            try:
+                yield transaction
+            except BaseException:
+                transaction.execute("ROLLBACK")
+                raise
+            transaction.execute("COMMIT", check=True)
+            broken = False
+        finally:
+            self._release(connection, broken)
+
+    def close(self):
+        """Закрывает все свободные соединения пула"""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            _close_connection(connection)
+
+
+class Transaction:
+    """Команды открытой транзакции (см. Client.transaction)"""
+
+    def __init__(self, connection):
+        self._connection = connection
+
+    def execute(self, command, check=False):
+        """
+        Выполняет команду в транзакции и возвращает ответ сервера.
+        С check=True при ошибке выбрасывает DatabaseError.
+        """
+        reply = _send(self._connection, command)
+        if check and not reply["ok"]:
+            raise DatabaseError(reply["messages"])
+        return reply
+
+    def select(self, command):
+        """Выполняет select в транзакции и возвращает список записей"""
+        return self.execute(command, check=True)["records"]
+
+
+# Отправляет команду по соединению и читает ответ
+def _send(connection, command):
+    if "\n" in command or "\r" in command:
+        raise ValueError("команда должна занимать одну строку")
+
+    sock, stream = connection
+    sock.sendall((command + "\n").encode(ENCODING))
+    records = []
+    for line in stream:
+        reply = json.loads(line)
+        if "record" in reply:
+            records.append(reply["record"])
+            continue
+        reply["records"] = records
+        return reply
+    raise ConnectionError("сервер закрыл соединение")
+
+# Закрывает соединение с сервером
+def _close_connection(connection):
+    sock, stream = connection
+    stream.close()
+    sock.close()
+
+# Создает клиента серверного режима
+def connect(socket_path=None, host=None, port=None, **options):
+    return Client(socket_path, host, port, **options)
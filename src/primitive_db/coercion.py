@@ -0,0 +1,116 @@
+"""
+Приведение значений к типам столбцов по схеме таблицы.
+
+- Значения insert (строки из команды или файла импорта) переводятся
+  функцией, которая собирается один раз для схемы таблицы: для каждого
+  столбца заранее выбран конвертер его типа. Функции кэшируются
+  по схеме, поэтому после изменения схемы собирается новая.
+- Литералы WHERE и SET разбираются без схемы (parser._parse_value
+  угадывает тип по записи), поэтому перед выполнением приводятся
+  к типу столбца: age = '28' по столбцу int ищет число 28, name = 5 -
+  строку "5". Значение, которое нельзя привести к типу столбца,
+  не совпадет ни с одной записью (см. planner.bind_where).
+"""
+from functools import lru_cache
+
+from primitive_db.constants import WHERE_CACHE_SIZE
+from primitive_db.indexes import PRIMARY_KEY
+
+# Строковые записи логических значений
+_BOOL_VALUES = {
+    "true": True,
+    "1": True,
+    "yes": True,
+    "false": False,
+    "0": False,
+    "no": False,
+}
+
+
+# Строка insert -> bool
+def _to_bool(value):
+    try:
+        return _BOOL_VALUES[value.lower()]
+    except KeyError:
+        raise ValueError(value) from None
+
+# Конвертеры строковых значений insert по типам столбцов
+_CONVERTERS = {"int": int, "str": str, "bool": _to_bool}
+
+
+# Собирает функцию перевода значений insert для столбцов схемы
+@lru_cache(maxsize=WHERE_CACHE_SIZE)
+def _compile_row_converter(columns):
+    """
+    columns - кортеж пар (столбец, тип) без ID.
+    """
+    converters = [
+        (name, col_type, _CONVERTERS.get(col_type, str)) for name, col_type in columns
+    ]
+
+    def convert(values):
+        record = {}
+        for (name, col_type, converter), value in zip(converters, values):
+            try:
+                record[name] = converter(value)
+            except ValueError:
+                return None, (
+                    f"Ошибка: Некорректное значение '{value}' "
+                    f"для столбца '{name}' типа '{col_type}'."
+                )
+        return record, None
+
+    return convert
+
+# Возвращает функцию перевода значений insert для схемы без ID
+def row_converter(columns):
+    """
+    columns - {столбец: тип}. Функция принимает список строковых
+    значений в порядке столбцов и возвращает (запись, None) или
+    (None, текст ошибки).
+    """
+    return _compile_row_converter(tuple(columns.items()))
+
+# Приводит литерал условия или SET к типу столбца
+def coerce_literal(value, col_type):
+    """
+    Выбрасывает ValueError, если значение нельзя привести к типу.
+    Логическое значение не считается числом, а число - логическим
+    значением, кроме 1 и 0 (как в insert).
+    """
+    if col_type == "int":
+        if isinstance(value, bool):
+            raise ValueError(value)
+        return value if isinstance(value, int) else int(value)
+    if col_type == "bool":
+        if isinstance(value, bool):
+            return value
+        return _to_bool(str(value))
+    if col_type == "str":
+        if isinstance(value, bool):
+            return "true" if value else "false"
+        return str(value)
+    return value
+
+# Приводит значения SET к типам столбцов
+def coerce_set_clause(schema, set_clause, table_name):
+    """
+    Возвращает (новые значения, None) или (None, текст ошибки):
+    столбца нет в таблице, это ID или значение нельзя привести к типу.
+    """
+    values = {}
+    for column, value in set_clause.items():
+        if column == PRIMARY_KEY:
+            return None, f'Ошибка: Столбец "{PRIMARY_KEY}" изменять нельзя.'
+        if column not in schema:
+            return None, (
+                f'Ошибка: Столбец "{column}" не найден в таблице "{table_name}".'
+            )
+        try:
+            values[column] = coerce_literal(value, schema[column])
+        except ValueError:
+            return None, (
+                f"Ошибка: Некорректное значение '{value}' "
+                f"для столбца '{column}' типа '{schema[column]}'."
+            )
+    return values, None
@@ -0,0 +1,435 @@
+"""
+Бинарный колоночный формат хранения таблиц (файлы data/<таблица>.col).
+
+Структура файла:
+- 12 байт префикса: сигнатура b"PDBC", версия формата, 3 байта
+  выравнивания и длина заголовка (uint32, little-endian);
+- заголовок в JSON: next_id, version, число строк и описание столбцов
+  (имя, тип, смещение и длина секции относительно начала данных);
+- секции столбцов, каждая выровнена по 8 байт:
+  int  - массив int64;
+  bool - биты, по 8 значений в байте (младший бит - первая строка);
+  str  - (rows + 1) смещений uint64 и следом блок UTF-8.
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+from itertools import chain
+
+from primitive_db.constants import ENCODING
+from primitive_db.records import record_factory
+
+MAGIC = b"PDBC"
+FORMAT_VERSION = 1
+_PREFIX = struct.Struct("<4sB3xI")
+_ALIGN = 8
+
+# Значения 8 строк, упакованных в один байт, для каждого возможного байта
+_BYTE_BITS = [tuple(bool(byte >> bit & 1) for bit in range(8)) for byte in range(256)]
+
+
+# Округляет смещение вверх до границы выравнивания
+def _align(offset):
+    return (offset + _ALIGN - 1) // _ALIGN * _ALIGN
+
+# Упаковывает числа в массив int64 (little-endian)
+def _pack_ints(values):
+    packed = array("q", (int(value) for value in values))
+    if sys.byteorder != "little":
+        packed.byteswap()
+    return packed.tobytes()
+
+# Упаковывает булевы значения по 8 в байт
+def _pack_bools(values):
+    for value in values:
+        if value not in (True, False):
+            raise ValueError(f"значение {value!r} не является bool")
+    return bytes(
+        sum(1 << bit for bit, value in enumerate(values[start:start + 8]) if value)
+        for start in range(0, len(values), 8)
+    )
+
+# Упаковывает строки в массив смещений и общий блок байтов
+def _pack_strs(values):
+    encoded = [str(value).encode(ENCODING) for value in values]
+    offsets = [0]
+    for item in encoded:
+        offsets.append(offsets[-1] + len(item))
+    packed = array("Q", offsets)
+    if sys.byteorder != "little":
+        packed.byteswap()
+    return packed.tobytes() + b"".join(encoded)
+
+_PACKERS = {"int": _pack_ints, "bool": _pack_bools, "str": _pack_strs}
+
+
+# Распаковывает массив int64
+def _unpack_ints(section, rows):
+    values = array("q")
+    values.frombytes(section[:rows * 8])
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values.tolist()
+
+# Распаковывает битовый массив bool
+def _unpack_bools(section, rows):
+    return list(chain.from_iterable(_BYTE_BITS[byte] for byte in section))[:rows]
+
+# Распаковывает строки по смещениям
+def _unpack_strs(section, rows):
+    offsets = array("Q")
+    offsets.frombytes(section[:(rows + 1) * 8])
+    if sys.byteorder != "little":
+        offsets.byteswap()
+    blob = section[(rows + 1) * 8:]
+    return [
+        blob[offsets[i]:offsets[i + 1]].decode(ENCODING) for i in range(rows)
+    ]
+
+_UNPACKERS = {"int": _unpack_ints, "bool": _unpack_bools, "str": _unpack_strs}
+
+
+# Записывает таблицу в колоночном формате
+def write_table(filepath, data, columns):
+    """
+    columns - список пар (имя, тип) в порядке ключей записей.
+    Значения приводятся к типу столбца; если это невозможно,
+    выбрасывается ValueError.
+    """
+    records = data.get("records", [])
+    sections = []
+    header_columns = []
+    offset = 0
+    for name, col_type in columns:
+        section = _PACKERS[col_type]([record[name] for record in records])
+        header_columns.append({
+            "name": name,
+            "type": col_type,
+            "offset": offset,
+            "length": len(section),
+        })
+        sections.append(section)
+        offset = _align(offset + len(section))
+
+    header = json.dumps({
+        "next_id": data.get("next_id", 1),
+        "version": data.get("version", 0),
+        "rows": len(records),
+        "columns": header_columns,
+    }, ensure_ascii=False).encode(ENCODING)
+
+    with open(filepath, "wb") as file:
+        file.write(_PREFIX.pack(MAGIC, FORMAT_VERSION, len(header)))
+        file.write(header)
+        file.write(b"\0" * (_align(file.tell()) - file.tell()))
+        for section in sections:
+            file.write(section)
+            file.write(b"\0" * (_align(len(section)) - len(section)))
+
+# Читает заголовок колоночного файла
+def read_header(file):
+    """
+    Принимает открытый в двоичном режиме файл, возвращает заголовок
+    с добавленным полем "data_start" - абсолютным смещением секций.
+    """
+    magic, version, header_length = _PREFIX.unpack(file.read(_PREFIX.size))
+    if magic != MAGIC or version != FORMAT_VERSION:
+        raise ValueError("файл не является таблицей в колоночном формате")
+    header = json.loads(file.read(header_length).decode(ENCODING))
+    header["data_start"] = _align(_PREFIX.size + header_length)
+    return header
+
+# Возвращает схему таблицы [(имя, тип)] из колоночного файла
+def read_schema(filepath):
+    with open(filepath, "rb") as file:
+        header = read_header(file)
+    return [(column["name"], column["type"]) for column in header["columns"]]
+
+# Открывает файл по пути или берет уже открытый (читая его с начала)
+@contextmanager
+def _open_source(source):
+    """
+    source - путь или открытый в двоичном режиме файл. Открытый файл
+    не закрывается: так вызывающая сторона читает один и тот же снимок
+    файла, даже если его заменили переименованием.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as file:
+            yield file
+    else:
+        source.seek(0)
+        yield source
+
+# Загружает таблицу из колоночного файла
+def read_table(source, columns=None):
+    """
+    source - путь или открытый файл (см. _open_source).
+    columns - имена нужных столбцов; ID читается всегда.
+    Секции остальных столбцов не читаются и не декодируются.
+    """
+    with _open_source(source) as file:
+        header = read_header(file)
+        rows = header["rows"]
+        names = []
+        values = []
+        for column in header["columns"]:
+            name = column["name"]
+            if columns is not None and name not in columns and name != "ID":
+                continue
+            file.seek(header["data_start"] + column["offset"])
+            section = file.read(column["length"])
+            names.append(name)
+            values.append(_UNPACKERS[column["type"]](section, rows))
+
+    make = record_factory(names)
+    records = [make(*row) for row in zip(*values)] if names else []
+    return {
+        "next_id": header["next_id"],
+        "version": header["version"],
+        "records": records,
+    }
+
+
+# Открывает столбцы отображенного в память файла без копирования
+def _map_columns(mapped_file, view, header, views):
+    """
+    Возвращает {имя: (тип, данные)}: для int - memoryview int64,
+    для bool - memoryview байтов, для str - (смещения, начало блока
+    в файле, mmap). Все созданные memoryview добавляются в views,
+    чтобы освободить их перед закрытием mmap.
+    """
+    rows = header["rows"]
+    columns = {}
+    for column in header["columns"]:
+        start = header["data_start"] + column["offset"]
+        if column["type"] == "int":
+            section = view[start:start + rows * 8]
+            values = section.cast("q")
+            views.extend((section, values))
+            columns[column["name"]] = ("int", values)
+        elif column["type"] == "bool":
+            section = view[start:start + column["length"]]
+            views.append(section)
+            columns[column["name"]] = ("bool", section)
+        else:
+            section = view[start:start + (rows + 1) * 8]
+            offsets = section.cast("Q")
+            views.extend((section, offsets))
+            blob_start = start + (rows + 1) * 8
+            columns[column["name"]] = ("str", (offsets, blob_start, mapped_file))
+    return columns
+
+# Значение столбца в строке row без декодирования остальных строк
+def _mapped_value(col_type, data, row):
+    if col_type == "int":
+        return data[row]
+    if col_type == "bool":
+        return bool(data[row >> 3] >> (row & 7) & 1)
+    offsets, blob_start, mapped_file = data
+    start = blob_start + offsets[row]
+    return mapped_file[start:blob_start + offsets[row + 1]].decode(ENCODING)
+
+# Номера строк, где столбец равен value (полный проход по столбцу)
+def _mapped_equal_rows(col_type, data, value, rows):
+    if col_type == "int":
+        if isinstance(value, str):
+            return []
+        return [row for row, item in enumerate(data) if item == value]
+
+    if col_type == "bool":
+        if value not in (True, False):
+            return []
+        target = bool(value)
+        bits = chain.from_iterable(_BYTE_BITS[byte] for byte in data)
+        return [row for row, bit in zip(range(rows), bits) if bit is target]
+
+    if not isinstance(value, str):
+        return []
+    offsets, blob_start, mapped_file = data
+    target = value.encode(ENCODING)
+    if not target:
+        return [row for row in range(rows) if offsets[row] == offsets[row + 1]]
+
+    # Ищем байты значения прямо в mmap и проверяем, что вхождение - целая строка
+    matched = []
+    blob_end = blob_start + offsets[rows]
+    position = mapped_file.find(target, blob_start, blob_end)
+    while position != -1:
+        relative = position - blob_start
+        row = bisect_right(offsets, relative) - 1
+        if offsets[row] == relative and offsets[row + 1] == relative + len(target):
+            matched.append(row)
+        position = mapped_file.find(target, position + 1, blob_end)
+    return matched
+
+# Номер строки с заданным ID (строки упорядочены по ID) или None
+def _mapped_row_by_id(ids, record_id):
+    if isinstance(record_id, str):
+        return None
+    row = bisect_left(ids, record_id)
+    if row < len(ids) and ids[row] == record_id:
+        return row
+    return None
+
+# Строки диапазона ID (строки упорядочены по ID)
+def _mapped_id_range(ids, bounds):
+    low, low_inclusive, high, high_inclusive = bounds
+    if isinstance(low, str) or isinstance(high, str):
+        return []
+    start = 0
+    end = len(ids)
+    if low is not None:
+        start = (bisect_left if low_inclusive else bisect_right)(ids, low)
+    if high is not None:
+        end = (bisect_right if high_inclusive else bisect_left)(ids, high)
+    return range(start, end)
+
+
+class _MappedRow:
+    """
+    Строка отображенного файла в виде словаря только для чтения:
+    значения столбцов декодируются при обращении к ним.
+    """
+    __slots__ = ("_columns", "_row")
+
+    def __init__(self, columns, row):
+        self._columns = columns
+        self._row = row
+
+    def __contains__(self, name):
+        return name in self._columns
+
+    def __getitem__(self, name):
+        return _mapped_value(*self._columns[name], self._row)
+
+    def get(self, name, default=None):
+        if name not in self._columns:
+            return default
+        return self[name]
+
+
+# Номера строк-кандидатов для условия: по ID, по равенству или все
+def _mapped_candidate_rows(columns, where, rows):
+    ids = columns["ID"][1]
+    if "ID" in where.equalities:
+        row = _mapped_row_by_id(ids, where.equalities["ID"])
+        return [] if row is None else [row]
+    if "ID" in where.in_lists:
+        found = (_mapped_row_by_id(ids, value) for value in where.in_lists["ID"])
+        return sorted({row for row in found if row is not None})
+    if "ID" in where.ranges:
+        return _mapped_id_range(ids, where.ranges["ID"])
+    if where.equalities:
+        name, value = next(iter(where.equalities.items()))
+        if name not in columns:
+            return []
+        return _mapped_equal_rows(*columns[name], value, rows)
+    return range(rows)
+
+# Описывает, какие строки колоночного файла проверит условие (для EXPLAIN)
+def describe_candidate_rows(where):
+    """
+    Повторяет выбор _mapped_candidate_rows, не открывая файл.
+    """
+    if "ID" in where.equalities:
+        return "одна строка по ID (двоичный поиск)"
+    if "ID" in where.in_lists:
+        return "строки по списку ID (двоичный поиск)"
+    if "ID" in where.ranges:
+        return "диапазон строк по ID (двоичный поиск)"
+    if where.equalities:
+        name = next(iter(where.equalities))
+        return f'строки с подходящим значением столбца "{name}" (сравнение в буфере)'
+    return "полный просмотр"
+
+# Отображает колоночный файл в память на время блока with
+@contextmanager
+def _mapped_table(source):
+    """
+    source - путь или открытый файл (см. _open_source).
+    Возвращает (заголовок, столбцы из _map_columns); для пустой таблицы
+    столбцы - None. После выхода из блока все memoryview освобождаются
+    и mmap закрывается.
+    """
+    with _open_source(source) as file:
+        header = read_header(file)
+        if header["rows"] == 0:
+            yield header, None
+            return
+        mapped_file = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    views = []
+    view = memoryview(mapped_file)
+    try:
+        yield header, _map_columns(mapped_file, view, header, views)
+    finally:
+        for item in reversed(views):
+            item.release()
+        view.release()
+        mapped_file.close()
+
+# Создает запись (словарь) для строки отображенного файла
+def _materialize(columns, names, row):
+    return {name: _mapped_value(*columns[name], row) for name in names}
+
+# Выборка из колоночного файла через mmap
+def iter_scan_table(source, where, skip_ids=(), start=0, stop=None, fields=None):
+    """
+    source - путь или открытый файл (см. _open_source).
+    where - скомпилированное условие (planner.Where).
+    Генератор: отображает файл в память и проверяет условие прямо
+    по буферу. Строки-кандидаты отбираются по ID или равенству, остальные
+    части условия читают только свои столбцы, а записи создаются только
+    для подходящих строк - по одной, в порядке ID. Если перебор прервать,
+    файл закрывается сразу.
+    Строки с ID из skip_ids пропускаются - их вызывающая сторона
+    проверяет сама (например, после применения журнала).
+    start и stop ограничивают просмотр строками с номерами [start, stop)
+    (для параллельного просмотра по частям).
+    fields - столбцы записей (None - все): остальные столбцы подходящих
+    строк не декодируются.
+    """
+    with _mapped_table(source) as (header, columns):
+        if columns is None:
+            return
+        ids = columns["ID"][1]
+        skip_ids = set(skip_ids)
+        if fields is None:
+            names = [column["name"] for column in header["columns"]]
+        else:
+            names = list(fields)
+        predicate = where.predicate
+        rows = _mapped_candidate_rows(columns, where, header["rows"])
+        if start or stop is not None:
+            stop = header["rows"] if stop is None else stop
+            if isinstance(rows, range):
+                rows = range(max(rows.start, start), min(rows.stop, stop))
+            else:
+                rows = [row for row in rows if start <= row < stop]
+        for row in rows:
+            if ids[row] not in skip_ids and predicate(_MappedRow(columns, row)):
+                yield _materialize(columns, names, row)
+
+# Читает записи с заданными ID из колоночного файла через mmap
+def read_rows_by_id(source, record_ids):
+    """
+    source - путь или открытый файл (см. _open_source).
+    Возвращает (записи в порядке ID, заголовок файла).
+    ID, которых в файле нет, пропускаются.
+    """
+    with _mapped_table(source) as (header, columns):
+        if columns is None:
+            return [], header
+        ids = columns["ID"][1]
+        names = [column["name"] for column in header["columns"]]
+        records = []
+        for record_id in sorted(record_ids):
+            row = _mapped_row_by_id(ids, record_id)
+            if row is not None:
+                records.append(_materialize(columns, names, row))
+        return records, header
@@ -12,4 +12,127 @@ META_FILE = "db_meta.json"
 DATA_DIR = "data"
 
 # Кодировка файлов
-ENCODING = "utf-8"
\ No newline at end of file
+ENCODING = "utf-8"
+
+# Расширение журнала изменений таблицы (append-only log)
+LOG_EXTENSION = ".log"
+
+# Размер журнала (в байтах), после которого он сливается с основным файлом
+LOG_COMPACT_SIZE = 1024 * 1024
+
+# Таблицы в формате JSON хранятся сегментами: каталог сегментов таблицы
+# (рядом с её основным файлом-манифестом) и число записей в сегменте
+SEGMENTS_EXTENSION = ".segments"
+SEGMENT_ROWS = 10_000
+
+# Доля удаленных записей сегмента, при которой он переписывается
+# при сохранении таблицы, не дожидаясь команды vacuum
+VACUUM_DEAD_RATIO = 0.3
+
+# Сколько записей delete удаляет из списка таблицы на месте; если
+# записей больше, список собирается заново за один проход
+DELETE_IN_PLACE_MAX = 32
+
+# Служебный ключ метаданных с настройками таблиц (индексы и т.п.)
+OPTIONS_KEY = "__options__"
+
+# Поддерживаемые виды индексов
+INDEX_KINDS = {"hash", "sorted"}
+
+# Лимиты кэша select: число результатов и их суммарный размер в байтах
+SELECT_CACHE_SIZE = 128
+SELECT_CACHE_BYTES = 64 * 1024 * 1024
+
+# Форматы хранения таблиц: JSON-файл или бинарный колоночный файл
+TABLE_FORMATS = {"json", "columnar"}
+
+# Расширение файла таблицы в колоночном формате
+COLUMNAR_EXTENSION = ".col"
+
+# Запись JSON: compact - без отступов и пробелов, pretty - с отступами
+# (удобно читать файлы глазами)
+JSON_STYLES = {"compact", "pretty"}
+JSON_STYLE = "compact"
+
+# Библиотека JSON: orjson (если установлена) или стандартный json;
+# auto - orjson, когда она есть
+JSON_BACKENDS = {"auto", "orjson", "json"}
+JSON_BACKEND = "auto"
+
+# Сжатие сегментов таблиц в формате JSON (для редко изменяемых таблиц)
+COMPRESSION_METHODS = {"none", "gzip", "zstd"}
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+# Движки выполнения условий WHERE: перебор записей или векторно на NumPy
+EXECUTION_ENGINES = {"python", "numpy"}
+EXECUTION_ENGINE = "python"
+
+# Минимальное число записей, с которого имеет смысл векторное выполнение
+VECTORIZE_MIN_ROWS = 10_000
+
+# Число скомпилированных условий WHERE, которые хранятся в кэше
+WHERE_CACHE_SIZE = 256
+
+# Форматы файлов для пакетной вставки (insert_many) по расширению
+IMPORT_FORMATS = {".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl"}
+
+# Число строк, которые insert_many записывает на диск за один раз
+INSERT_BATCH_SIZE = 10_000
+
+# Сколько ошибок в строках импорта выводить подробно
+IMPORT_ERROR_LIMIT = 10
+
+# Агрегатные функции select (COUNT, SUM, MIN, MAX, AVG)
+AGGREGATE_FUNCTIONS = {"count", "sum", "min", "max", "avg"}
+
+# Агрегаты, которые применимы только к числовым столбцам
+NUMERIC_AGGREGATES = {"sum", "avg"}
+
+# Форматы вывода select: таблица PrettyTable или построчно TSV / JSON Lines
+OUTPUT_FORMATS = {"table", "tsv", "jsonl"}
+
+# Сколько строк select еще выводит таблицей PrettyTable (больше - построчно TSV)
+PRETTY_TABLE_MAX_ROWS = 1000
+
+# Сбор метрик производительности (задержки операций и счетчики)
+METRICS_ENABLED = True
+
+# Хранить записи загруженных таблиц в компактном виде (словари с общими
+# для таблицы ключами, см. модуль records)
+COMPACT_RECORDS = True
+
+# Бюджет памяти пула буферов (таблиц, которые держатся в памяти между командами)
+BUFFER_POOL_BYTES = 256 * 1024 * 1024
+
+# Сколько раз читатель перечитывает снимок таблицы, которую в это время
+# переписывает другой процесс, прежде чем подождать его блокировку
+SNAPSHOT_RETRIES = 5
+
+# Серверный режим: сокет по умолчанию и адрес для TCP (только локальный)
+SERVER_SOCKET = "db.sock"
+SERVER_HOST = "127.0.0.1"
+
+# Число потоков сервера, в которых выполняются команды клиентов
+SERVER_WORKERS = 8
+
+# Максимальная длина строки команды, которую принимает сервер
+SERVER_LINE_LIMIT = 16 * 1024 * 1024
+
+# Число соединений в пуле клиента серверного режима
+CLIENT_POOL_SIZE = 4
+
+# Параллельный просмотр таблиц в нескольких процессах: число процессов
+# (1 - без параллельности) и размер таблицы, с которого он включается
+PARALLEL_WORKERS = 1
+PARALLEL_MIN_ROWS = 200_000
+
+# На сколько частей на процесс делится таблица при параллельном просмотре
+PARALLEL_CHUNKS_PER_WORKER = 4
+
+# Журнал транзакций: зафиксированные, но еще не перенесенные в журналы
+# таблиц изменения (в каталоге данных)
+TRANSACTION_JOURNAL = "transactions.journal"
+
+# Сколько секунд транзакция ждет блокировку таблицы, занятой другими
+TRANSACTION_LOCK_TIMEOUT = 10
@@ -1,18 +1,74 @@
-from primitive_db.constants import VALID_TYPES
+import heapq
+import time
+from bisect import bisect_left
+from itertools import islice
+from operator import itemgetter
+
+from primitive_db import metrics, parallel, vectorized
+from primitive_db.aggregates import aggregate, aggregate_label, is_count_only
+from primitive_db.coercion import row_converter
+from primitive_db.constants import (
+    DELETE_IN_PLACE_MAX,
+    EXECUTION_ENGINE,
+    EXECUTION_ENGINES,
+    IMPORT_ERROR_LIMIT,
+    INDEX_KINDS,
+    INSERT_BATCH_SIZE,
+    OPTIONS_KEY,
+    SELECT_CACHE_BYTES,
+    SELECT_CACHE_SIZE,
+    TABLE_FORMATS,
+    VALID_TYPES,
+    VECTORIZE_MIN_ROWS,
+)
 from primitive_db.decorators import confirm_action, handle_db_errors, log_time
-from primitive_db.utils import create_cacher, load_table_data, save_table_data
+from primitive_db.indexes import (
+    PRIMARY_KEY,
+    add_to_indexes,
+    choose_access_path,
+    count_by_index,
+    find_candidates,
+    iter_in_order,
+    remove_from_indexes,
+    update_in_indexes,
+)
+from primitive_db.planner import compile_where
+from primitive_db.records import compact_record
+from primitive_db.utils import (
+    append_table_log,
+    convert_table_format,
+    create_cacher,
+    get_index_definitions,
+    get_mapped_table_version,
+    get_table_format,
+    get_table_options,
+    init_table_storage,
+    iter_import_rows,
+    load_table_data,
+    save_table_data,
+    scan_table_data,
+    table_exists,
+    table_lock,
+)
 
 # Создаем глобальный кэшер для функции select
-_select_cache = create_cacher()
+_select_cache = create_cacher(SELECT_CACHE_SIZE, SELECT_CACHE_BYTES)
+
+# Текущий движок выполнения условий WHERE
+_execution = {"engine": EXECUTION_ENGINE}
 
 
 # Создание таблицы с указанными столбцами
 @handle_db_errors
-def create_table(metadata, table_name, columns):
+def create_table(metadata, table_name, columns, table_format="json"):
     if table_name in metadata:
         print(f'Ошибка: Таблица "{table_name}" уже существует.')
         return metadata
 
+    if table_name.startswith("__"):
+        print(f'Ошибка: Имя таблицы "{table_name}" зарезервировано.')
+        return metadata
+
     table_structure = {"ID": "int"}
 
     for col in columns:
@@ -22,6 +78,12 @@ def create_table(metadata, table_name, columns):
             return metadata
         table_structure[name] = col_type
 
+    if table_format not in TABLE_FORMATS:
+        print(f"Некорректный формат хранения: {table_format}. "
+              f"Доступны: json, columnar.")
+        return metadata
+
+    init_table_storage(table_name, table_structure, table_format)
     metadata[table_name] = table_structure
     print(f'Таблица "{table_name}" успешно создана со столбцами: '
           f'{", ".join([f"{k}:{v}" for k, v in table_structure.items()])}')
@@ -31,38 +93,299 @@ def create_table(metadata, table_name, columns):
 @confirm_action("удаление таблицы")
 @handle_db_errors
 def drop_table(metadata, table_name):
-    if table_name not in metadata:
+    if not table_exists(metadata, table_name):
         print(f'Ошибка: Таблица "{table_name}" не существует.')
         return metadata
 
     del metadata[table_name]
+    metadata.get(OPTIONS_KEY, {}).pop(table_name, None)
     print(f'Таблица "{table_name}" успешно удалена.')
     return metadata
 
-# Валидация и преобразование значения в соответствии с типом
-def _validate_and_convert(value, expected_type):
-    if expected_type == "int":
-        try:
-            return int(value)
-        except ValueError:
-            return None
-    elif expected_type == "str":
-        return str(value)
-    elif expected_type == "bool":
-        if value.lower() in ("true", "1", "yes"):
-            return True
-        elif value.lower() in ("false", "0", "no"):
-            return False
+# Перевод таблицы в другой формат хранения
+@handle_db_errors
+def convert_table(metadata, table_name, table_format):
+    if not table_exists(metadata, table_name):
+        print(f'Ошибка: Таблица "{table_name}" не существует.')
+        return
+
+    if table_format not in TABLE_FORMATS:
+        print(f"Некорректный формат хранения: {table_format}. "
+              f"Доступны: json, columnar.")
+        return
+
+    if get_table_format(table_name) == table_format:
+        print(f'Таблица "{table_name}" уже хранится в формате {table_format}.')
+        return
+
+    convert_table_format(table_name, metadata[table_name], table_format)
+    print(f'Таблица "{table_name}" переведена в формат {table_format}.')
+
+# Создание индекса по столбцу таблицы
+@handle_db_errors
+def create_index(metadata, table_name, column, kind="hash"):
+    if not table_exists(metadata, table_name):
+        print(f'Ошибка: Таблица "{table_name}" не существует.')
+        return metadata
+
+    if column not in metadata[table_name]:
+        print(f'Ошибка: Столбец "{column}" не найден в таблице "{table_name}".')
+        return metadata
+
+    if kind not in INDEX_KINDS:
+        print(f"Некорректный вид индекса: {kind}. Доступны: hash, sorted.")
+        return metadata
+
+    if column == PRIMARY_KEY:
+        print(f'Столбец "{PRIMARY_KEY}" индексируется автоматически.')
+        return metadata
+
+    indexes = get_table_options(metadata, table_name).setdefault("indexes", {})
+    if column in indexes:
+        print(f'Ошибка: Индекс по столбцу "{column}" уже существует.')
+        return metadata
+
+    indexes[column] = kind
+    print(f'Индекс ({kind}) по столбцу "{column}" таблицы "{table_name}" создан.')
+    return metadata
+
+# Удаление индекса по столбцу таблицы
+@handle_db_errors
+def drop_index(metadata, table_name, column):
+    if not table_exists(metadata, table_name):
+        print(f'Ошибка: Таблица "{table_name}" не существует.')
+        return metadata
+
+    indexes = get_index_definitions(metadata, table_name)
+    if column not in indexes:
+        print(f'Ошибка: Индекса по столбцу "{column}" нет.')
+        return metadata
+
+    del indexes[column]
+    print(f'Индекс по столбцу "{column}" таблицы "{table_name}" удален.')
+    return metadata
+
+# Проверяет, стоит ли выполнять условие векторно на NumPy
+def _use_vectorized(table_data):
+    return (
+        _execution["engine"] == "numpy"
+        and len(table_data.get("records", [])) >= VECTORIZE_MIN_ROWS
+    )
+
+# Находит записи, подходящие под скомпилированное условие
+def _find_matches(table_data, where):
+    """
+    Сначала пробует индекс, затем векторное выполнение (если включено),
+    затем параллельный просмотр в нескольких процессах (если включен
+    и таблица достаточно большая), иначе перебирает все записи.
+    Возвращает (записи, номера строк), номера строк есть только при
+    векторном выполнении.
+    """
+    candidates = find_candidates(table_data, where)
+    if candidates is None and _use_vectorized(table_data):
+        positions = vectorized.match_positions(table_data, where)
+        if positions is not None:
+            metrics.increment("rows_scanned", len(table_data["records"]))
+            return vectorized.take_records(table_data, positions), positions
+    if candidates is None:
+        candidates = table_data.get("records", [])
+        if parallel.use_parallel(len(candidates)):
+            positions = parallel.match_positions(candidates, where)
+            if positions is not None:
+                metrics.increment("rows_scanned", len(candidates))
+                return [candidates[position] for position in positions], None
+    metrics.increment("rows_scanned", len(candidates))
+    predicate = where.predicate
+    return [record for record in candidates if predicate(record)], None
+
+# Названия видов поиска по индексу для EXPLAIN
+_ACCESS_KINDS = {"eq": "равенство", "in": "список IN", "range": "диапазон"}
+
+# Описывает, как select найдет записи в таблице в памяти (для EXPLAIN)
+def describe_access_path(table_data, where, lazy=False):
+    """
+    Повторяет выбор _find_matches, но полностью условие не проверяет:
+    для индекса отбираются только кандидаты. lazy=True - выборка через
+    _iter_matches (страница или построчный вывод), она не параллелится.
+    Возвращает строку.
+    """
+    rows = len(table_data.get("records", []))
+    if where.ast is None:
+        return f"все записи без проверки условия ({rows} строк)"
+    if where.unsatisfiable:
+        return "условие невыполнимо по схеме таблицы, записи не просматриваются"
+    path = choose_access_path(table_data, where)
+    if path is not None:
+        candidates = find_candidates(table_data, where)
+        if candidates is not None:
+            kind, column = path
+            return (
+                f'индекс по столбцу "{column}" ({_ACCESS_KINDS[kind]}): '
+                f"кандидатов {len(candidates)} из {rows}, затем проверка условия"
+            )
+    if _use_vectorized(table_data):
+        return f"векторный просмотр {rows} строк (NumPy)"
+    if not lazy and parallel.use_parallel(rows):
+        workers = parallel.get_parallelism()["workers"]
+        return f"параллельный просмотр {rows} строк в {workers} процессах"
+    return f"полный просмотр {rows} строк"
+
+# Перебирает записи, подходящие под скомпилированное условие, по одной
+def _iter_matches(table_data, where):
+    """
+    Ленивый вариант _find_matches: условие проверяется по мере перебора,
+    поэтому выборку можно прервать, как только набрано нужное число записей.
+    """
+    records = table_data.get("records", [])
+    if where.ast is None:
+        return iter(records)
+    candidates = find_candidates(table_data, where)
+    if candidates is None and _use_vectorized(table_data):
+        positions = vectorized.match_positions(table_data, where)
+        if positions is not None:
+            metrics.increment("rows_scanned", len(records))
+            return iter(vectorized.take_records(table_data, positions))
+    if candidates is None:
+        candidates = records
+    # Считаем только просмотренные строки: перебор может прерваться на LIMIT
+    return filter(where.predicate, metrics.count_rows("rows_scanned", candidates))
+
+# Ключ кэша select: таблица, версия, условие и (для агрегатов) список столбцов
+def _cache_key(table_name, version, where, columns=None, group_by=None):
+    if columns is None:
+        return (table_name, version, where.key)
+    return (table_name, version, where.key, tuple(columns), group_by)
+
+# Перебирает подходящие записи в порядке столбца order_by
+def _iter_ordered(table_data, where, order_by, limit=None, offset=0):
+    """
+    Если условие не сужается индексом, а у столбца есть сортированный
+    индекс (или это ID), записи перебираются в порядке индекса и сразу
+    проверяются условием: страница набирается без сортировки. Иначе
+    подходящие записи сортируются (см. _sort_records).
+    """
+    column, descending = order_by
+    if choose_access_path(table_data, where) is None:
+        ordered = iter_in_order(table_data, column, descending)
+        if ordered is not None:
+            if where.ast is None:
+                return ordered
+            scanned = metrics.count_rows("rows_scanned", ordered)
+            return filter(where.predicate, scanned)
+    return _sort_records(_iter_matches(table_data, where), order_by, limit, offset)
+
+# Сортирует записи по столбцу, для страницы - только первые offset + limit
+def _sort_records(records, order_by, limit=None, offset=0):
+    """
+    Для страницы записи отбираются кучей (heapq) из offset + limit
+    элементов, так что память не зависит от размера выборки. Записи
+    с равными значениями остаются в порядке ID. Значения столбца
+    сравниваются напрямую: по схеме они одного типа.
+    """
+    column, descending = order_by
+    key = itemgetter(column)
+    with metrics.stage("сортировка") as current:
+        if limit is None:
+            records = sorted(records, key=key, reverse=descending)
         else:
-            return None
-    return None
+            select_top = heapq.nlargest if descending else heapq.nsmallest
+            records = select_top(offset + limit, records, key=key)
+        current.set_rows(len(records))
+    return records
+
+# Описывает, как select упорядочит записи (для EXPLAIN)
+def describe_order(table_data, where_clause, order_by, limit=None, offset=0):
+    """
+    table_data - данные таблицы в памяти или None для колоночного файла,
+    который читается через mmap. Возвращает строку.
+    """
+    column, descending = order_by
+    order = f"{column} {'по убыванию' if descending else 'по возрастанию'}"
+    if table_data is None:
+        if order_by == (PRIMARY_KEY, False):
+            return f"{order}: порядок записей файла, без сортировки"
+    elif (
+        choose_access_path(table_data, compile_where(where_clause)) is None
+        and iter_in_order(table_data, column, descending) is not None
+    ):
+        source = "порядок записей" if column == PRIMARY_KEY else "сортированный индекс"
+        return f"{order}: {source}, без сортировки"
+    if limit is None:
+        return f"{order}: сортировка всей выборки"
+    return f"{order}: отбор первых {offset + limit} записей кучей"
+
+# Оставляет в записях только столбцы fields (None - записи как есть)
+def _project(records, fields):
+    if fields is None:
+        return records
+    return ({name: record[name] for name in fields} for record in records)
+
+# Столбцы, которые нужно прочитать из колоночного файла
+def _read_fields(fields, *extra):
+    """
+    fields - столбцы результата (None - все), extra - столбцы, нужные
+    для сортировки или агрегатов. ID читается всегда: по нему записи
+    файла сливаются с журналом.
+    """
+    if fields is None:
+        return None
+    names = [*fields, *extra, PRIMARY_KEY]
+    return list(dict.fromkeys(name for name in names if name is not None))
+
+# Учитывает строки результата select в метриках
+def _returned(records):
+    metrics.increment("rows_returned", len(records))
+    return records
+
+# Отбирает из итератора записей страницу OFFSET/LIMIT
+def _page(records, limit=None, offset=0):
+    return islice(records, offset, None if limit is None else offset + limit)
+
+# Выбор движка выполнения условий WHERE
+def set_execution_engine(engine_name):
+    if engine_name not in EXECUTION_ENGINES:
+        print(f"Некорректный движок: {engine_name}. Доступны: python, numpy.")
+        return
+    if engine_name == "numpy" and not vectorized.is_available():
+        print("Ошибка: для движка numpy нужно установить пакет numpy.")
+        return
+    _execution["engine"] = engine_name
+    print(f"Условия WHERE выполняются движком {engine_name}.")
+
+# Настройка параллельного просмотра больших таблиц
+def set_parallel_workers(workers, min_rows=None):
+    """
+    workers - число процессов (1 - выключить, 0 - по числу ядер),
+    min_rows - размер таблицы, с которого просмотр идет параллельно.
+    """
+    try:
+        settings = parallel.set_parallelism(workers, min_rows)
+    except ValueError as e:
+        print(f"Ошибка: {e}.")
+        return
+    if settings["workers"] > 1:
+        print(
+            f"Таблицы от {settings['min_rows']} строк просматриваются "
+            f"параллельно в {settings['workers']} процессах."
+        )
+    else:
+        print("Параллельный просмотр таблиц выключен.")
+
+# Увеличивает версию таблицы при каждой записи (используется кэшем select)
+def _bump_version(table_data):
+    table_data["version"] = table_data.get("version", 0) + 1
+    return table_data["version"]
 
 # Добавление новой записи в таблицу
 @handle_db_errors
 @log_time
-def insert(metadata, table_name, values):
+def insert(metadata, table_name, values, table_data=None):
+    """
+    table_data - уже загруженные и актуальные данные таблицы (иначе
+    читается только next_id). Запись сразу дописывается в журнал таблицы.
+    """
     # Проверка существования таблицы
-    if table_name not in metadata:
+    if not table_exists(metadata, table_name):
         print(f'Ошибка: Таблица "{table_name}" не существует.')
         return
 
@@ -77,122 +400,429 @@ def insert(metadata, table_name, values):
         print(f"Столбцы: {', '.join(columns.keys())}")
         return
 
-    # Валидация типов данных
-    record = {}
-    for (col_name, col_type), value in zip(columns.items(), values):
-        converted_value = _validate_and_convert(value, col_type)
-        if converted_value is None and col_type != "str":
-            print(
-                f"Ошибка: Некорректное значение '{value}' "
-                f"для столбца '{col_name}' типа '{col_type}'."
-            )
-            return
-        record[col_name] = converted_value
+    # Валидация типов данных (функция перевода собирается один раз для схемы)
+    record, error = row_converter(columns)(values)
+    if error:
+        print(error)
+        return
 
-    # Загружаем текущие данные таблицы
-    table_data = load_table_data(table_name)
+    # ID выдается под блокировкой, чтобы два процесса не выдали один и тот же
+    with table_lock(table_name):
+        # Данные вызывающей стороны полные, ими можно слить журнал
+        full_data = table_data
+        if table_data is None:
+            # Для вставки нужен только next_id, поэтому столбцы данных не читаем
+            table_data = load_table_data(table_name, columns=[])
+
+        # Генерируем новый ID
+        new_id = table_data["next_id"]
+        record["ID"] = new_id
+        record = compact_record(record)
+
+        # Добавляем запись
+        table_data["records"].append(record)
+        table_data["next_id"] += 1
+        add_to_indexes(table_data, record)
+        version = _bump_version(table_data)
+
+        # Дописываем запись в журнал вместо перезаписи всего файла
+        # (если данные загружены не полностью, слияние загрузит их само)
+        append_table_log(
+            table_name,
+            [{"op": "insert", "record": record, "version": version}],
+            full_data,
+        )
 
-    # Генерируем новый ID
-    new_id = table_data["next_id"]
-    record["ID"] = new_id
+    print(f'Запись успешно добавлена в таблицу "{table_name}" с ID={new_id}.')
+    return table_data
 
-    # Добавляем запись
-    table_data["records"].append(record)
-    table_data["next_id"] += 1
+# Записывает пачку новых записей: ID выдаются блоком, в журнал - одна запись
+def _commit_insert_batch(table_name, table_data, batch):
+    first_id = table_data["next_id"]
+    version = _bump_version(table_data)
+    entries = []
+    for offset, record in enumerate(batch):
+        record["ID"] = first_id + offset
+        batch[offset] = record = compact_record(record)
+        entries.append({"op": "insert", "record": record, "version": version})
+
+    table_data["next_id"] = first_id + len(batch)
+    table_data["records"].extend(batch)
+    append_table_log(table_name, entries, durable=True, compact=False)
+
+# Пакетная вставка записей из файла CSV или JSON Lines
+@handle_db_errors
+@log_time
+def insert_many(metadata, table_name, filepath, batch_size=INSERT_BATCH_SIZE):
+    """
+    Файл читается потоком, каждая строка проверяется так же, как в insert.
+    Строки накапливаются в пачки по batch_size и записываются в журнал
+    одной синхронной записью на пачку. После загрузки журнал один раз
+    сливается с основным файлом. Строки с ошибками пропускаются.
+    """
+    if not table_exists(metadata, table_name):
+        print(f'Ошибка: Таблица "{table_name}" не существует.')
+        return
 
-    # Сохраняем обновленные данные
-    save_table_data(table_name, table_data)
+    if batch_size < 1:
+        print("Ошибка: размер пачки должен быть положительным.")
+        return
 
-    print(f'Запись успешно добавлена в таблицу "{table_name}" с ID={new_id}.')
+    schema = metadata[table_name]
+    columns = {k: v for k, v in schema.items() if k != "ID"}
+
+    # Таблица заблокирована на всю загрузку: ID выдаются блоками из next_id
+    with table_lock(table_name):
+        return _insert_rows(table_name, columns, filepath, batch_size)
+
+# Загружает строки файла в таблицу (вызывается под блокировкой таблицы)
+def _insert_rows(table_name, columns, filepath, batch_size):
+    table_data = load_table_data(table_name)
+    convert_row = row_converter(columns)
+    batch = []
+    inserted = 0
+    errors = 0
+    start_time = time.monotonic()
+
+    for line_number, row in iter_import_rows(filepath):
+        error = None
+        if not isinstance(row, dict):
+            error = "строку не удалось разобрать"
+        elif any(row.get(name) is None for name in columns):
+            missing = [name for name in columns if row.get(name) is None]
+            error = f"нет значений для столбцов: {', '.join(missing)}"
+        else:
+            values = [
+                row[name] if isinstance(row[name], str) else str(row[name])
+                for name in columns
+            ]
+            record, error = convert_row(values)
+
+        if error:
+            errors += 1
+            if errors <= IMPORT_ERROR_LIMIT:
+                print(f"Строка {line_number} пропущена: {error}")
+            continue
+
+        batch.append(record)
+        if len(batch) >= batch_size:
+            _commit_insert_batch(table_name, table_data, batch)
+            inserted += len(batch)
+            batch = []
+            elapsed = max(time.monotonic() - start_time, 1e-9)
+            print(f"Загружено {inserted} строк ({inserted / elapsed:.0f} строк/с)")
+
+    if batch:
+        _commit_insert_batch(table_name, table_data, batch)
+        inserted += len(batch)
+
+    # Журнал загрузки сливаем с основным файлом один раз
+    if inserted:
+        save_table_data(table_name, table_data)
+
+    elapsed = max(time.monotonic() - start_time, 1e-9)
+    rate = inserted / elapsed
+    if errors > IMPORT_ERROR_LIMIT:
+        print(f"... и еще {errors - IMPORT_ERROR_LIMIT} строк с ошибками.")
+    print(
+        f'В таблицу "{table_name}" добавлено записей: {inserted}, '
+        f"пропущено: {errors} ({rate:.0f} строк/с)."
+    )
     return table_data
 
 # Выборка записей из таблицы с опциональной фильтрацией
 @handle_db_errors
 @log_time
-def select(table_data, where_clause=None):
-    import json
-
-    # Создаем уникальный ключ для кэша на основе данных и условия
-    # Используем JSON сериализацию для создания уникального ключа
-    cache_key = json.dumps({
-        "records_hash": hash(json.dumps(table_data.get("records", []), sort_keys=True)),
-        "where_clause": where_clause
-    }, sort_keys=True)
+def select(
+    table_data,
+    where_clause=None,
+    table_name=None,
+    limit=None,
+    offset=0,
+    order_by=None,
+    fields=None,
+):
+    """
+    where_clause - дерево разбора из parse_where_clause, скомпилированное
+    условие или словарь равенств {поле: значение}.
+    Результаты кэшируются по ключу (таблица, версия, условие), поэтому
+    кэш работает, только если передано имя таблицы.
+    Если заданы limit или offset, возвращается только эта страница:
+    перебор останавливается, как только она набрана, и в кэш не попадает.
+    order_by - (столбец, по убыванию): упорядоченная выборка (см.
+    iter_select), она тоже не кэшируется.
+    fields - столбцы результата (None - все). В кэше хранятся полные
+    записи, проекция строится из них.
+    """
+    where = compile_where(where_clause)
+
+    if limit is not None or offset or order_by is not None:
+        return list(iter_select(table_data, where, limit, offset, order_by, fields))
+
+    # Без фильтра возвращаем все записи - кэшировать нечего
+    if where.ast is None:
+        records = table_data.get("records", [])
+        if fields is not None:
+            records = list(_project(records, fields))
+        return _returned(records)
 
     # Определяем функцию для получения результата (вызывается только при промахе кэша)
     def compute_result():
-        records = table_data.get("records", [])
+        # Фильтруем записи по условию where_clause (по индексу, если есть)
+        with metrics.stage("фильтрация") as current:
+            records, _ = _find_matches(table_data, where)
+            current.set_rows(len(records))
+        return records
+
+    if table_name is None:
+        records = compute_result()
+    else:
+        # Версия меняется при каждой записи, так что старые результаты не вернутся
+        cache_key = _cache_key(table_name, table_data.get("version", 0), where)
+        records = _select_cache(cache_key, compute_result)
+    if fields is not None:
+        records = list(_project(records, fields))
+    return _returned(records)
+
+# Потоковая выборка записей: подходящие записи возвращаются по одной
+def iter_select(
+    table_data, where_clause=None, limit=None, offset=0, order_by=None, fields=None
+):
+    """
+    Возвращает итератор записей в порядке ID без кэширования и без
+    построения списка результата - для вывода больших выборок построчно.
+    order_by - (столбец, по убыванию): записи идут в порядке столбца
+    (по сортированному индексу или после сортировки, см. _iter_ordered).
+    fields - столбцы результата (None - все).
+    """
+    where = compile_where(where_clause)
+    if order_by is None:
+        matches = _iter_matches(table_data, where)
+    else:
+        matches = _iter_ordered(table_data, where, order_by, limit, offset)
+    records = _project(_page(matches, limit, offset), fields)
+    return metrics.count_rows("rows_returned", records)
+
+# Выборка из таблицы в колоночном формате без загрузки её в память
+@handle_db_errors
+@log_time
+def select_mapped(
+    table_name, where_clause, limit=None, offset=0, order_by=None, fields=None
+):
+    """
+    Условие проверяется по отображенному в память файлу, объекты
+    создаются только для подходящих записей. Кэш общий с select.
+    Страница (limit/offset) читается до первых limit записей и не кэшируется,
+    как и упорядоченная выборка (order_by).
+    fields - столбцы результата (None - все): остальные столбцы
+    из файла не читаются.
+    """
+    where = compile_where(where_clause)
+
+    if limit is not None or offset or order_by is not None:
+        return list(
+            iter_select_mapped(table_name, where, limit, offset, order_by, fields)
+        )
 
-        # Если фильтр не задан, возвращаем все записи
-        if where_clause is None:
-            return records
+    def compute_result():
+        read_fields = _read_fields(fields)
+        with metrics.stage("просмотр колоночного файла") as current:
+            records, _ = scan_table_data(
+                table_name, where, parallel=True, fields=read_fields
+            )
+            if read_fields != fields:
+                records = _project(records, fields)
+            records = list(records)
+            current.set_rows(len(records))
+        return records
+
+    version = get_mapped_table_version(table_name)
+    cache_key = _cache_key(table_name, version, where, fields)
+    return _returned(_select_cache(cache_key, compute_result))
+
+# Потоковая выборка из таблицы в колоночном формате через mmap
+def iter_select_mapped(
+    table_name, where_clause=None, limit=None, offset=0, order_by=None, fields=None
+):
+    """
+    Без LIMIT просматривается весь файл, поэтому большую таблицу можно
+    просмотреть параллельно; страницу быстрее набрать в одном процессе
+    (и для ORDER BY с LIMIT держать в памяти только её записи).
+    Записи в файле идут по ID, по другому столбцу они сортируются.
+    fields - столбцы результата (None - все).
+    """
+    order_column = None if order_by is None else order_by[0]
+    read_fields = _read_fields(fields, order_column)
+    records, _ = scan_table_data(
+        table_name,
+        compile_where(where_clause),
+        parallel=limit is None,
+        fields=read_fields,
+    )
+    if order_by is not None and order_by != (PRIMARY_KEY, False):
+        records = _sort_records(records, order_by, limit, offset)
+    records = _page(records, limit, offset)
+    if read_fields != fields:
+        records = _project(records, fields)
+    return metrics.count_rows("rows_returned", records)
+
+# Агрегаты по записям таблицы в памяти
+@handle_db_errors
+@log_time
+def select_aggregate(table_data, where_clause, columns, group_by=None, table_name=None):
+    """
+    columns и group_by - из parser.parse_select. Подходящие записи
+    перебираются лениво (по индексу, если он применим) и сразу попадают
+    в агрегаты, список выборки не строится. COUNT(*) без группировки
+    считается без перебора: по числу записей или по индексу.
+    Результат кэшируется, как у select, если передано имя таблицы.
+    """
+    where = compile_where(where_clause)
 
-        # Фильтруем записи по условию where_clause
-        filtered_records = []
-        for record in records:
-            match = True
-            for key, value in where_clause.items():
-                if key not in record or record[key] != value:
-                    match = False
-                    break
-            if match:
-                filtered_records.append(record)
+    def compute_result():
+        if is_count_only(columns, group_by):
+            if where.ast is None:
+                count = len(table_data.get("records", []))
+            else:
+                count = count_by_index(table_data, where)
+            if count is not None:
+                return [{aggregate_label(columns[0]): count}]
+        with metrics.stage("агрегация") as current:
+            rows = aggregate(_iter_matches(table_data, where), columns, group_by)
+            current.set_rows(len(rows))
+        return rows
+
+    if table_name is None:
+        return _returned(compute_result())
+
+    version = table_data.get("version", 0)
+    cache_key = _cache_key(table_name, version, where, columns, group_by)
+    return _returned(_select_cache(cache_key, compute_result))
+
+# Агрегаты по таблице в колоночном формате без загрузки её в память
+@handle_db_errors
+@log_time
+def select_aggregate_mapped(table_name, where_clause, columns, group_by=None):
+    """
+    Файл просматривается в одном процессе: подходящие записи сразу
+    попадают в агрегаты и не копятся в памяти. Из файла читаются
+    только столбцы агрегатов и группировки. Кэш общий с select.
+    """
+    where = compile_where(where_clause)
+    used = [column for _, column in columns]
 
-        return filtered_records
+    def compute_result():
+        with metrics.stage("агрегация") as current:
+            fields = _read_fields(used, group_by)
+            records, _ = scan_table_data(table_name, where, fields=fields)
+            rows = aggregate(records, columns, group_by)
+            current.set_rows(len(rows))
+        return rows
 
-    # Используем кэширование
-    return _select_cache(cache_key, compute_result)
+    version = get_mapped_table_version(table_name)
+    cache_key = _cache_key(table_name, version, where, columns, group_by)
+    return _returned(_select_cache(cache_key, compute_result))
 
 # Обновление записей в таблице
 @handle_db_errors
-def update(table_data, set_clause, where_clause):
-    records = table_data.get("records", [])
+@log_time
+def update(table_data, set_clause, where_clause, table_name=None):
+    """
+    Если передано имя таблицы, изменения сразу дописываются в её журнал.
+    Иначе сохранение остается на вызывающей стороне. ID не меняется:
+    записи, у которых SET не задел других столбцов, не считаются
+    обновленными.
+    """
     updated_count = 0
-
-    # Проходим по всем записям
-    for record in records:
-        # Проверяем, соответствует ли запись условию where_clause
-        match = True
-        for key, value in where_clause.items():
-            if key not in record or record[key] != value:
-                match = False
-                break
-
-        # Если запись соответствует условию, обновляем её
-        if match:
-            for key, value in set_clause.items():
-                if key in record:
-                    record[key] = value
-            updated_count += 1
+    log_entries = []
+
+    # Отбираем подходящие записи до изменения, чтобы не сбить индекс
+    matched, positions = _find_matches(table_data, compile_where(where_clause))
+
+    for record in matched:
+        changes = {}
+        old_values = {}
+        for key, value in set_clause.items():
+            if key in record and key != PRIMARY_KEY:
+                old_values[key] = record[key]
+                record[key] = value
+                changes[key] = value
+        if not changes:
+            continue
+        update_in_indexes(table_data, record, old_values)
+        log_entries.append({"op": "update", "ID": record["ID"], "values": changes})
+        updated_count += 1
+
+    if log_entries:
+        version = _bump_version(table_data)
+        for entry in log_entries:
+            entry["version"] = version
+        if positions is not None:
+            values = {k: v for k, v in set_clause.items() if k != PRIMARY_KEY}
+            vectorized.apply_update(table_data, positions, values)
+
+    if table_name is not None:
+        append_table_log(table_name, log_entries, table_data)
 
     print(f"Обновлено записей: {updated_count}")
     return table_data
 
+# Убирает найденные записи из списка записей таблицы
+def _remove_records(table_data, matched):
+    """
+    Записи упорядочены по ID, поэтому немногие удаляемые (не больше
+    DELETE_IN_PLACE_MAX) находятся двоичным поиском и удаляются на месте,
+    без копирования всего списка. Иначе список собирается заново.
+    """
+    records = table_data.get("records", [])
+    if len(matched) <= DELETE_IN_PLACE_MAX:
+        positions = [
+            bisect_left(records, record["ID"], key=itemgetter("ID"))
+            for record in matched
+        ]
+        if all(
+            position < len(records) and records[position] is record
+            for position, record in zip(positions, matched)
+        ):
+            for position in sorted(positions, reverse=True):
+                del records[position]
+            return
+
+    deleted_ids = {record["ID"] for record in matched}
+    table_data["records"] = [
+        record for record in records if record["ID"] not in deleted_ids
+    ]
+
 # Удаление записей из таблицы
 @confirm_action("удаление записей")
 @handle_db_errors
-def delete(table_data, where_clause):
-    records = table_data.get("records", [])
-    records_to_keep = []
-    deleted_count = 0
-
-    # Проходим по всем записям
-    for record in records:
-        # Проверяем, соответствует ли запись условию where_clause
-        match = True
-        for key, value in where_clause.items():
-            if key not in record or record[key] != value:
-                match = False
-                break
-
-        # Если запись НЕ соответствует условию, оставляем её
-        if not match:
-            records_to_keep.append(record)
+@log_time
+def delete(table_data, where_clause, table_name=None):
+    """
+    Если передано имя таблицы, удаления сразу дописываются в её журнал.
+    Иначе сохранение остается на вызывающей стороне.
+    """
+    log_entries = []
+
+    # Находим удаляемые записи (по индексу, если условие это позволяет)
+    matched, positions = _find_matches(table_data, compile_where(where_clause))
+    for record in matched:
+        remove_from_indexes(table_data, record)
+        log_entries.append({"op": "delete", "ID": record["ID"]})
+    deleted_count = len(matched)
+
+    # Обновляем список записей, только если что-то удалено
+    if matched:
+        version = _bump_version(table_data)
+        for entry in log_entries:
+            entry["version"] = version
+        if positions is not None:
+            vectorized.apply_delete(table_data, positions)
         else:
-            deleted_count += 1
+            _remove_records(table_data, matched)
 
-    # Обновляем список записей
-    table_data["records"] = records_to_keep
+    if table_name is not None:
+        append_table_log(table_name, log_entries, table_data)
 
     print(f"Удалено записей: {deleted_count}")
     return table_data
@@ -204,6 +834,19 @@ def clear_select_cache():
     _select_cache.clear()
 
 
+def is_select_cached(table_name, version, where_clause, columns=None, group_by=None):
+    """Есть ли в кэше результат select для этой версии таблицы и условия"""
+    where = compile_where(where_clause)
+    return _select_cache.contains(
+        _cache_key(table_name, version, where, columns, group_by)
+    )
+
+
 def get_select_cache_stats():
-    """Получить статистику кэша select"""
-    return _select_cache.stats()
\ No newline at end of file
+    """Получить статистику кэша select (hits/misses/evictions, размер)"""
+    return _select_cache.stats()
+
+
+def configure_select_cache(max_size=SELECT_CACHE_SIZE, max_bytes=SELECT_CACHE_BYTES):
+    """Изменить лимиты кэша select (None - без ограничения)"""
+    _select_cache.resize(max_size, max_bytes)
\ No newline at end of file
@@ -1,7 +1,51 @@
 import functools
+import threading
 import time
+from contextlib import contextmanager
 from typing import Callable
 
+from primitive_db import metrics
+
+# Режим подтверждения опасных операций: "ask" - спрашивать пользователя,
+# "yes" - подтверждать без вопросов, "no" - отклонять без вопросов
+_confirmation = {"mode": "ask"}
+
+# Список отклоненных операций текущего потока (см. track_declined)
+_declined = threading.local()
+
+
+def set_confirmation_mode(mode: str) -> None:
+    """
+    Устанавливает режим подтверждения для confirm_action
+    (например, "yes" для пакетного режима с флагом --yes).
+    """
+    if mode not in ("ask", "yes", "no"):
+        raise ValueError(f"некорректный режим подтверждения: {mode}")
+    _confirmation["mode"] = mode
+
+
+def get_confirmation_mode() -> str:
+    """
+    Возвращает текущий режим подтверждения ("ask", "yes" или "no"),
+    например чтобы потом восстановить его через set_confirmation_mode.
+    """
+    return _confirmation["mode"]
+
+
+@contextmanager
+def track_declined():
+    """
+    Пока поток выполняет блок with, confirm_action добавляет в список,
+    который возвращает блок, названия отклоненных операций. Так сервер
+    узнает, что команда не выполнена, не разбирая её вывод.
+    """
+    previous = getattr(_declined, "value", None)
+    _declined.value = []
+    try:
+        yield _declined.value
+    finally:
+        _declined.value = previous
+
 
 def confirm_action(action_name: str):
     """
@@ -10,15 +54,24 @@ def confirm_action(action_name: str):
     def decorator(func: Callable) -> Callable:
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
-            # Запрашиваем подтверждение у пользователя
-            prompt = f'Вы уверены, что хотите выполнить "{action_name}"? [y/n]: '
-            response = input(prompt)
+            mode = _confirmation["mode"]
+            if mode == "ask":
+                # Запрашиваем подтверждение у пользователя
+                prompt = f'Вы уверены, что хотите выполнить "{action_name}"? [y/n]: '
+                response = input(prompt)
+            else:
+                response = "y" if mode == "yes" else "n"
+                if mode == "no":
+                    print("Подтверждение недоступно без терминала (используйте --yes).")
 
             # Если пользователь подтвердил действие
             if response.lower() == 'y':
                 return func(*args, **kwargs)
             else:
                 print(f"Операция '{action_name}' отменена.")
+                declined = getattr(_declined, "value", None)
+                if declined is not None:
+                    declined.append(action_name)
                 return args[0] if args else None  # Возвращаем metadata без изменений
 
         return wrapper
@@ -28,16 +81,20 @@ def confirm_action(action_name: str):
 def log_time(func: Callable) -> Callable:
     """
     Декоратор для замера времени выполнения функции.
-    Выводит в консоль время выполнения в секундах.
+    Время записывается в гистограмму задержек операции с именем функции
+    (модуль metrics, команда stats), а не выводится в консоль.
     """
+    name = func.__name__
+
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        start_time = time.monotonic()
-        result = func(*args, **kwargs)
-        end_time = time.monotonic()
-        elapsed_time = end_time - start_time
-        print(f"Функция {func.__name__} выполнилась за {elapsed_time:.3f} секунд")
-        return result
+        if not metrics.is_enabled():
+            return func(*args, **kwargs)
+        start_time = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            metrics.record_latency(name, time.perf_counter() - start_time)
 
     return wrapper
 
@@ -1,15 +1,94 @@
+import json
+import os
+import re
 import shlex
+import sys
+import time
+from itertools import islice
+from operator import itemgetter
 
 from prettytable import PrettyTable
 
-from primitive_db.constants import META_FILE
-from primitive_db.core import create_table, delete, drop_table, insert, select, update
-from primitive_db.parser import parse_set_clause, parse_where_clause
+from primitive_db import metrics
+from primitive_db.aggregates import (
+    aggregate,
+    aggregate_label,
+    is_aggregate_query,
+    is_count_only,
+)
+from primitive_db.bufferpool import (
+    create_buffer_pool,
+    discard_table,
+    flush,
+    get_pool_stats,
+    get_table,
+    mark_dirty,
+    peek_table,
+    release_table,
+    set_budget,
+)
+from primitive_db.coercion import coerce_set_clause
+from primitive_db.columnar import describe_candidate_rows
+from primitive_db.constants import (
+    ENCODING,
+    INSERT_BATCH_SIZE,
+    META_FILE,
+    NUMERIC_AGGREGATES,
+    PRETTY_TABLE_MAX_ROWS,
+)
+from primitive_db.core import (
+    clear_select_cache,
+    convert_table,
+    create_index,
+    create_table,
+    delete,
+    describe_access_path,
+    describe_order,
+    drop_index,
+    drop_table,
+    get_select_cache_stats,
+    insert,
+    insert_many,
+    is_select_cached,
+    iter_select,
+    iter_select_mapped,
+    select,
+    select_aggregate,
+    select_aggregate_mapped,
+    select_mapped,
+    set_execution_engine,
+    set_parallel_workers,
+    update,
+)
+from primitive_db.decorators import handle_db_errors
+from primitive_db.indexes import build_indexes, count_by_index
+from primitive_db.locks import file_lock
+from primitive_db.parallel import get_parallelism, plans_parallel_scan
+from primitive_db.parser import parse_select, parse_set_clause
+from primitive_db.planner import bind_where, compile_where, compile_where_text
+from primitive_db.transactions import (
+    begin_transaction,
+    commit_transaction,
+    lock_table,
+    recover_transactions,
+    rollback_transaction,
+    transaction_scope,
+)
 from primitive_db.utils import (
+    compact_table,
+    get_file_signature,
+    get_index_definitions,
+    get_mapped_table_header,
+    get_mapped_table_version,
+    get_stored_row_count,
+    get_table_names,
     load_metadata,
-    load_table_data,
     save_metadata,
-    save_table_data,
+    set_table_compression,
+    supports_mapped_scan,
+    table_exists,
+    table_lock,
+    vacuum_table,
 )
 
 
@@ -18,205 +97,1199 @@ def print_help() -> None:
     print("\n*** Управление таблицами ***")
     print("Функции:")
     print("<command> create_table <имя> <столбец1:тип> ... - создать таблицу")
+    print(
+        "<command> create_table <имя> <столбец1:тип> ... format=columnar "
+        "- создать таблицу в колоночном формате"
+    )
     print("<command> list_tables - показать список всех таблиц")
     print("<command> drop_table <имя> - удалить таблицу")
+    print(
+        "<command> create_index <таблица> <столбец> [hash|sorted] "
+        "- создать индекс"
+    )
+    print("<command> drop_index <таблица> <столбец> - удалить индекс")
+    print(
+        "<command> convert_table <таблица> <json|columnar> "
+        "- сменить формат хранения"
+    )
 
     print("\n*** Работа с данными (CRUD) ***")
     print("<command> insert <таблица> <значение1> <значение2> ... - добавить запись")
-    print("<command> select <таблица> [WHERE условие] - выбрать записи")
+    print(
+        "<command> insert_many <таблица> <файл.csv|файл.jsonl> [размер_пачки] "
+        "- загрузить записи из файла"
+    )
+    print(
+        "<command> select <таблица> [WHERE условие] [ORDER BY столбец [DESC]] "
+        "[LIMIT n] [OFFSET m] [FORMAT table|tsv|jsonl] - выбрать записи"
+    )
+    print("  (в условии: =, !=, <, <=, >, >=, IN (...), AND, OR и скобки)")
+    print(
+        "<command> select <столбец1>, <столбец2> FROM <таблица> ... "
+        "- выбрать только указанные столбцы"
+    )
+    print(
+        "<command> select <агрегаты> FROM <таблица> [WHERE условие] "
+        "[GROUP BY столбец] ... - агрегаты COUNT, SUM, MIN, MAX, AVG"
+    )
     print(
         "<command> update <таблица> SET поле=значение WHERE условие "
         "- обновить записи"
     )
     print("<command> delete <таблица> WHERE условие - удалить записи")
+    print("<command> compact <таблица> - слить журнал изменений с файлом таблицы")
+    print(
+        "<command> vacuum <таблица> "
+        "- освободить место удаленных записей и объединить сегменты"
+    )
+    print(
+        "<command> compress <таблица> <gzip|zstd|none> "
+        "- сжимать сегменты редко изменяемой таблицы"
+    )
+    print("<command> checkpoint - слить журналы измененных таблиц с файлами")
+    print(
+        "<command> buffer_pool [размер_МБ] "
+        "- состояние пула таблиц в памяти (и его новый размер)"
+    )
     print("\nПримеры:")
     print('  insert users "John" 28 true')
     print('  select users')
     print('  select users WHERE age = 28')
+    print('  select users WHERE age > 18 LIMIT 10 OFFSET 20')
+    print('  select users FORMAT jsonl')
+    print('  select users ORDER BY age DESC LIMIT 10')
+    print('  select name, age FROM users WHERE active = true')
+    print("  select users WHERE age >= 18 AND (name = 'John' OR ID IN (1, 2))")
+    print("  select COUNT(*) FROM users WHERE age > 18")
+    print("  select city, COUNT(*), AVG(age) FROM users GROUP BY city")
     print('  update users SET age = 30 WHERE name = "John"')
     print('  delete users WHERE ID = 1')
 
+    print("\n*** Транзакции ***")
+    print("<command> BEGIN - начать транзакцию")
+    print("<command> COMMIT - зафиксировать изменения транзакции")
+    print("<command> ROLLBACK - отменить изменения транзакции")
+    print("  (внутри транзакции доступны insert, update, delete и select)")
+
+    print("\n*** Производительность ***")
+    print(
+        "<command> set_engine <python|numpy> "
+        "- движок выполнения условий WHERE"
+    )
+    print(
+        "<command> set_parallel <процессов> [мин_строк] "
+        "- просматривать большие таблицы в нескольких процессах"
+    )
+    print("  (1 - без параллельности, 0 - по числу ядер)")
+    print(
+        "<command> stats [json [файл] | reset | on | off] "
+        "- метрики: задержки операций, счетчики строк и байтов, кэши"
+    )
+    print("<command> EXPLAIN select ... - показать план выполнения select")
+    print(
+        "<command> EXPLAIN ANALYZE select ... "
+        "- выполнить select и показать время и строки по этапам"
+    )
+
     print("\n*** Общие команды ***")
     print("<command> exit - выйти из программы")
     print("<command> help - справочная информация\n")
 
-# Главный цикл работы программы
-def run() -> None:
-    metadata = load_metadata(META_FILE)
+# Представляет значение поля для вывода в TSV
+def _tsv_value(value):
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    text = str(value)
+    return text.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n")
 
-    print("\n*** База данных запущена ***")
-    print_help()
+# Выводит записи построчно в формате TSV или JSON Lines
+@handle_db_errors
+def print_records(records, output_format, output=None):
+    """
+    records - любой итерируемый набор записей: строки пишутся по мере
+    перебора, поэтому вывод начинается сразу и не требует памяти под всю
+    выборку. Для TSV первой строкой выводятся имена полей первой записи.
+    output - файл для вывода (по умолчанию sys.stdout).
+    """
+    output = sys.stdout if output is None else output
+    fields = None
+    try:
+        for record in records:
+            if output_format == "jsonl":
+                output.write(json.dumps(record, ensure_ascii=False) + "\n")
+                continue
+            if fields is None:
+                fields = list(record.keys())
+                output.write("\t".join(fields) + "\n")
+            output.write(
+                "\t".join(_tsv_value(record.get(field)) for field in fields) + "\n"
+            )
+        output.flush()
+    except BrokenPipeError:
+        # Получатель вывода закрыл канал (например, head) - прекращаем вывод
+        pass
 
-    while True:
+# Создает сеанс работы с базой
+def new_session(metadata=None):
+    """
+    Таблицы сеанса держатся в пуле буферов между командами. Изменения
+    сразу дописываются в журнал таблицы, а основной файл обновляется
+    лениво (flush_session). Метаданные перечитываются, только если их
+    файл изменил другой процесс. Фиксации транзакций, прерванные
+    сбоем, при запуске сеанса доводятся до конца.
+    """
+    session = {
+        "metadata": {},
+        "metadata_signature": None,
+        "pool": create_buffer_pool(),
+        "transaction": None,
+    }
+    recover_transactions()
+    if metadata is None:
+        _refresh_metadata(session)
+    else:
+        session["metadata"] = metadata
+        session["metadata_signature"] = get_file_signature(META_FILE)
+    return session
+
+# Перечитывает метаданные, если их файл изменился после нашего чтения
+def _refresh_metadata(session):
+    signature = get_file_signature(META_FILE)
+    if signature != session["metadata_signature"]:
+        # Обновляем тот же словарь: на него ссылаются вызывающие функции.
+        # Не очищаем его целиком, чтобы другие потоки сервера не увидели
+        # пустые метаданные
+        metadata = session["metadata"]
+        fresh = load_metadata(META_FILE)
+        for key in [key for key in metadata if key not in fresh]:
+            del metadata[key]
+        metadata.update(fresh)
+        session["metadata_signature"] = signature
+
+# Сохраняет метаданные (вызывается под блокировкой файла метаданных)
+def _save_metadata(session):
+    save_metadata(META_FILE, session["metadata"])
+    session["metadata_signature"] = get_file_signature(META_FILE)
+
+# Возвращает данные таблицы из пула буферов сеанса
+def _get_table_data(session, table_name):
+    return get_table(
+        session["pool"],
+        table_name,
+        get_index_definitions(session["metadata"], table_name),
+    )
+
+# Отмечает таблицу в пуле измененной, если команда сменила её версию
+def _mark_written(session, table_name, table_data, version_before):
+    if table_data.get("version", 0) != version_before:
+        mark_dirty(session["pool"], table_name)
+
+# Сохраняет на диск все накопленные в сеансе изменения
+def flush_session(session):
+    flush(session["pool"])
+
+# Завершает сеанс: откатывает незавершенную транзакцию и сохраняет изменения
+def close_session(session):
+    transaction = session["transaction"]
+    if transaction is not None:
+        session["transaction"] = None
+        _rollback(session, transaction)
+        print("Незавершенная транзакция отменена.")
+    flush_session(session)
+
+# Разбирает команду select и компилирует её условие
+def _prepare_select(metadata, user_input):
+    """
+    Возвращает (запрос, условие) или None, если команда ошибочна
+    (сообщение об ошибке уже выведено).
+    """
+    try:
+        query = parse_select(user_input)
+    except ValueError as e:
+        print(f"Ошибка парсинга: {e}")
+        return None
+
+    # Проверяем существование таблицы
+    table_name = query["table"]
+    if not table_exists(metadata, table_name):
+        print(f'Ошибка: Таблица "{table_name}" не существует.')
+        return None
+
+    error = _check_select_columns(metadata[table_name], query)
+    if error is not None:
+        print(f"Ошибка: {error}")
+        return None
+
+    where_clause = None
+    if query["where"] is not None:
         try:
-            user_input = input("Введите команду: ").strip()
-        except (EOFError, KeyboardInterrupt):
-            print("\nВыход из программы...")
-            break
+            where_clause = compile_where_text(query["where"])
+        except ValueError as e:
+            print(f"Ошибка парсинга WHERE: {e}")
+            return None
+        # Литералы приводим к типам столбцов
+        where_clause = bind_where(where_clause, metadata[table_name])
+    return query, where_clause
 
-        if not user_input:
-            continue
+# Проверяет столбцы списка select и GROUP BY по схеме таблицы
+def _check_select_columns(schema, query):
+    """Возвращает текст ошибки или None"""
+    columns = query["columns"] or []
+    names = [column for _, column in columns if column is not None]
+    if query["group_by"] is not None:
+        names.append(query["group_by"])
+    if query["order_by"] is not None:
+        names.append(query["order_by"][0])
+    for name in names:
+        if name not in schema:
+            return f'Столбец "{name}" не найден в таблице "{query["table"]}".'
+    for func, column in columns:
+        if func in NUMERIC_AGGREGATES and schema[column] not in ("int", "bool"):
+            return (
+                f"{func.upper()} применима только к числовым столбцам "
+                f'(столбец "{column}" имеет тип {schema[column]}).'
+            )
+    return None
 
-        args = shlex.split(user_input)  #Для надежного разбора строки shlex
-        command = args[0]
+# Выбирает, откуда select возьмет записи: "mapped" или "pool"
+def _select_source(session, query, where_clause, streaming):
+    """
+    Колоночную таблицу с условием, страницей, сортировкой или списком
+    столбцов читаем через mmap ("mapped"), остальные загружаем целиком
+    в пул буферов ("pool"); таблицу, уже загруженную сеансом, берем
+    из памяти.
+    """
+    table_name = query["table"]
+    paged = query["limit"] is not None or query["offset"] > 0
+    narrowed = query["order_by"] is not None or query["columns"] is not None
+    has_filter = where_clause is not None and where_clause.ast is not None
+    loaded = peek_table(session["pool"], table_name) is not None
+    if (
+        not loaded
+        and supports_mapped_scan(table_name)
+        and (has_filter or paged or narrowed or streaming)
+    ):
+        return "mapped"
+    return "pool"
 
-        if command == "exit":
-            print("Выход из программы...")
-            break
+# Выполняет разобранный запрос select и возвращает найденные записи
+def _run_select(session, query, where_clause, streaming=False):
+    """
+    query - результат parse_select, where_clause - скомпилированное условие.
+    streaming=True - вернуть ленивый итератор вместо списка.
+    Возвращает None при ошибке (сообщение уже выведено).
+    """
+    if is_aggregate_query(query["columns"], query["group_by"]):
+        return _run_aggregate(session, query, where_clause)
+    # Невыполнимое условие: таблицу не читаем
+    if where_clause is not None and where_clause.unsatisfiable:
+        return iter(()) if streaming else []
 
-        elif command == "help":
-            print_help()
+    table_name = query["table"]
+    limit = query["limit"]
+    offset = query["offset"]
+    order_by = query["order_by"]
+    fields = _select_fields(query)
 
-        elif command == "list_tables":
-            if metadata:
-                for table in metadata.keys():
-                    print("-", table)
-            else:
-                print("Таблиц пока нет.")
+    # Для построчного вывода записи перебираются лениво, иначе
+    # набирается список результата
+    if _select_source(session, query, where_clause, streaming) == "mapped":
+        select_function = iter_select_mapped if streaming else select_mapped
+        return select_function(
+            table_name, where_clause, limit, offset, order_by, fields
+        )
 
-        elif command == "create_table":
-            if len(args) < 3:
-                print("Ошибка: недостаточно аргументов.")
-                continue
+    table_data = _get_table_data(session, table_name)
+    if streaming:
+        return iter_select(table_data, where_clause, limit, offset, order_by, fields)
+    return select(
+        table_data, where_clause, table_name, limit, offset, order_by, fields
+    )
 
-            table_name = args[1]
-            columns = args[2:]
-            metadata = create_table(metadata, table_name, columns)
-            save_metadata(META_FILE, metadata)
+# Столбцы результата select без агрегатов (None - все столбцы)
+def _select_fields(query):
+    if query["columns"] is None:
+        return None
+    return [column for _, column in query["columns"]]
 
-        elif command == "drop_table":
-            if len(args) < 2:
-                print("Ошибка: укажите имя таблицы.")
-                continue
-            table_name = args[1]
-            metadata = drop_table(metadata, table_name)
-            save_metadata(META_FILE, metadata)
+# COUNT(*) по всей таблице без чтения её записей
+def _stored_count(session, query, where_clause):
+    """
+    Число записей берется из манифеста или заголовка колоночного файла,
+    если таблица не загружена в пул. None - записи нужно перебрать.
+    """
+    has_filter = where_clause is not None and where_clause.ast is not None
+    if (
+        has_filter
+        or not is_count_only(query["columns"], query["group_by"])
+        or peek_table(session["pool"], query["table"]) is not None
+    ):
+        return None
+    return get_stored_row_count(query["table"])
 
-        elif command == "insert":
-            if len(args) < 2:
-                print("Ошибка: укажите имя таблицы и значения.")
-                continue
+# Выполняет select с агрегатами и возвращает строки результата
+def _run_aggregate(session, query, where_clause):
+    """
+    Агрегаты считаются за один проход по подходящим записям; колоночная
+    таблица, которой нет в пуле, просматривается через mmap. ORDER BY,
+    LIMIT и OFFSET применяются к строкам результата (группам). Если
+    столбца ORDER BY (ключа группы) нет в списке select, он считается
+    вместе с агрегатами и убирается из строк после сортировки.
+    """
+    table_name = query["table"]
+    columns = query["columns"]
+    group_by = query["group_by"]
+    order_by = query["order_by"]
+    hidden = order_by is not None and (None, order_by[0]) not in columns
+    if hidden:
+        columns = [*columns, (None, order_by[0])]
 
-            table_name = args[1]
-            values = args[2:]
-            insert(metadata, table_name, values)
+    count = _stored_count(session, query, where_clause)
+    if count is not None:
+        rows = [{aggregate_label(columns[0]): count}]
+    elif where_clause is not None and where_clause.unsatisfiable:
+        rows = aggregate((), columns, group_by)
+    elif _select_source(session, query, where_clause, True) == "mapped":
+        rows = select_aggregate_mapped(table_name, where_clause, columns, group_by)
+    else:
+        table_data = _get_table_data(session, table_name)
+        rows = select_aggregate(
+            table_data, where_clause, columns, group_by, table_name
+        )
+    if rows is None:
+        return None
 
-        elif command == "select":
-            if len(args) < 2:
-                print("Ошибка: укажите имя таблицы.")
-                continue
+    if order_by is not None:
+        column, descending = order_by
+        rows = sorted(rows, key=itemgetter(column), reverse=descending)
+    limit = query["limit"]
+    offset = query["offset"]
+    rows = list(islice(rows, offset, None if limit is None else offset + limit))
+    if hidden:
+        # Строки могут лежать в кэше select, поэтому собираем новые
+        rows = [
+            {label: value for label, value in row.items() if label != order_by[0]}
+            for row in rows
+        ]
+    return rows
 
-            table_name = args[1]
+# Выводит результат select в заданном формате
+def _print_select_result(records, output_format, output=None):
+    """
+    output - файл для вывода (по умолчанию sys.stdout).
+    """
+    if output_format != "table":
+        print_records(records, output_format, output)
+    elif len(records) > PRETTY_TABLE_MAX_ROWS:
+        # Большую выборку не собираем в таблицу, а выводим построчно
+        print(
+            f"Найдено записей: {len(records)} - больше "
+            f"{PRETTY_TABLE_MAX_ROWS}, вывод в формате TSV "
+            f"(ограничьте выборку с помощью LIMIT).",
+            file=output,
+        )
+        print_records(records, "tsv", output)
+    elif records:
+        # Выводим результаты с помощью PrettyTable
+        table = PrettyTable()
+        # Используем ключи первой записи для заголовков
+        table.field_names = list(records[0].keys())
+        for record in records:
+            table.add_row([record.get(field) for field in table.field_names])
+        print(table, file=output)
+        print(f"\nНайдено записей: {len(records)}", file=output)
+    else:
+        print("Записей не найдено.", file=output)
 
-            # Проверяем существование таблицы
-            if table_name not in metadata:
-                print(f'Ошибка: Таблица "{table_name}" не существует.')
-                continue
+# Разбирает EXPLAIN [ANALYZE] <select ...>
+_EXPLAIN_PATTERN = re.compile(r"\s*explain\s+(?:(analyze)\s+)?(.*)", re.I | re.S)
 
-            # Загружаем данные таблицы
-            table_data = load_table_data(table_name)
-
-            # Ищем WHERE в исходной строке команды
-            where_clause = None
-            if "WHERE" in user_input.upper():
-                # Находим позицию WHERE в исходной строке
-                where_idx = user_input.upper().index("WHERE")
-                where_str = user_input[where_idx + 5:].strip()
-                try:
-                    where_clause = parse_where_clause(where_str)
-                except ValueError as e:
-                    print(f"Ошибка парсинга WHERE: {e}")
-                    continue
-
-            # Выполняем SELECT
-            records = select(table_data, where_clause)
-
-            # Выводим результаты с помощью PrettyTable
-            if records:
-                table = PrettyTable()
-                # Используем ключи первой записи для заголовков
-                table.field_names = list(records[0].keys())
-                for record in records:
-                    table.add_row([record.get(field) for field in table.field_names])
-                print(table)
-                print(f"\nНайдено записей: {len(records)}")
-            else:
-                print("Записей не найдено.")
-
-        elif command == "update":
-            if len(args) < 2:
-                print("Ошибка: укажите имя таблицы.")
-                continue
+# Составляет план select: список пар (пункт, описание)
+def _select_plan(session, query, where_clause, streaming):
+    """
+    Для таблицы в пуле план загружает её (как и сам select), чтобы
+    оценить число кандидатов по индексу.
+    """
+    table_name = query["table"]
+    where = compile_where(where_clause)
+    paged = query["limit"] is not None or query["offset"] > 0
+    ordered = query["order_by"] is not None
+    lazy = streaming or paged or ordered
+    aggregated = is_aggregate_query(query["columns"], query["group_by"])
+    plan = [("Таблица", table_name)]
+    table_data = None
+
+    # Агрегаты перебирают записи лениво, как построчный вывод
+    source = _select_source(session, query, where_clause, streaming or aggregated)
+    if aggregated and _stored_count(session, query, where_clause) is not None:
+        plan.append(
+            ("Источник", "манифест или заголовок файла таблицы, записи не читаются")
+        )
+        cacheable = False
+    elif where.unsatisfiable:
+        plan.append(("Источник", "таблица не читается"))
+        plan.append(("Доступ", "условие WHERE невыполнимо по схеме таблицы"))
+        cacheable = False
+    elif source == "mapped":
+        rows = get_mapped_table_header(table_name)["rows"]
+        plan.append(
+            ("Источник", f"колоночный файл через mmap ({rows} строк в файле)")
+        )
+        access = describe_candidate_rows(where)
+        # Страница и агрегаты считаются в одном процессе
+        # (см. iter_select_mapped и select_aggregate_mapped)
+        if (
+            not aggregated
+            and query["limit"] is None
+            and plans_parallel_scan(rows, where)
+        ):
+            access += f", по частям в {get_parallelism()['workers']} процессах"
+        plan.append(("Доступ", access))
+        cacheable = aggregated or not lazy
+        version = get_mapped_table_version(table_name) if cacheable else None
+    else:
+        loaded = peek_table(session["pool"], table_name) is not None
+        plan.append(
+            (
+                "Источник",
+                "таблица в пуле буферов"
+                if loaded
+                else "загрузка таблицы с диска в пул буферов",
+            )
+        )
+        table_data = _get_table_data(session, table_name)
+        if aggregated:
+            access = _aggregate_access(table_data, where, query)
+        else:
+            access = describe_access_path(table_data, where, lazy)
+        plan.append(("Доступ", access))
+        cacheable = aggregated or (not lazy and where.ast is not None)
+        version = table_data.get("version", 0)
 
-            table_name = args[1]
+    # Проекция колоночного файла кэшируется отдельно от полных записей
+    columns = query["columns"] if aggregated else None
+    if source == "mapped" and not aggregated:
+        columns = _select_fields(query)
+    if not cacheable:
+        plan.append(("Кэш select", "не используется"))
+    elif is_select_cached(table_name, version, where, columns, query["group_by"]):
+        plan.append(("Кэш select", "результат уже в кэше (просмотра не будет)"))
+    else:
+        plan.append(("Кэш select", "результата нет в кэше"))
+    if aggregated:
+        labels = ", ".join(aggregate_label(item) for item in query["columns"])
+        if query["group_by"] is not None:
+            labels += f", группировка по {query['group_by']}"
+        plan.append(("Агрегаты", labels))
+    if query["columns"] is not None and not aggregated:
+        fields = ", ".join(_select_fields(query))
+        if source == "mapped":
+            fields += " (остальные столбцы из файла не читаются)"
+        plan.append(("Столбцы", fields))
+    if ordered and aggregated:
+        plan.append(("Сортировка", f"строки результата по {query['order_by'][0]}"))
+    elif ordered:
+        order = describe_order(
+            table_data, where, query["order_by"], query["limit"], query["offset"]
+        )
+        plan.append(("Сортировка", order))
+    if paged:
+        limit = "без ограничения" if query["limit"] is None else query["limit"]
+        plan.append(("Страница", f"LIMIT {limit}, OFFSET {query['offset']}"))
+    if not streaming:
+        output = "PrettyTable (или TSV для больших выборок)"
+    elif aggregated:
+        output = f"построчно ({query['format']})"
+    else:
+        output = f"построчно ({query['format']}), записи читаются по мере вывода"
+    plan.append(("Вывод", output))
+    return plan
 
-            # Проверяем существование таблицы
-            if table_name not in metadata:
-                print(f'Ошибка: Таблица "{table_name}" не существует.')
-                continue
+# Способ доступа к записям для агрегатов по таблице в пуле
+def _aggregate_access(table_data, where, query):
+    if is_count_only(query["columns"], query["group_by"]):
+        if where.ast is None:
+            return "COUNT(*) по числу записей в памяти, без перебора"
+        if count_by_index(table_data, where) is not None:
+            return "COUNT(*) по индексу, без проверки записей"
+    return describe_access_path(table_data, where, lazy=True) + ", один проход"
 
-            # Ищем SET и WHERE в исходной строке команды
-            if "SET" not in user_input.upper():
-                print("Ошибка: отсутствует SET условие.")
-                continue
+# Выводит этапы профилируемого запроса
+def _print_stages(stages):
+    print("Этапы:")
+    for entry in stages:
+        line = f"{'  ' * (entry['depth'] + 1)}{entry['stage']}: "
+        line += f"{entry['seconds'] * 1000:.3f} мс"
+        if entry["rows"] is not None:
+            line += f", строк: {entry['rows']}"
+        print(line)
 
-            if "WHERE" not in user_input.upper():
-                print("Ошибка: отсутствует WHERE условие.")
-                continue
+# Команда EXPLAIN [ANALYZE] select ...
+def _explain(session, user_input):
+    """
+    EXPLAIN показывает план: источник записей, способ доступа (индекс,
+    просмотр, mmap), использование кэша select. EXPLAIN ANALYZE
+    дополнительно выполняет запрос и выводит время и число строк
+    каждого этапа; сами записи не выводятся (вывод замеряется, но
+    пишется в os.devnull, а не в sys.stdout - в серверном режиме он
+    общий для всех потоков).
+    """
+    match = _EXPLAIN_PATTERN.fullmatch(user_input)
+    if match is None or not match.group(2).lower().startswith("select"):
+        print("Ошибка: после EXPLAIN ожидается команда select.")
+        return
+    analyze = match.group(1) is not None
+    prepared = _prepare_select(session["metadata"], match.group(2))
+    if prepared is None:
+        return
+    query, where_clause = prepared
+    streaming = query["format"] != "table"
 
-            # Извлекаем SET и WHERE части
-            set_idx = user_input.upper().index("SET")
-            where_idx = user_input.upper().index("WHERE")
+    if not analyze:
+        print("План запроса:")
+        for item, description in _select_plan(
+            session, query, where_clause, streaming
+        ):
+            print(f"  {item}: {description}")
+        return
 
-            if where_idx <= set_idx:
-                print("Ошибка: WHERE должен идти после SET.")
-                continue
+    with metrics.profile() as stages:
+        start = time.perf_counter()
+        plan = _select_plan(session, query, where_clause, streaming)
+        records = _run_select(session, query, where_clause, streaming)
+        if records is None:
+            return
+        with metrics.stage("вывод") as current:
+            if streaming:
+                records = list(records)
+            with open(os.devnull, "w", encoding=ENCODING) as sink:
+                _print_select_result(records, query["format"], sink)
+            returned = len(records)
+            current.set_rows(returned)
+        total = time.perf_counter() - start
+
+    print("План запроса:")
+    for item, description in plan:
+        print(f"  {item}: {description}")
+    _print_stages(stages)
+    print(f"Всего: {total * 1000:.3f} мс, возвращено строк: {returned}")
+
+# Выполняет команду select и возвращает список найденных записей
+def query_records(session, user_input):
+    """
+    Программный вариант select для серверного режима: записи
+    возвращаются, а не выводятся. None - команда ошибочна
+    (сообщение уже выведено).
+    """
+    if session["transaction"] is not None:
+        # Таблицы транзакции читаем под её блокировками
+        with transaction_scope(session["transaction"]):
+            return _query_records(session, user_input)
+    return _query_records(session, user_input)
+
+# Выполняет select для query_records (блокировки уже взяты)
+def _query_records(session, user_input):
+    _refresh_metadata(session)
+    prepared = _prepare_select(session["metadata"], user_input)
+    if prepared is None:
+        return None
+    query, where_clause = prepared
+    return _run_select(session, query, where_clause)
+
+# Команды, которые меняют метаданные или файлы таблицы
+METADATA_COMMANDS = {
+    "create_table",
+    "drop_table",
+    "create_index",
+    "drop_index",
+    "convert_table",
+}
+WRITE_COMMANDS = {
+    "insert",
+    "insert_many",
+    "update",
+    "delete",
+    "compact",
+    "vacuum",
+    "compress",
+}
+
+# Команды управления транзакцией (принимаются в любом регистре)
+TRANSACTION_COMMANDS = {"begin", "commit", "rollback"}
+
+# Все команды (explain и команды транзакций - в любом регистре,
+# см. is_known_command)
+COMMANDS = METADATA_COMMANDS | WRITE_COMMANDS | TRANSACTION_COMMANDS | {
+    "exit",
+    "help",
+    "list_tables",
+    "select",
+    "explain",
+    "set_engine",
+    "set_parallel",
+    "checkpoint",
+    "stats",
+    "buffer_pool",
+}
+
+# Проверяет, есть ли такая команда
+def is_known_command(command):
+    if command.lower() in TRANSACTION_COMMANDS or command.lower() == "explain":
+        return True
+    return command in COMMANDS
+
+# Команды, которые пишут файлы таблиц или метаданные напрямую,
+# поэтому недоступны внутри транзакции
+_NON_TRANSACTIONAL_COMMANDS = METADATA_COMMANDS | {
+    "insert_many",
+    "compact",
+    "vacuum",
+    "compress",
+}
+
+# Выполняет одну команду; возвращает False, если нужно завершить работу
+def execute_command(session, user_input):
+    """
+    Изменения таблицы выполняются под её блокировкой: таблица в пуле
+    сначала сверяется с диском, поэтому изменения других процессов
+    не теряются. Изменения метаданных - под блокировкой их файла.
+    Внутри транзакции блокировки измененных таблиц держатся до её конца.
+    """
+    args = shlex.split(user_input)  #Для надежного разбора строки shlex
+    command = args[0]
+    if command.lower() in TRANSACTION_COMMANDS:
+        return _execute_transaction_command(session, command.lower())
+    if session["transaction"] is not None:
+        return _execute_in_transaction(session, user_input, args)
+    if command in METADATA_COMMANDS:
+        with file_lock(META_FILE):
+            _refresh_metadata(session)
+            return _execute(session, user_input, args)
+    _refresh_metadata(session)
+    if command in WRITE_COMMANDS and len(args) > 1:
+        # Фиксации, прерванные сбоем, переносим до новых изменений
+        recover_transactions()
+        with table_lock(args[1]):
+            return _execute(session, user_input, args)
+    return _execute(session, user_input, args)
+
+# Выполняет команду внутри транзакции сеанса
+def _execute_in_transaction(session, user_input, args):
+    command = args[0]
+    if command in _NON_TRANSACTIONAL_COMMANDS:
+        print(
+            f"Ошибка: команда {command} недоступна внутри транзакции "
+            f"(завершите её командой COMMIT или ROLLBACK)."
+        )
+        return True
+
+    transaction = session["transaction"]
+    with transaction_scope(transaction):
+        _refresh_metadata(session)
+        if command in WRITE_COMMANDS and len(args) > 1:
+            if not lock_table(transaction, session["pool"], args[1]):
+                print(
+                    f'Ошибка: таблица "{args[1]}" занята другой транзакцией, '
+                    f"команда не выполнена."
+                )
+                return True
+        return _execute(session, user_input, args)
+
+# Выполняет BEGIN, COMMIT или ROLLBACK
+def _execute_transaction_command(session, command):
+    transaction = session["transaction"]
+    if command == "begin":
+        if transaction is not None:
+            print("Ошибка: транзакция уже начата.")
+            return True
+        session["transaction"] = begin_transaction()
+        print("Транзакция начата.")
+    elif transaction is None:
+        print("Ошибка: транзакция не начата (используйте BEGIN).")
+    elif command == "commit":
+        session["transaction"] = None
+        _commit(session, transaction)
+    else:
+        session["transaction"] = None
+        _rollback(session, transaction)
+        print("Транзакция отменена.")
+    return True
+
+# Фиксирует транзакцию сеанса
+@handle_db_errors
+def _commit(session, transaction):
+    try:
+        tables = commit_transaction(transaction, session["pool"])
+    except Exception:
+        # Если транзакция откатилась, кэш select мог запомнить её изменения
+        clear_select_cache()
+        raise
+    print(f"Транзакция зафиксирована (изменено таблиц: {tables}).")
+
+# Откатывает транзакцию сеанса
+def _rollback(session, transaction):
+    rollback_transaction(transaction, session["pool"])
+    # Результаты select по незафиксированным версиям таблиц больше не верны
+    clear_select_cache()
+
+# Выполняет разобранную команду (блокировки уже взяты)
+def _execute(session, user_input, args):
+    metadata = session["metadata"]
+    command = args[0]
+
+    if command == "exit":
+        print("Выход из программы...")
+        return False
+
+    elif command == "help":
+        print_help()
 
-            set_str = user_input[set_idx + 3:where_idx].strip()
-            where_str = user_input[where_idx + 5:].strip()
+    elif command == "list_tables":
+        if get_table_names(metadata):
+            for table in get_table_names(metadata):
+                print("-", table)
+        else:
+            print("Таблиц пока нет.")
+
+    elif command == "create_table":
+        if len(args) < 3:
+            print("Ошибка: недостаточно аргументов.")
+            return True
+
+        table_name = args[1]
+        columns = args[2:]
+
+        # Необязательный последний аргумент format=<json|columnar>
+        table_format = "json"
+        if columns[-1].startswith("format="):
+            table_format = columns.pop().split("=", 1)[1]
+
+        # Таблица с тем же именем могла остаться в пуле после удаления
+        if not table_exists(metadata, table_name):
+            discard_table(session["pool"], table_name)
+        create_table(metadata, table_name, columns, table_format)
+        _save_metadata(session)
+
+    elif command == "drop_table":
+        if len(args) < 2:
+            print("Ошибка: укажите имя таблицы.")
+            return True
+        table_name = args[1]
+        drop_table(metadata, table_name)
+        if not table_exists(metadata, table_name):
+            discard_table(session["pool"], table_name)
+        _save_metadata(session)
+
+    elif command == "convert_table":
+        if len(args) < 3:
+            print("Ошибка: укажите имя таблицы и формат.")
+            return True
+
+        release_table(session["pool"], args[1])
+        convert_table(metadata, args[1], args[2])
+
+    elif command == "create_index":
+        if len(args) < 3:
+            print("Ошибка: укажите имя таблицы и столбец.")
+            return True
+
+        kind = args[3] if len(args) > 3 else "hash"
+        create_index(metadata, args[1], args[2], kind)
+        _save_metadata(session)
+        _rebuild_indexes(session, args[1])
+
+    elif command == "drop_index":
+        if len(args) < 3:
+            print("Ошибка: укажите имя таблицы и столбец.")
+            return True
+
+        drop_index(metadata, args[1], args[2])
+        _save_metadata(session)
+        _rebuild_indexes(session, args[1])
 
+    elif command == "insert":
+        if len(args) < 2:
+            print("Ошибка: укажите имя таблицы и значения.")
+            return True
+
+        table_name = args[1]
+        values = args[2:]
+        if not table_exists(metadata, table_name):
+            print(f'Ошибка: Таблица "{table_name}" не существует.')
+            return True
+
+        table_data = _get_table_data(session, table_name)
+        version = table_data.get("version", 0)
+        insert(metadata, table_name, values, table_data)
+        _mark_written(session, table_name, table_data, version)
+
+    elif command == "insert_many":
+        if len(args) < 3:
+            print("Ошибка: укажите имя таблицы и файл.")
+            return True
+
+        table_name = args[1]
+        filepath = args[2]
+        batch_size = INSERT_BATCH_SIZE
+        if len(args) > 3:
             try:
-                set_clause = parse_set_clause(set_str)
-                where_clause = parse_where_clause(where_str)
-            except ValueError as e:
-                print(f"Ошибка парсинга: {e}")
-                continue
+                batch_size = int(args[3])
+            except ValueError:
+                print(f"Ошибка: некорректный размер пачки: {args[3]}")
+                return True
+        # insert_many сам читает и сохраняет таблицу
+        release_table(session["pool"], table_name)
+        insert_many(metadata, table_name, filepath, batch_size)
 
-            # Загружаем данные, обновляем и сохраняем
-            table_data = load_table_data(table_name)
-            table_data = update(table_data, set_clause, where_clause)
-            save_table_data(table_name, table_data)
+    elif command == "select":
+        prepared = _prepare_select(metadata, user_input)
+        if prepared is None:
+            return True
+        query, where_clause = prepared
 
-        elif command == "delete":
-            if len(args) < 2:
-                print("Ошибка: укажите имя таблицы.")
-                continue
+        streaming = query["format"] != "table"
+        records = _run_select(session, query, where_clause, streaming)
+        if records is not None:
+            _print_select_result(records, query["format"])
 
-            table_name = args[1]
+    elif command.lower() == "explain":
+        _explain(session, user_input)
 
-            # Проверяем существование таблицы
-            if table_name not in metadata:
-                print(f'Ошибка: Таблица "{table_name}" не существует.')
-                continue
+    elif command == "update":
+        if len(args) < 2:
+            print("Ошибка: укажите имя таблицы.")
+            return True
 
-            # Ищем WHERE в исходной строке команды
-            if "WHERE" not in user_input.upper():
-                print("Ошибка: отсутствует WHERE условие.")
-                continue
+        table_name = args[1]
+
+        # Проверяем существование таблицы
+        if not table_exists(metadata, table_name):
+            print(f'Ошибка: Таблица "{table_name}" не существует.')
+            return True
+
+        # Ищем SET и WHERE в исходной строке команды
+        if "SET" not in user_input.upper():
+            print("Ошибка: отсутствует SET условие.")
+            return True
+
+        if "WHERE" not in user_input.upper():
+            print("Ошибка: отсутствует WHERE условие.")
+            return True
+
+        # Извлекаем SET и WHERE части
+        set_idx = user_input.upper().index("SET")
+        where_idx = user_input.upper().index("WHERE")
+
+        if where_idx <= set_idx:
+            print("Ошибка: WHERE должен идти после SET.")
+            return True
+
+        set_str = user_input[set_idx + 3:where_idx].strip()
+        where_str = user_input[where_idx + 5:].strip()
+
+        try:
+            set_clause = parse_set_clause(set_str)
+            where_clause = compile_where_text(where_str)
+        except ValueError as e:
+            print(f"Ошибка парсинга: {e}")
+            return True
+
+        # Значения SET и литералы условия приводим к типам столбцов
+        schema = metadata[table_name]
+        set_clause, error = coerce_set_clause(schema, set_clause, table_name)
+        if error:
+            print(error)
+            return True
+        where_clause = bind_where(where_clause, schema)
+
+        # Берем данные из пула и обновляем (изменения пишутся в журнал)
+        table_data = _get_table_data(session, table_name)
+        version = table_data.get("version", 0)
+        update(
+            table_data,
+            set_clause,
+            where_clause,
+            table_name=table_name,
+        )
+        _mark_written(session, table_name, table_data, version)
+
+    elif command == "delete":
+        if len(args) < 2:
+            print("Ошибка: укажите имя таблицы.")
+            return True
+
+        table_name = args[1]
+
+        # Проверяем существование таблицы
+        if not table_exists(metadata, table_name):
+            print(f'Ошибка: Таблица "{table_name}" не существует.')
+            return True
+
+        # Ищем WHERE в исходной строке команды
+        if "WHERE" not in user_input.upper():
+            print("Ошибка: отсутствует WHERE условие.")
+            return True
+
+        where_idx = user_input.upper().index("WHERE")
+        where_str = user_input[where_idx + 5:].strip()
+
+        try:
+            where_clause = compile_where_text(where_str)
+        except ValueError as e:
+            print(f"Ошибка парсинга WHERE: {e}")
+            return True
+        where_clause = bind_where(where_clause, metadata[table_name])
+
+        # Берем данные из пула и удаляем (изменения пишутся в журнал)
+        table_data = _get_table_data(session, table_name)
+        version = table_data.get("version", 0)
+        delete(table_data, where_clause, table_name=table_name)
+        _mark_written(session, table_name, table_data, version)
+
+    elif command == "set_engine":
+        if len(args) < 2:
+            print("Ошибка: укажите движок (python или numpy).")
+            return True
+
+        set_execution_engine(args[1])
+
+    elif command == "set_parallel":
+        if len(args) < 2:
+            print("Ошибка: укажите число процессов (1 - без параллельности).")
+            return True
+
+        try:
+            workers = int(args[1])
+            min_rows = int(args[2]) if len(args) > 2 else None
+        except ValueError:
+            print("Ошибка: число процессов и порог строк должны быть целыми.")
+            return True
+        set_parallel_workers(workers, min_rows)
+
+    elif command == "compact":
+        if len(args) < 2:
+            print("Ошибка: укажите имя таблицы.")
+            return True
 
-            where_idx = user_input.upper().index("WHERE")
-            where_str = user_input[where_idx + 5:].strip()
+        table_name = args[1]
+        if not table_exists(metadata, table_name):
+            print(f'Ошибка: Таблица "{table_name}" не существует.')
+            return True
 
+        release_table(session["pool"], table_name)
+        compact_table(table_name)
+        print(f'Журнал таблицы "{table_name}" слит с основным файлом.')
+
+    elif command == "vacuum":
+        if len(args) < 2:
+            print("Ошибка: укажите имя таблицы.")
+            return True
+
+        table_name = args[1]
+        if not table_exists(metadata, table_name):
+            print(f'Ошибка: Таблица "{table_name}" не существует.')
+            return True
+
+        release_table(session["pool"], table_name)
+        result = vacuum_table(table_name)
+        if result is None:
+            return True
+        if result["segments"] is None:
+            print(
+                f'Таблица "{table_name}" в колоночном формате переписана '
+                f"(удаленные записи в ней не хранятся)."
+            )
+        else:
+            before, after = result["segments"]
+            print(
+                f'Таблица "{table_name}" очищена: освобождено удаленных '
+                f'записей: {result["reclaimed"]}, сегментов: {before} -> {after}.'
+            )
+
+    elif command == "compress":
+        if len(args) < 3:
+            print("Ошибка: укажите имя таблицы и способ сжатия (gzip, zstd, none).")
+            return True
+
+        table_name, method = args[1], args[2]
+        if not table_exists(metadata, table_name):
+            print(f'Ошибка: Таблица "{table_name}" не существует.')
+            return True
+
+        release_table(session["pool"], table_name)
+        result = set_table_compression(table_name, method)
+        if result is None:
+            return True
+        before, after = result
+        print(
+            f'Сегменты таблицы "{table_name}" переписаны (сжатие {method}): '
+            f"{before} -> {after} байт."
+        )
+
+    elif command == "checkpoint":
+        flush_session(session)
+        print("Изменения сохранены на диск.")
+
+    elif command == "stats":
+        _stats_command(session, args[1:])
+
+    elif command == "buffer_pool":
+        if len(args) > 1:
             try:
-                where_clause = parse_where_clause(where_str)
-            except ValueError as e:
-                print(f"Ошибка парсинга WHERE: {e}")
-                continue
+                budget = int(args[1])
+            except ValueError:
+                print(f"Ошибка: некорректный размер пула: {args[1]}")
+                return True
+            set_budget(session["pool"], budget * 1024 * 1024)
+        stats = get_pool_stats(session["pool"])
+        budget = "без ограничения"
+        if stats["max_bytes"] is not None:
+            budget = f"{stats['max_bytes'] // 1024 // 1024} МБ"
+        print(
+            f"Пул буферов: {stats['bytes'] / 1024 / 1024:.1f} МБ из {budget}, "
+            f"попаданий {stats['hits']}, промахов {stats['misses']}, "
+            f"перечитано {stats['reloads']}, вытеснено {stats['evictions']}"
+        )
+        for name, table in stats["tables"].items():
+            state = "изменена" if table["dirty"] else "сохранена"
+            print(f"- {name}: {table['bytes'] / 1024 / 1024:.1f} МБ, {state}")
+
+    else:
+        print(f"Функции '{command}' нет. Попробуйте снова.")
+
+    return True
 
-            # Загружаем данные, удаляем и сохраняем
-            table_data = load_table_data(table_name)
-            table_data = delete(table_data, where_clause)
-            save_table_data(table_name, table_data)
+# Собирает метрики сеанса: задержки, счетчики, кэш select и пул буферов
+def get_stats_report(session):
+    report = metrics.get_metrics()
+    cache = get_select_cache_stats()
+    del cache["keys"]
+    pool = get_pool_stats(session["pool"])
+    del pool["tables"]
+    report["select_cache"] = cache
+    report["buffer_pool"] = pool
+    return report
 
+# Выводит метрики в консоль
+def _print_stats(report):
+    state = "включен" if report["enabled"] else "выключен"
+    print(f"Сбор метрик {state}.")
+    if report["operations"]:
+        print(
+            f"{'Операция':<18} {'вызовов':>8} {'p50, мс':>10} {'p95, мс':>10} "
+            f"{'p99, мс':>10} {'макс, мс':>10}"
+        )
+        for name, operation in report["operations"].items():
+            print(
+                f"{name:<18} {operation['count']:>8} "
+                + " ".join(
+                    f"{operation[key] * 1000:>10.3f}"
+                    for key in ("p50", "p95", "p99", "max")
+                )
+            )
+    for name, value in report["counters"].items():
+        print(f"- {name}: {value}")
+    for title, stats in (
+        ("Кэш select", report["select_cache"]),
+        ("Пул буферов", report["buffer_pool"]),
+    ):
+        print(
+            f"{title}: попаданий {stats['hits']}, промахов {stats['misses']} "
+            f"(доля попаданий {stats['hit_ratio']:.1%})"
+        )
+
+# Команда stats: вывод, выгрузка в JSON, сброс и включение метрик
+@handle_db_errors
+def _stats_command(session, options):
+    action = options[0] if options else None
+    if action is None:
+        _print_stats(get_stats_report(session))
+    elif action == "json":
+        report = json.dumps(get_stats_report(session), ensure_ascii=False, indent=4)
+        if len(options) > 1:
+            with open(options[1], "w", encoding=ENCODING) as file:
+                file.write(report + "\n")
+            print(f"Метрики сохранены в {options[1]}.")
         else:
-            print(f"Функции '{command}' нет. Попробуйте снова.")
\ No newline at end of file
+            print(report)
+    elif action == "reset":
+        metrics.reset()
+        print("Метрики сброшены.")
+    elif action in ("on", "off"):
+        metrics.set_enabled(action == "on")
+        print(f"Сбор метрик {'включен' if action == 'on' else 'выключен'}.")
+    else:
+        print(f"Ошибка: неизвестный параметр stats: {action}")
+
+# Перестраивает индексы таблицы, загруженной в пул, по метаданным
+def _rebuild_indexes(session, table_name):
+    table_data = peek_table(session["pool"], table_name)
+    if table_data is not None:
+        build_indexes(
+            table_data, get_index_definitions(session["metadata"], table_name)
+        )
+
+# Главный цикл работы программы
+def run() -> None:
+    session = new_session()
+
+    print("\n*** База данных запущена ***")
+    print_help()
+
+    while True:
+        try:
+            user_input = input("Введите команду: ").strip()
+        except (EOFError, KeyboardInterrupt):
+            print("\nВыход из программы...")
+            break
+
+        if not user_input:
+            continue
+
+        if not execute_command(session, user_input):
+            break
+
+    # Основные файлы таблиц, измененных через журнал, обновляем при выходе
+    close_session(session)
+
+# Пакетное выполнение команд из файла или потока ввода
+def run_batch(lines, checkpoint_every=None) -> None:
+    """
+    lines - итерируемый набор строк с командами (по одной на строку).
+    Пустые строки и комментарии (начинаются с "#" или "--") пропускаются.
+    Метаданные и таблицы загружаются один раз и переиспользуются между
+    командами. Изменения сразу пишутся в журналы таблиц, а основные
+    файлы обновляются в конце, каждые checkpoint_every команд и по
+    команде checkpoint.
+    """
+    session = new_session()
+    executed = 0
+    start_time = time.monotonic()
+
+    try:
+        for line in lines:
+            user_input = line.strip()
+            if not user_input or user_input.startswith(("#", "--")):
+                continue
+
+            try:
+                proceed = execute_command(session, user_input)
+            except ValueError as e:
+                # Например, незакрытая кавычка в команде
+                print(f"Ошибка разбора команды: {e}")
+                proceed = True
+            executed += 1
+            if not proceed:
+                break
+            if checkpoint_every and executed % checkpoint_every == 0:
+                flush_session(session)
+    finally:
+        close_session(session)
+
+    # Итог пишем в stderr, чтобы не смешивать его с выводом команд
+    elapsed = max(time.monotonic() - start_time, 1e-9)
+    print(
+        f"Выполнено команд: {executed} за {elapsed:.3f} с "
+        f"({executed / elapsed:.0f} команд/с)",
+        file=sys.stderr,
+    )
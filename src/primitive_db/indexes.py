@@ -0,0 +1,299 @@
+"""
+Индексы таблиц в памяти.
+
+Индексы хранятся в данных таблицы под служебным ключом "_indexes"
+и не сохраняются на диск: при загрузке они строятся заново по
+определениям из db_meta.json. Индекс по ID есть всегда.
+"""
+from bisect import bisect_left, bisect_right, insort
+
+INDEXES_KEY = "_indexes"
+PRIMARY_KEY = "ID"
+
+
+# Ключ сортировки: значения разных типов не сравниваются напрямую
+def _sort_key(value):
+    return (isinstance(value, str), value)
+
+# Создает пустой индекс указанного вида
+def _new_index(kind):
+    if kind == "sorted":
+        return {"kind": "sorted", "keys": []}
+    return {"kind": "hash", "map": {}}
+
+# Добавляет запись в один индекс
+def _index_add(index, column, record):
+    if column not in record:
+        return
+    value = record[column]
+    if index["kind"] == "sorted":
+        insort(index["keys"], (_sort_key(value), record[PRIMARY_KEY]))
+    else:
+        index["map"].setdefault(value, {})[record[PRIMARY_KEY]] = record
+
+# Удаляет запись из одного индекса по старому значению столбца
+def _index_remove(index, value, record_id):
+    if index["kind"] == "sorted":
+        keys = index["keys"]
+        key = (_sort_key(value), record_id)
+        position = bisect_left(keys, key)
+        if position < len(keys) and keys[position] == key:
+            del keys[position]
+    else:
+        bucket = index["map"].get(value)
+        if bucket is not None:
+            bucket.pop(record_id, None)
+            if not bucket:
+                del index["map"][value]
+
+# Строит индексы для загруженных данных таблицы
+def build_indexes(table_data, index_defs=None):
+    """
+    index_defs - словарь {столбец: вид индекса} из метаданных.
+    Первичный индекс по ID строится всегда.
+    """
+    records = table_data.get("records", [])
+    indexes = {PRIMARY_KEY: {record[PRIMARY_KEY]: record for record in records}}
+
+    for column, kind in (index_defs or {}).items():
+        index = _new_index(kind)
+        if kind == "sorted":
+            index["keys"] = sorted(
+                (_sort_key(record[column]), record[PRIMARY_KEY])
+                for record in records
+                if column in record
+            )
+        else:
+            for record in records:
+                _index_add(index, column, record)
+        indexes[column] = index
+
+    table_data[INDEXES_KEY] = indexes
+    return table_data
+
+# Добавляет новую запись во все индексы таблицы
+def add_to_indexes(table_data, record):
+    indexes = table_data.get(INDEXES_KEY)
+    if indexes is None:
+        return
+    indexes[PRIMARY_KEY][record[PRIMARY_KEY]] = record
+    for column, index in indexes.items():
+        if column != PRIMARY_KEY:
+            _index_add(index, column, record)
+
+# Обновляет индексы после изменения записи
+def update_in_indexes(table_data, record, old_values):
+    """
+    old_values - значения измененных столбцов до обновления.
+    """
+    indexes = table_data.get(INDEXES_KEY)
+    if indexes is None:
+        return
+    for column, old_value in old_values.items():
+        index = indexes.get(column)
+        if index is None or column == PRIMARY_KEY:
+            continue
+        _index_remove(index, old_value, record[PRIMARY_KEY])
+        _index_add(index, column, record)
+
+# Удаляет запись из всех индексов таблицы
+def remove_from_indexes(table_data, record):
+    indexes = table_data.get(INDEXES_KEY)
+    if indexes is None:
+        return
+    indexes[PRIMARY_KEY].pop(record[PRIMARY_KEY], None)
+    for column, index in indexes.items():
+        if column != PRIMARY_KEY and column in record:
+            _index_remove(index, record[column], record[PRIMARY_KEY])
+
+# Находит ID записей с заданным значением столбца по индексу
+def _lookup_ids(indexes, column, value):
+    if column == PRIMARY_KEY:
+        return [value] if value in indexes[PRIMARY_KEY] else []
+
+    index = indexes[column]
+    if index["kind"] == "sorted":
+        keys = index["keys"]
+        low = bisect_left(keys, (_sort_key(value),))
+        high = bisect_right(keys, (_sort_key(value), float("inf")))
+        return [record_id for _, record_id in keys[low:high]]
+    return list(index["map"].get(value, {}))
+
+# Находит ID записей из диапазона значений по сортированному индексу
+def _range_ids(index, bounds):
+    """
+    bounds - (нижняя, включительно, верхняя, включительно), None - без границы.
+    Значения другого типа (строки для чисел и наоборот) в диапазон
+    не попадают, как и при обычном сравнении.
+    """
+    low, low_inclusive, high, high_inclusive = bounds
+    sample = low if low is not None else high
+    rank = isinstance(sample, str)
+    keys = index["keys"]
+
+    if low is None:
+        start = bisect_left(keys, ((rank,),))
+    elif low_inclusive:
+        start = bisect_left(keys, (_sort_key(low),))
+    else:
+        start = bisect_right(keys, (_sort_key(low), float("inf")))
+
+    if high is None:
+        end = bisect_left(keys, ((rank + 1,),))
+    elif high_inclusive:
+        end = bisect_right(keys, (_sort_key(high), float("inf")))
+    else:
+        end = bisect_left(keys, (_sort_key(high),))
+
+    return [record_id for _, record_id in keys[start:end]]
+
+# Выбирает записи диапазона ID: записи таблицы упорядочены по ID
+def _primary_range(records, bounds):
+    low, low_inclusive, high, high_inclusive = bounds
+    if isinstance(low, str) or isinstance(high, str):
+        return []
+
+    def record_id(record):
+        return record[PRIMARY_KEY]
+
+    start = 0
+    end = len(records)
+    if low is not None:
+        bisect = bisect_left if low_inclusive else bisect_right
+        start = bisect(records, low, key=record_id)
+    if high is not None:
+        bisect = bisect_right if high_inclusive else bisect_left
+        end = bisect(records, high, key=record_id)
+    return records[start:end]
+
+# Порядок предпочтения индексов: первичный, хэш, сортированный
+def _index_rank(indexes, column):
+    return (column != PRIMARY_KEY, indexes[column].get("kind") != "hash")
+
+# Выбирает способ поиска записей по индексу для условия WHERE
+def choose_access_path(table_data, where):
+    """
+    where - скомпилированное условие (planner.Where).
+    Возвращает (вид, столбец): "eq" - равенство, "in" - список IN,
+    "range" - диапазон, ("none", None) - условие невыполнимо и записи
+    искать не нужно; или None, если индекс не поможет.
+    """
+    if where.unsatisfiable:
+        return "none", None
+    indexes = table_data.get(INDEXES_KEY)
+    if not indexes or where.ast is None:
+        return None
+
+    for kind, conditions in (("eq", where.equalities), ("in", where.in_lists)):
+        columns = sorted(
+            (column for column in conditions if column in indexes),
+            key=lambda column: _index_rank(indexes, column),
+        )
+        if columns:
+            return kind, columns[0]
+
+    for column in where.ranges:
+        if column == PRIMARY_KEY or indexes.get(column, {}).get("kind") == "sorted":
+            return "range", column
+    return None
+
+# Выбирает записи-кандидаты по индексу для условия WHERE
+def find_candidates(table_data, where):
+    """
+    where - скомпилированное условие (planner.Where).
+    Возвращает список записей (в порядке ID), среди которых точно
+    находятся все подходящие под условие, или None, если индекс
+    не применим. Кандидаты все равно нужно проверить полным условием.
+    """
+    path = choose_access_path(table_data, where)
+    if path is None:
+        return None
+
+    kind, column = path
+    if kind == "none":
+        return []
+    indexes = table_data[INDEXES_KEY]
+    if kind == "range" and column == PRIMARY_KEY:
+        return _primary_range(table_data.get("records", []), where.ranges[column])
+
+    try:
+        if kind == "eq":
+            ids = _lookup_ids(indexes, column, where.equalities[column])
+        elif kind == "in":
+            ids = set()
+            for value in where.in_lists[column]:
+                ids.update(_lookup_ids(indexes, column, value))
+        else:
+            ids = _range_ids(indexes[column], where.ranges[column])
+    except TypeError:
+        # Значение нехэшируемо или несравнимо - индекс не поможет
+        return None
+
+    by_id = indexes[PRIMARY_KEY]
+    return [by_id[record_id] for record_id in sorted(ids) if record_id in by_id]
+
+# Считает записи, подходящие под условие, только по индексу
+def count_by_index(table_data, where):
+    """
+    Ответ точный, если всё условие - одно сравнение или IN по столбцу
+    с индексом: тогда записи не перебираются и не проверяются.
+    Иначе возвращает None.
+    """
+    path = choose_access_path(table_data, where)
+    if path is not None and path[0] == "none":
+        return 0
+    if path is None or where.ast[0] not in ("cmp", "in"):
+        return None
+
+    kind, column = path
+    indexes = table_data[INDEXES_KEY]
+    try:
+        if kind == "range" and column == PRIMARY_KEY:
+            records = table_data.get("records", [])
+            return len(_primary_range(records, where.ranges[column]))
+        if kind == "eq":
+            return len(_lookup_ids(indexes, column, where.equalities[column]))
+        if kind == "in":
+            ids = set()
+            for value in where.in_lists[column]:
+                ids.update(_lookup_ids(indexes, column, value))
+            return len(ids)
+        return len(_range_ids(indexes[column], where.ranges[column]))
+    except TypeError:
+        return None
+
+# ID записей сортированного индекса по убыванию значений
+def _descending_ids(keys):
+    """
+    Записи с равными значениями идут по возрастанию ID - так же, как
+    при сортировке по убыванию с сохранением порядка.
+    """
+    position = len(keys)
+    while position > 0:
+        start = bisect_left(keys, (keys[position - 1][0],))
+        for _, record_id in keys[start:position]:
+            yield record_id
+        position = start
+
+# Перебирает записи в порядке столбца по индексу, без сортировки
+def iter_in_order(table_data, column, descending=False):
+    """
+    Порядок по ID дает сам список записей, по другому столбцу -
+    сортированный индекс. Возвращает итератор записей или None,
+    если подходящего индекса нет.
+    """
+    if column == PRIMARY_KEY:
+        records = table_data.get("records", [])
+        return reversed(records) if descending else iter(records)
+
+    indexes = table_data.get(INDEXES_KEY) or {}
+    index = indexes.get(column)
+    if index is None or index["kind"] != "sorted":
+        return None
+    keys = index["keys"]
+    if descending:
+        ids = _descending_ids(keys)
+    else:
+        ids = (record_id for _, record_id in keys)
+    by_id = indexes[PRIMARY_KEY]
+    return (by_id[record_id] for record_id in ids if record_id in by_id)
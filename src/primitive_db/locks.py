@@ -0,0 +1,113 @@
+"""
+Межпроцессные блокировки файлов базы (fcntl.flock).
+
+Блокировка берется не на сам файл, а на соседний <путь>.lock: основные
+файлы таблиц заменяются переименованием, и блокировка на них пропадала бы
+вместе со старой версией файла. Писатели берут исключительную блокировку,
+читатели обычно обходятся без неё (см. чтение снимков в utils) и берут
+разделяемую, только если снимок не удалось прочитать.
+
+flock привязан к открытому файлу, поэтому повторный захват той же
+блокировки в том же потоке через новый open() заблокировал бы сам себя.
+Вложенные захваты только увеличивают счетчик. На платформах без fcntl
+блокировки ничего не делают.
+
+Владелец блокировки - поток, если не задан другой (lock_owner):
+транзакция держит блокировки таблиц между командами, которые в серверном
+режиме выполняются в разных потоках.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows - межпроцессных блокировок нет
+    fcntl = None
+
+LOCK_SUFFIX = ".lock"
+
+# Захваченные блокировки: (путь, владелец) -> [файл, глубина, разделяемая]
+_held = {}
+
+# Владелец блокировок, заданный для текущего потока
+_owner = threading.local()
+
+# Интервал повторных попыток захвата блокировки с ограничением времени
+_RETRY_INTERVAL = 0.01
+
+
+# Задает владельца блокировок текущего потока на время блока with
+@contextmanager
+def lock_owner(owner):
+    previous = getattr(_owner, "value", None)
+    _owner.value = owner
+    try:
+        yield
+    finally:
+        _owner.value = previous
+
+# Текущий владелец блокировок: заданный lock_owner или сам поток
+def _current_owner():
+    owner = getattr(_owner, "value", None)
+    return threading.get_ident() if owner is None else owner
+
+# Захватывает flock, ожидая не дольше timeout секунд (None - без ограничения)
+def _flock(lock_file, operation, timeout):
+    if timeout is None:
+        fcntl.flock(lock_file, operation)
+        return
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            fcntl.flock(lock_file, operation | fcntl.LOCK_NB)
+            return
+        except BlockingIOError:
+            if time.monotonic() >= deadline:
+                raise TimeoutError("блокировка занята другим процессом") from None
+            time.sleep(_RETRY_INTERVAL)
+
+
+# Захватывает блокировку файла на время блока with
+@contextmanager
+def file_lock(path, shared=False, timeout=None):
+    """
+    path - путь защищаемого файла (блокируется path + ".lock").
+    shared=True - разделяемая блокировка для чтения.
+    timeout - сколько секунд ждать блокировку (по истечении - TimeoutError).
+    """
+    if fcntl is None:
+        yield
+        return
+
+    key = (path, _current_owner())
+    held = _held.get(key)
+    if held is not None:
+        # Уже держим: при необходимости повышаем разделяемую до исключительной
+        if held[2] and not shared:
+            _flock(held[0], fcntl.LOCK_EX, timeout)
+            held[2] = False
+            upgraded = True
+        else:
+            upgraded = False
+        held[1] += 1
+        try:
+            yield
+        finally:
+            held[1] -= 1
+            if upgraded:
+                fcntl.flock(held[0], fcntl.LOCK_SH)
+                held[2] = True
+        return
+
+    lock_file = open(path + LOCK_SUFFIX, "a+b")
+    try:
+        _flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX, timeout)
+        _held[key] = [lock_file, 1, shared]
+        try:
+            yield
+        finally:
+            del _held[key]
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+    finally:
+        lock_file.close()
@@ -1,10 +1,112 @@
 #!/usr/bin/env python3
-from primitive_db.engine import run
+import argparse
+import sys
 
+from primitive_db.constants import ENCODING, SERVER_SOCKET, SERVER_WORKERS
+from primitive_db.decorators import set_confirmation_mode
+from primitive_db.engine import run, run_batch
+from primitive_db.server import serve
+
+
+# Разбор аргументов командной строки
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="database",
+        description="Примитивная консольная база данных.",
+    )
+    parser.add_argument(
+        "mode",
+        nargs="?",
+        choices=["serve"],
+        help="serve - запустить сервер для клиентов по сокету или TCP",
+    )
+    parser.add_argument(
+        "-f",
+        "--file",
+        help="выполнить команды из файла ('-' - из стандартного ввода)",
+    )
+    parser.add_argument(
+        "-y",
+        "--yes",
+        action="store_true",
+        help="подтверждать удаления без вопросов",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        type=int,
+        metavar="N",
+        help="в пакетном режиме сохранять изменения каждые N команд",
+    )
+    parser.add_argument(
+        "--socket",
+        metavar="PATH",
+        help=f"Unix-сокет сервера (по умолчанию {SERVER_SOCKET})",
+    )
+    parser.add_argument(
+        "--host",
+        help="адрес TCP-сервера (по умолчанию 127.0.0.1)",
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        help="слушать TCP-порт вместо Unix-сокета",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=SERVER_WORKERS,
+        help="число потоков сервера для выполнения команд",
+    )
+    args = parser.parse_args(argv)
+    if args.checkpoint is not None and args.checkpoint < 1:
+        parser.error("--checkpoint должен быть положительным числом")
+    if args.mode == "serve" and args.file is not None:
+        parser.error("serve нельзя сочетать с --file")
+    if args.mode != "serve" and (args.socket or args.host or args.port):
+        parser.error("--socket, --host и --port используются только с serve")
+    if args.workers < 1:
+        parser.error("--workers должен быть положительным числом")
+    return args
 
 # Запуск БД
 def main() -> None:
-    run()
+    args = _parse_args()
+
+    # Серверный режим: подтверждения спросить не у кого
+    if args.mode == "serve":
+        set_confirmation_mode("yes" if args.yes else "no")
+        try:
+            serve(args.socket, args.host, args.port, args.workers)
+        except OSError as e:
+            print(f"Ошибка: не удалось запустить сервер - {e}", file=sys.stderr)
+            sys.exit(1)
+        return
+
+    # Без файла и с терминалом на входе - обычный интерактивный режим
+    if args.file is None and sys.stdin.isatty():
+        if args.yes:
+            set_confirmation_mode("yes")
+        run()
+        return
+
+    # Пакетный режим: спросить подтверждение можно, только если
+    # команды читаются из файла, а ввод остался за терминалом
+    from_stdin = args.file in (None, "-")
+    if args.yes:
+        set_confirmation_mode("yes")
+    elif from_stdin or not sys.stdin.isatty():
+        set_confirmation_mode("no")
+
+    if from_stdin:
+        run_batch(sys.stdin, args.checkpoint)
+        return
+    try:
+        script = open(args.file, encoding=ENCODING)
+    except OSError as e:
+        print(f"Ошибка: не удалось открыть файл - {e}", file=sys.stderr)
+        sys.exit(1)
+    with script:
+        run_batch(script, args.checkpoint)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,216 @@
+"""
+Метрики производительности: задержки операций и счетчики.
+
+Задержки копятся в гистограммах с логарифмическими корзинами (шаг
+2 ** (1/8), около 9%), поэтому память не растет с числом вызовов,
+а перцентили p50/p95/p99 вычисляются с точностью до корзины.
+Счетчики:
+
+- rows_scanned - строки, проверенные условием WHERE (для колоночного
+  файла - все строки просмотренного файла);
+- rows_returned - строки, которые вернул select;
+- bytes_read / bytes_written - байты, прочитанные при загрузке таблиц
+  (основной файл и журнал) и записанные в основные файлы и журналы;
+- cache_clears - очистки кэша select (например, при ROLLBACK).
+
+Выключенные метрики (set_enabled(False)) стоят одной проверки флага
+на вызов.
+
+Профилирование (EXPLAIN ANALYZE): внутри блока profile() участки кода,
+размеченные stage(), записывают свое время и число строк в список
+этапов текущего потока. Вне профилирования stage() возвращает общий
+пустой объект и ничего не замеряет.
+"""
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+from primitive_db.constants import METRICS_ENABLED
+
+# Корзин гистограммы на каждое удвоение задержки и нижняя граница
+_BUCKETS_PER_DOUBLING = 8
+_MIN_LATENCY = 1e-6
+
+_settings = {"enabled": METRICS_ENABLED}
+_histograms = {}
+_counters = {}
+_lock = threading.Lock()
+
+# Этапы профилируемого запроса текущего потока
+_profile = threading.local()
+
+
+class _Stage:
+    """Замер одного этапа профилируемого запроса"""
+
+    __slots__ = ("entry", "start")
+
+    def __init__(self, stages, name):
+        # Этап добавляется при входе, чтобы вложенные шли после внешнего
+        self.entry = {
+            "stage": name,
+            "depth": _profile.depth,
+            "seconds": None,
+            "rows": None,
+        }
+        stages.append(self.entry)
+
+    def __enter__(self):
+        _profile.depth += 1
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.entry["seconds"] = time.perf_counter() - self.start
+        _profile.depth -= 1
+        return False
+
+    def set_rows(self, rows):
+        self.entry["rows"] = rows
+
+
+class _NoStage:
+    """Этап вне профилирования: ничего не замеряет"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set_rows(self, rows):
+        pass
+
+
+_NO_STAGE = _NoStage()
+
+
+# Включает или выключает сбор метрик
+def set_enabled(enabled):
+    _settings["enabled"] = bool(enabled)
+
+# Проверяет, собираются ли метрики
+def is_enabled():
+    return _settings["enabled"]
+
+# Номер корзины гистограммы для задержки в секундах
+def _bucket(seconds):
+    if seconds <= _MIN_LATENCY:
+        return 0
+    return int(math.log2(seconds / _MIN_LATENCY) * _BUCKETS_PER_DOUBLING) + 1
+
+# Верхняя граница корзины в секундах
+def _bucket_bound(index):
+    return _MIN_LATENCY * 2 ** (index / _BUCKETS_PER_DOUBLING)
+
+# Записывает задержку операции
+def record_latency(name, seconds):
+    if not _settings["enabled"]:
+        return
+    index = _bucket(seconds)
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = {
+                "count": 0,
+                "total": 0.0,
+                "max": 0.0,
+                "buckets": {},
+            }
+        histogram["count"] += 1
+        histogram["total"] += seconds
+        histogram["max"] = max(histogram["max"], seconds)
+        histogram["buckets"][index] = histogram["buckets"].get(index, 0) + 1
+
+# Увеличивает счетчик
+def increment(name, amount=1):
+    if not _settings["enabled"]:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+# Считает строки, прошедшие через итератор, в счетчик name
+def count_rows(name, iterable):
+    """
+    Счетчик увеличивается один раз, когда перебор закончен или прерван.
+    При выключенных метриках итератор возвращается как есть.
+    """
+    if not _settings["enabled"]:
+        return iterable
+    return _count_rows(name, iterable)
+
+def _count_rows(name, iterable):
+    count = 0
+    try:
+        for item in iterable:
+            count += 1
+            yield item
+    finally:
+        increment(name, count)
+
+# Перцентиль гистограммы (верхняя граница корзины, не больше максимума)
+def _percentile(histogram, fraction):
+    rank = fraction * histogram["count"]
+    seen = 0
+    for index in sorted(histogram["buckets"]):
+        seen += histogram["buckets"][index]
+        if seen >= rank:
+            return min(_bucket_bound(index), histogram["max"])
+    return histogram["max"]
+
+# Снимок метрик: задержки операций (в секундах) и счетчики
+def get_metrics():
+    with _lock:
+        operations = {
+            name: {
+                "count": histogram["count"],
+                "mean": histogram["total"] / histogram["count"],
+                "p50": _percentile(histogram, 0.50),
+                "p95": _percentile(histogram, 0.95),
+                "p99": _percentile(histogram, 0.99),
+                "max": histogram["max"],
+            }
+            for name, histogram in sorted(_histograms.items())
+        }
+        counters = dict(sorted(_counters.items()))
+    return {
+        "enabled": _settings["enabled"],
+        "operations": operations,
+        "counters": counters,
+    }
+
+# Профилирует блок: возвращает список этапов, выполненных в нем
+@contextmanager
+def profile():
+    """
+    Этапы - словари {"stage", "depth", "seconds", "rows"} в порядке
+    начала; depth - вложенность этапа.
+    """
+    previous = getattr(_profile, "stages", None), getattr(_profile, "depth", 0)
+    stages = _profile.stages = []
+    _profile.depth = 0
+    try:
+        yield stages
+    finally:
+        _profile.stages, _profile.depth = previous
+
+# Этап профилируемого запроса (контекстный менеджер)
+def stage(name):
+    """
+    with stage("фильтрация") as current:
+        ...
+        current.set_rows(len(records))
+    """
+    stages = getattr(_profile, "stages", None)
+    if stages is None:
+        return _NO_STAGE
+    return _Stage(stages, name)
+
+# Сбрасывает накопленные метрики
+def reset():
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
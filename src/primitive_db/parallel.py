@@ -0,0 +1,282 @@
+"""
+Параллельный просмотр больших таблиц в нескольких процессах.
+
+Таблица делится на части, и условие WHERE проверяется в процессах
+ProcessPoolExecutor. Результаты частей собираются в исходном порядке,
+то есть в порядке ID.
+
+- Таблица в памяти: процессам передаются не записи целиком, а только
+  значения столбцов из условия. Процесс проверяет условие по столбцам
+  и возвращает номера подходящих строк, а записи по ним выбирает
+  вызывающая сторона. Это те же объекты, что в таблице, поэтому так
+  можно отбирать записи и для update/delete.
+- Колоночный файл: процесс сам отображает файл в память и
+  просматривает свой диапазон строк, возвращая готовые записи.
+
+Параллельный просмотр включается командой set_parallel (по умолчанию
+выключен) и только для таблиц от min_rows строк: на маленьких
+таблицах передача данных между процессами дороже самой проверки.
+"""
+import multiprocessing
+import operator
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from primitive_db.columnar import iter_scan_table, read_header
+from primitive_db.constants import (
+    PARALLEL_CHUNKS_PER_WORKER,
+    PARALLEL_MIN_ROWS,
+    PARALLEL_WORKERS,
+)
+from primitive_db.planner import compile_where
+
+_OPERATORS = {
+    "=": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+# Минимальный размер части: мельче передача дороже проверки
+_MIN_CHUNK_ROWS = 10_000
+
+# Настройки параллельного просмотра и пул процессов
+_settings = {"workers": PARALLEL_WORKERS, "min_rows": PARALLEL_MIN_ROWS}
+_executor = {"pool": None, "workers": 0}
+_executor_lock = threading.Lock()
+
+
+class _Absent:
+    """
+    Отметка об отсутствии поля в записи. Передается между процессами
+    как ссылка на класс, поэтому остается тем же объектом.
+    """
+
+
+# Изменяет число процессов и порог размера таблицы
+def set_parallelism(workers=None, min_rows=None):
+    """
+    workers - число процессов (1 - без параллельности, 0 - по числу ядер).
+    Возвращает новые настройки.
+    """
+    if workers is not None:
+        if workers < 0:
+            raise ValueError("число процессов не может быть отрицательным")
+        _settings["workers"] = workers or os.cpu_count() or 1
+    if min_rows is not None:
+        if min_rows < 0:
+            raise ValueError("порог числа строк не может быть отрицательным")
+        _settings["min_rows"] = min_rows
+    return get_parallelism()
+
+# Текущие настройки параллельного просмотра
+def get_parallelism():
+    return dict(_settings)
+
+# Проверяет, стоит ли просматривать таблицу из rows строк параллельно
+def use_parallel(rows):
+    return _settings["workers"] > 1 and rows >= _settings["min_rows"]
+
+# Возвращает пул процессов, создавая его при первом обращении
+def _get_executor():
+    """
+    Пул переиспользуется между запросами и пересоздается при смене числа
+    процессов. Процессы запускаются через forkserver (или spawn), а не
+    fork: в серверном режиме работают потоки, и копировать их состояние
+    в дочерний процесс небезопасно.
+    """
+    with _executor_lock:
+        workers = _settings["workers"]
+        if _executor["pool"] is None or _executor["workers"] != workers:
+            if _executor["pool"] is not None:
+                _executor["pool"].shutdown(wait=False, cancel_futures=True)
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context(
+                "forkserver" if "forkserver" in methods else "spawn"
+            )
+            _executor["pool"] = ProcessPoolExecutor(workers, mp_context=context)
+            _executor["workers"] = workers
+        return _executor["pool"]
+
+# Закрывает пул процессов после сбоя (следующий запрос создаст новый)
+def _reset_executor(pool):
+    with _executor_lock:
+        if _executor["pool"] is pool:
+            _executor["pool"] = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+# Делит rows строк на части: список границ (начало, конец)
+def _chunks(rows):
+    count = _settings["workers"] * PARALLEL_CHUNKS_PER_WORKER
+    size = max(-(-rows // count), _MIN_CHUNK_ROWS)
+    return [(start, min(start + size, rows)) for start in range(0, rows, size)]
+
+# Собирает имена столбцов, которые используются в дереве условия
+def _condition_columns(node, names):
+    if node[0] in ("and", "or"):
+        for child in node[1]:
+            _condition_columns(child, names)
+    else:
+        names.add(node[1])
+    return names
+
+# Сравнение с семантикой обычного перебора: отсутствие поля и значения
+# несравнимых типов дают False
+def _safe_compare(compare, item, value):
+    if item is _Absent:
+        return False
+    try:
+        return compare(item, value)
+    except TypeError:
+        return False
+
+# Маска строк для узла дерева условия по спискам значений столбцов
+def _node_mask(node, columns):
+    kind = node[0]
+    if kind in ("and", "or"):
+        masks = [_node_mask(child, columns) for child in node[1]]
+        combine = all if kind == "and" else any
+        return [combine(flags) for flags in zip(*masks)]
+
+    column = columns[node[1]]
+    if kind == "in":
+        values = frozenset(node[2])
+        return [item in values for item in column]
+
+    _, _, op, value = node
+    if op == "=":
+        # Отметка _Absent не равна никакому значению
+        return [item == value for item in column]
+    compare = _OPERATORS[op]
+    if not any(item is _Absent for item in column):
+        try:
+            return [compare(item, value) for item in column]
+        except TypeError:
+            pass
+    return [_safe_compare(compare, item, value) for item in column]
+
+# Проверяет условие на части таблицы (выполняется в процессе пула)
+def _match_chunk(ast, columns, start):
+    """
+    columns - {столбец: список значений строк части}.
+    Возвращает номера подходящих строк в таблице.
+    """
+    mask = _node_mask(ast, columns)
+    return [start + offset for offset, flag in enumerate(mask) if flag]
+
+# Номера записей таблицы в памяти, подходящих под условие
+def match_positions(records, where):
+    """
+    where - скомпилированное условие (planner.Where).
+    Возвращает номера в порядке записей или None, если пул процессов
+    недоступен (тогда вызывающая сторона проверяет записи сама).
+    """
+    if where.ast is None:
+        return list(range(len(records)))
+    names = _condition_columns(where.ast, set())
+    pool = _get_executor()
+    futures = []
+    try:
+        for start, stop in _chunks(len(records)):
+            part = records[start:stop]
+            columns = {
+                name: [record.get(name, _Absent) for record in part]
+                for name in names
+            }
+            futures.append(pool.submit(_match_chunk, where.ast, columns, start))
+        positions = []
+        for future in futures:
+            positions.extend(future.result())
+        return positions
+    except (BrokenProcessPool, OSError):
+        _reset_executor(pool)
+        return None
+
+# Просматривает часть колоночного файла (выполняется в процессе пула)
+def _scan_file_chunk(path, identity, ast, skip_ids, start, stop, fields):
+    """
+    identity - (устройство, inode) файла снимка: если файл по этому пути
+    уже заменен новой версией, возвращается None.
+    """
+    with open(path, "rb") as file:
+        stat = os.fstat(file.fileno())
+        if (stat.st_dev, stat.st_ino) != identity:
+            return None
+        return list(
+            iter_scan_table(file, compile_where(ast), skip_ids, start, stop, fields)
+        )
+
+# Проверяет, стоит ли просматривать колоночный файл по частям
+def _is_full_scan(where):
+    """
+    Условия по ID и равенства отбирают строки-кандидаты без полного
+    просмотра - их быстрее проверить в одном процессе. Без условия
+    проверять нечего, а передача всех записей между процессами дороже
+    их чтения.
+    """
+    return where.ast is not None and not (
+        where.equalities or "ID" in where.in_lists or "ID" in where.ranges
+    )
+
+# Проверяет, будет ли колоночный файл из rows строк просмотрен по частям
+def plans_parallel_scan(rows, where):
+    return use_parallel(rows) and _is_full_scan(where)
+
+# Выборка из открытого колоночного файла, по частям в процессах пула
+def scan_file(file, where, skip_ids=(), fields=None):
+    """
+    file - открытый файл снимка таблицы; аргументы как у
+    columnar.iter_scan_table. Генератор записей в порядке ID. Если
+    таблица мала или процесс не смог прочитать тот же снимок, часть
+    просматривается в текущем процессе.
+    """
+    file.seek(0)
+    rows = read_header(file)["rows"]
+    if not plans_parallel_scan(rows, where):
+        yield from iter_scan_table(file, where, skip_ids, fields=fields)
+        return
+
+    stat = os.fstat(file.fileno())
+    identity = (stat.st_dev, stat.st_ino)
+    skip_ids = frozenset(skip_ids)
+    pool = _get_executor()
+    chunks = _chunks(rows)
+    try:
+        futures = [
+            pool.submit(
+                _scan_file_chunk,
+                file.name,
+                identity,
+                where.ast,
+                skip_ids,
+                *chunk,
+                fields,
+            )
+            for chunk in chunks
+        ]
+    except BrokenProcessPool:
+        _reset_executor(pool)
+        futures = [None] * len(chunks)
+
+    try:
+        for future, (start, stop) in zip(futures, chunks):
+            records = None
+            if future is not None:
+                try:
+                    records = future.result()
+                except (BrokenProcessPool, OSError):
+                    _reset_executor(pool)
+            if records is None:
+                records = iter_scan_table(
+                    file, where, skip_ids, start, stop, fields
+                )
+            yield from records
+    finally:
+        # Перебор прерван (например, LIMIT набран) - оставшиеся части не нужны
+        for future in futures:
+            if future is not None:
+                future.cancel()
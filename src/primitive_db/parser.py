@@ -1,5 +1,7 @@
 import re
 
+from primitive_db.constants import AGGREGATE_FUNCTIONS, OUTPUT_FORMATS
+
 
 # Парсит строковое значение в правильный тип данных
 def _parse_value(value_str):
@@ -24,55 +26,325 @@ def _parse_value(value_str):
     # Если ничего не подошло, возвращаем как строку
     return value_str
 
-# Парсит WHERE условие в словарь
+# Лексемы условия WHERE: строки в кавычках, операторы, скобки и слова
+_WHERE_TOKEN_RE = re.compile(r"""
+    (?P<string>"[^"]*"|'[^']*')
+    |(?P<op><=|>=|!=|<>|=|<|>)
+    |(?P<punct>[(),])
+    |(?P<word>[^\s(),=<>!'"]+)
+    |(?P<space>\s+)
+""", re.VERBOSE)
+
+# Разбивает условие WHERE на лексемы (вид, текст)
+def _tokenize_where(where_str):
+    tokens = []
+    position = 0
+    while position < len(where_str):
+        match = _WHERE_TOKEN_RE.match(where_str, position)
+        if match is None:
+            raise ValueError(
+                f"Некорректный символ в условии: {where_str[position:]}"
+            )
+        if match.lastgroup != "space":
+            tokens.append((match.lastgroup, match.group()))
+        position = match.end()
+    return tokens
+
+# Проверяет, что лексема - ключевое слово (без учета регистра)
+def _is_keyword(token, keyword):
+    return token is not None and token[0] == "word" and token[1].upper() == keyword
+
+# Разбор выражения: or_expr := and_expr (OR and_expr)*
+def _parse_or(tokens, position):
+    node, position = _parse_and(tokens, position)
+    children = [node]
+    while position < len(tokens) and _is_keyword(tokens[position], "OR"):
+        node, position = _parse_and(tokens, position + 1)
+        children.append(node)
+    if len(children) == 1:
+        return children[0], position
+    return ("or", tuple(children)), position
+
+# Разбор конъюнкции: and_expr := term (AND term)*
+def _parse_and(tokens, position):
+    node, position = _parse_term(tokens, position)
+    children = [node]
+    while position < len(tokens) and _is_keyword(tokens[position], "AND"):
+        node, position = _parse_term(tokens, position + 1)
+        children.append(node)
+    if len(children) == 1:
+        return children[0], position
+    return ("and", tuple(children)), position
+
+# Возвращает лексему или сообщает о неожиданном конце условия
+def _expect_token(tokens, position):
+    if position >= len(tokens):
+        raise ValueError("Неожиданный конец условия")
+    return tokens[position]
+
+# Разбор значения: строка в кавычках или слово
+def _parse_literal(tokens, position):
+    kind, text = _expect_token(tokens, position)
+    if kind not in ("string", "word"):
+        raise ValueError(f"Ожидается значение, получено: {text}")
+    return _parse_value(text), position + 1
+
+# Разбор элемента: (выражение) | поле оператор значение | поле IN (значения)
+def _parse_term(tokens, position):
+    kind, text = _expect_token(tokens, position)
+    if (kind, text) == ("punct", "("):
+        node, position = _parse_or(tokens, position + 1)
+        if _expect_token(tokens, position) != ("punct", ")"):
+            raise ValueError("Ожидается закрывающая скобка")
+        return node, position + 1
+
+    if kind != "word":
+        raise ValueError(f"Ожидается имя поля, получено: {text}")
+    column = text
+    operator_token = _expect_token(tokens, position + 1)
+
+    if _is_keyword(operator_token, "IN"):
+        position += 2
+        if _expect_token(tokens, position) != ("punct", "("):
+            raise ValueError("После IN ожидается список значений в скобках")
+        values = []
+        while True:
+            value, position = _parse_literal(tokens, position + 1)
+            values.append(value)
+            separator = _expect_token(tokens, position)
+            if separator == ("punct", ")"):
+                return ("in", column, tuple(values)), position + 1
+            if separator != ("punct", ","):
+                raise ValueError(f"Ожидается ',' или ')', получено: {separator[1]}")
+
+    if operator_token[0] != "op":
+        raise ValueError(
+            f"Некорректное условие для поля {column}. "
+            f"Ожидается формат 'поле оператор значение'"
+        )
+    operator = "!=" if operator_token[1] == "<>" else operator_token[1]
+    value, position = _parse_literal(tokens, position + 2)
+    return ("cmp", column, operator, value), position
+
+# Парсит WHERE условие в дерево разбора
 def parse_where_clause(where_str):
 
     """
-    Парсит WHERE условие вида "age = 28 AND name = 'John'"
-    в словарь {'age': 28, 'name': 'John'}
+    Парсит WHERE условие вида "age >= 18 AND (name = 'John' OR ID IN (1, 2))"
+    в дерево из кортежей:
+    - ("cmp", поле, оператор, значение) - операторы =, !=, <>, <, <=, >, >=
+    - ("in", поле, (значение1, значение2, ...))
+    - ("and", (условие1, условие2, ...)) и ("or", (...))
 
-    Поддерживает:
-    - Несколько условий через AND
-    - Строковые значения в одинарных или двойных кавычках
-    - Числовые значения (int)
-    - Булевы значения (true/false)
+    AND связывает сильнее OR, порядок можно задать скобками.
+    Значения разбираются так же, как раньше: строки в кавычках,
+    числа (int) и булевы значения (true/false).
 
     Примеры:
-    - "ID = 1" -> {'ID': 1}
-    - "name = 'John'" -> {'name': 'John'}
-    - "age = 28 AND active = true" -> {'age': 28, 'active': True}
+    - "ID = 1" -> ('cmp', 'ID', '=', 1)
+    - "age > 28 AND active = true"
+      -> ('and', (('cmp', 'age', '>', 28), ('cmp', 'active', '=', True)))
+    - "name IN ('John', 'Jane')" -> ('in', 'name', ('John', 'Jane'))
+
+    Пустое условие возвращает None.
     """
     if not where_str or not where_str.strip():
-        return {}
+        return None
 
-    result = {}
+    tokens = _tokenize_where(where_str.strip())
+    node, position = _parse_or(tokens, 0)
+    if position != len(tokens):
+        raise ValueError(f"Лишняя часть условия: {tokens[position][1]}")
+    return node
 
-    # Разделяем по AND (case-insensitive)
-    conditions = re.split(r'\s+AND\s+', where_str.strip(), flags=re.IGNORECASE)
+# Ключевые слова, которые начинают части команды select
+_SELECT_CLAUSES = (
+    "FROM",
+    "WHERE",
+    "GROUP",
+    "ORDER",
+    "LIMIT",
+    "OFFSET",
+    "FORMAT",
+)
 
-    for condition in conditions:
-        condition = condition.strip()
+# Элемент списка столбцов select: агрегатная функция или столбец
+_AGGREGATE_RE = re.compile(r"(\w+)\s*\(\s*(\*|\w+)\s*\)")
+_COLUMN_RE = re.compile(r"\w+")
 
-        # Ищем знак равенства
-        if '=' not in condition:
-            raise ValueError(
-                f"Некорректное условие: {condition}. "
-                f"Ожидается формат 'поле = значение'"
-            )
+# Делит текст команды на части по ключевым словам вне кавычек
+def _split_clauses(text, keywords):
+    """
+    Возвращает (текст до первого ключевого слова, {ключевое слово: текст}).
+    Каждое ключевое слово может встретиться только один раз.
+    """
+    starts = []
+    position = 0
+    while position < len(text):
+        match = _WHERE_TOKEN_RE.match(text, position)
+        if match is None:
+            # Некорректные символы оставляем разбору самой части
+            position += 1
+            continue
+        word = match.group().upper()
+        if match.lastgroup == "word" and word in keywords:
+            if any(keyword == word for keyword, _, _ in starts):
+                raise ValueError(f"{word} указан несколько раз")
+            starts.append((word, match.start(), match.end()))
+        position = match.end()
 
-        # Разделяем по знаку равенства
-        parts = condition.split('=', 1)
-        if len(parts) != 2:
-            raise ValueError(f"Некорректное условие: {condition}")
+    head_end = starts[0][1] if starts else len(text)
+    clauses = {}
+    for number, (keyword, _, end) in enumerate(starts):
+        next_start = starts[number + 1][1] if number + 1 < len(starts) else len(text)
+        clauses[keyword] = text[end:next_start].strip()
+    return text[:head_end].strip(), clauses
 
-        key = parts[0].strip()
-        value_str = parts[1].strip()
+# Разбирает неотрицательное целое число из части команды
+def _parse_count(keyword, text):
+    if not text.isdigit():
+        raise ValueError(f"после {keyword} ожидается неотрицательное число")
+    return int(text)
 
-        # Парсим значение
-        value = _parse_value(value_str)
-        result[key] = value
+# Парсит список столбцов select: агрегатные функции и столбцы
+def _parse_select_list(text):
+    """
+    Возвращает список пар (функция, столбец): функция - "count", "sum",
+    "min", "max", "avg" или None для самого столбца; столбец - None
+    для COUNT(*). Для "*" (все столбцы) возвращает None.
+
+    Пример:
+    - "COUNT(*), SUM(age), city"
+      -> [('count', None), ('sum', 'age'), (None, 'city')]
+    """
+    if not text:
+        raise ValueError("перед FROM ожидается список столбцов")
+    if text == "*":
+        return None
+    items = []
+    for part in text.split(","):
+        part = part.strip()
+        match = _AGGREGATE_RE.fullmatch(part)
+        if match is not None:
+            func, column = match.group(1).lower(), match.group(2)
+            if func not in AGGREGATE_FUNCTIONS:
+                raise ValueError(f"неизвестная функция: {match.group(1)}")
+            if column == "*":
+                if func != "count":
+                    raise ValueError(f"{func.upper()}(*) не поддерживается")
+                column = None
+            items.append((func, column))
+        elif _COLUMN_RE.fullmatch(part):
+            items.append((None, part))
+        elif not part:
+            raise ValueError("пустой элемент в списке столбцов")
+        else:
+            raise ValueError(f"некорректный элемент списка столбцов: {part}")
+    return items
+
+# Разбирает "BY <столбец> [ASC|DESC]" после ORDER: (столбец, по убыванию)
+def _parse_order_by(text):
+    match = re.fullmatch(r"BY\s+(\w+)(?:\s+(ASC|DESC))?", text, re.IGNORECASE)
+    if match is None:
+        raise ValueError("после ORDER ожидается BY <столбец> [ASC|DESC]")
+    direction = match.group(2)
+    return match.group(1), direction is not None and direction.upper() == "DESC"
+
+# Проверяет сочетание списка столбцов, GROUP BY и ORDER BY
+def _check_select_list(columns, group_by, order_by):
+    if columns is None:
+        if group_by is not None:
+            raise ValueError("GROUP BY требует списка столбцов (select ... FROM)")
+        return
+    # Без агрегатов и группировки список - проекция: выводятся только эти столбцы
+    if group_by is None and all(func is None for func, _ in columns):
+        return
+    for func, column in columns:
+        if func is None and column != group_by:
+            raise ValueError(f'столбец "{column}" должен быть указан в GROUP BY')
+    # Результат агрегатов - группы, их можно упорядочить только по ключу
+    if order_by is not None and order_by[0] != group_by:
+        raise ValueError("ORDER BY с агрегатами возможен только по столбцу GROUP BY")
+
+# Парсит команду select в словарь с её частями
+def parse_select(query_str):
+    """
+    Парсит команду вида
+    "select <таблица> [WHERE условие] [ORDER BY столбец [ASC|DESC]]
+    [LIMIT n] [OFFSET m] [FORMAT вид]" или "select <список> FROM <таблица>
+    [WHERE условие] [GROUP BY столбец] [ORDER BY ...] [LIMIT n] [OFFSET m]
+    [FORMAT вид]" в словарь {"table", "columns", "where", "group_by",
+    "order_by", "limit", "offset", "format"}.
+    columns - список столбцов (см. _parse_select_list), None - все;
+    список без агрегатных функций и GROUP BY - проекция.
+    Условие WHERE возвращается текстом (None, если его нет),
+    order_by - (столбец, по убыванию) или None, limit - None,
+    если LIMIT не указан.
+
+    Примеры:
+    - "select users WHERE age > 18 LIMIT 10 OFFSET 20"
+      -> {'table': 'users', 'columns': None, 'where': 'age > 18',
+          'group_by': None, 'order_by': None, 'limit': 10, 'offset': 20,
+          'format': 'table'}
+    - "select users ORDER BY age DESC LIMIT 10"
+      -> {..., 'order_by': ('age', True), 'limit': 10, ...}
+    - "select name, age FROM users"
+      -> {'table': 'users', 'columns': [(None, 'name'), (None, 'age')], ...}
+    - "select city, COUNT(*) FROM users GROUP BY city"
+      -> {'table': 'users', 'columns': [(None, 'city'), ('count', None)],
+          'where': None, 'group_by': 'city', ...}
+    """
+    parts = query_str.strip().split(None, 1)
+    if not parts or parts[0].lower() != "select":
+        raise ValueError("Ожидается формат 'select <таблица> [WHERE условие]'")
+
+    head, clauses = _split_clauses(parts[1] if len(parts) > 1 else "", _SELECT_CLAUSES)
+    columns = None
+    if "FROM" in clauses:
+        columns = _parse_select_list(head)
+        head = clauses["FROM"]
+    table_parts = head.split(None, 1)
+    if not table_parts:
+        raise ValueError("Ожидается формат 'select <таблица> [WHERE условие]'")
+    if len(table_parts) > 1:
+        raise ValueError(f"Лишняя часть команды: {table_parts[1]}")
 
-    return result
+    group_by = None
+    if "GROUP" in clauses:
+        match = re.fullmatch(r"BY\s+(\w+)", clauses["GROUP"], re.IGNORECASE)
+        if match is None:
+            raise ValueError("после GROUP ожидается BY <столбец>")
+        group_by = match.group(1)
+    order_by = None
+    if "ORDER" in clauses:
+        order_by = _parse_order_by(clauses["ORDER"])
+    _check_select_list(columns, group_by, order_by)
+
+    query = {
+        "table": table_parts[0],
+        "columns": columns,
+        "where": clauses.get("WHERE"),
+        "group_by": group_by,
+        "order_by": order_by,
+        "limit": None,
+        "offset": 0,
+        "format": "table",
+    }
+    if "WHERE" in clauses and not clauses["WHERE"]:
+        raise ValueError("после WHERE ожидается условие")
+    if "LIMIT" in clauses:
+        query["limit"] = _parse_count("LIMIT", clauses["LIMIT"])
+    if "OFFSET" in clauses:
+        query["offset"] = _parse_count("OFFSET", clauses["OFFSET"])
+    if "FORMAT" in clauses:
+        output_format = clauses["FORMAT"].lower()
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(
+                f"некорректный формат вывода: {clauses['FORMAT']}. "
+                f"Доступны: table, tsv, jsonl"
+            )
+        query["format"] = output_format
+    return query
 
 # Парсит SET условие в словарь
 def parse_set_clause(set_str):
@@ -0,0 +1,228 @@
+"""
+Компиляция условий WHERE.
+
+Дерево разбора из parser.parse_where_clause (или словарь {поле: значение}
+из прежнего API) один раз компилируется в функцию-предикат и в описание
+условий верхнего уровня конъюнкции, по которым можно искать в индексе:
+равенства, списки IN и диапазоны. Скомпилированные условия кэшируются
+по тексту запроса и по дереву разбора.
+
+Условие, разобранное без схемы, привязывается к схеме таблицы
+(bind_where): литералы приводятся к типам столбцов, а сравнения,
+которые не выполнятся ни для одной записи (столбца нет в таблице,
+значение нельзя привести к его типу), сворачиваются. Если не выполнится
+всё условие, оно помечается невыполнимым, и записи не просматриваются.
+"""
+import operator
+from functools import lru_cache
+from typing import Callable, NamedTuple
+
+from primitive_db.coercion import coerce_literal
+from primitive_db.constants import WHERE_CACHE_SIZE
+from primitive_db.parser import parse_where_clause
+
+# Отметка об отсутствии поля в записи
+_MISSING = object()
+
+# Узел дерева: условие, которое не выполняется ни для одной записи
+_FALSE = ("false",)
+
+_OPERATORS = {
+    "=": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+
+class Where(NamedTuple):
+    """Скомпилированное условие WHERE"""
+    # Дерево разбора (None - условия нет, подходят все записи)
+    ast: tuple | None
+    # Функция record -> bool
+    predicate: Callable
+    # Равенства верхнего уровня {поле: значение}
+    equalities: dict
+    # Списки IN верхнего уровня {поле: (значения)}
+    in_lists: dict
+    # Диапазоны верхнего уровня {поле: (нижняя, включительно, верхняя, включительно)}
+    ranges: dict
+    # Нормализованное дерево для ключа кэша (не зависит от порядка условий)
+    key: tuple | None
+    # Условие не выполняется ни для одной записи (см. bind_where)
+    unsatisfiable: bool = False
+
+
+# Строит дерево разбора из словаря равенств {поле: значение}
+def _ast_from_dict(where_dict):
+    conditions = tuple(
+        ("cmp", column, "=", value) for column, value in where_dict.items()
+    )
+    if not conditions:
+        return None
+    if len(conditions) == 1:
+        return conditions[0]
+    return ("and", conditions)
+
+# Приводит дерево к каноническому виду: вложенные AND/OR раскрыты и упорядочены
+def _normalize(node):
+    kind = node[0]
+    if kind in ("and", "or"):
+        children = []
+        for child in node[1]:
+            child = _normalize(child)
+            if child[0] == kind:
+                children.extend(child[1])
+            else:
+                children.append(child)
+        return (kind, tuple(sorted(children, key=repr)))
+    if kind == "in":
+        return ("in", node[1], tuple(sorted(set(node[2]), key=repr)))
+    return node
+
+# Компилирует узел дерева в функцию-предикат
+def _compile_node(node):
+    kind = node[0]
+
+    if kind == "cmp":
+        _, column, op, value = node
+        if op == "=":
+            return lambda record: record.get(column, _MISSING) == value
+        compare = _OPERATORS[op]
+
+        def predicate(record):
+            item = record.get(column, _MISSING)
+            if item is _MISSING:
+                return False
+            try:
+                return compare(item, value)
+            except TypeError:
+                # Значения разных типов не упорядочиваются - запись не подходит
+                return False
+        return predicate
+
+    if kind == "in":
+        _, column, values = node
+        values = frozenset(values)
+        return lambda record: record.get(column, _MISSING) in values
+
+    if kind == "false":
+        return lambda record: False
+
+    children = [_compile_node(child) for child in node[1]]
+    if kind == "and":
+        return lambda record: all(child(record) for child in children)
+    return lambda record: any(child(record) for child in children)
+
+# Собирает условия верхнего уровня конъюнкции, пригодные для индексов
+def _index_conditions(ast):
+    equalities = {}
+    in_lists = {}
+    ranges = {}
+    conjuncts = ast[1] if ast[0] == "and" else (ast,)
+    for node in conjuncts:
+        if node[0] == "in":
+            in_lists.setdefault(node[1], node[2])
+        elif node[0] == "cmp":
+            _, column, op, value = node
+            if op == "=":
+                equalities.setdefault(column, value)
+            elif op in ("<", "<=", ">", ">="):
+                low, low_inclusive, high, high_inclusive = ranges.get(
+                    column, (None, False, None, False)
+                )
+                if op in (">", ">=") and low is None:
+                    low, low_inclusive = value, op == ">="
+                elif op in ("<", "<=") and high is None:
+                    high, high_inclusive = value, op == "<="
+                ranges[column] = (low, low_inclusive, high, high_inclusive)
+    return equalities, in_lists, ranges
+
+# Компилирует дерево разбора (результат кэшируется по дереву)
+@lru_cache(maxsize=WHERE_CACHE_SIZE)
+def _compile_ast(ast):
+    if ast is None:
+        return Where(None, lambda record: True, {}, {}, {}, None)
+    if ast == _FALSE:
+        return Where(ast, lambda record: False, {}, {}, {}, ast, True)
+    equalities, in_lists, ranges = _index_conditions(ast)
+    return Where(
+        ast,
+        _compile_node(ast),
+        equalities,
+        in_lists,
+        ranges,
+        _normalize(ast),
+    )
+
+# Компилирует условие WHERE из любого поддерживаемого представления
+def compile_where(where):
+    """
+    Принимает скомпилированное условие, дерево разбора, словарь
+    равенств {поле: значение} или None.
+    """
+    if isinstance(where, Where):
+        return where
+    if isinstance(where, dict):
+        where = _ast_from_dict(where)
+    return _compile_ast(where)
+
+# Разбирает и компилирует текст условия WHERE (результат кэшируется по тексту)
+@lru_cache(maxsize=WHERE_CACHE_SIZE)
+def compile_where_text(where_str):
+    return _compile_ast(parse_where_clause(where_str))
+
+# Привязывает узел дерева к схеме: приводит литералы, сворачивает невыполнимое
+def _bind_node(node, schema):
+    kind = node[0]
+
+    if kind == "cmp":
+        _, column, op, value = node
+        if column not in schema:
+            return _FALSE
+        try:
+            return ("cmp", column, op, coerce_literal(value, schema[column]))
+        except ValueError:
+            # Значение другого типа ни с чем не равно, поэтому != выполняется
+            # для всех записей со столбцом, а остальные сравнения - ни для одной
+            return node if op == "!=" else _FALSE
+
+    if kind == "in":
+        _, column, values = node
+        if column not in schema:
+            return _FALSE
+        coerced = []
+        for value in values:
+            try:
+                coerced.append(coerce_literal(value, schema[column]))
+            except ValueError:
+                continue
+        return ("in", column, tuple(coerced)) if coerced else _FALSE
+
+    children = [_bind_node(child, schema) for child in node[1]]
+    if kind == "and":
+        return _FALSE if _FALSE in children else ("and", tuple(children))
+    children = [child for child in children if child != _FALSE]
+    if not children:
+        return _FALSE
+    return children[0] if len(children) == 1 else ("or", tuple(children))
+
+# Привязывает дерево к схеме (результат кэшируется по дереву и схеме)
+@lru_cache(maxsize=WHERE_CACHE_SIZE)
+def _bind_ast(ast, schema_items):
+    return _compile_ast(_bind_node(ast, dict(schema_items)))
+
+# Приводит условие к типам столбцов таблицы
+def bind_where(where, schema):
+    """
+    where - условие в любом виде, как у compile_where; schema - схема
+    таблицы {столбец: тип} из метаданных. Возвращает скомпилированное
+    условие, где литералы приведены к типам столбцов. Если условие
+    не выполнится ни для одной записи, у результата unsatisfiable=True.
+    """
+    where = compile_where(where)
+    if where.ast is None:
+        return where
+    return _bind_ast(where.ast, tuple(schema.items()))
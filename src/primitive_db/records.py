@@ -0,0 +1,107 @@
+"""
+Компактные записи таблиц в памяти.
+
+Запись - обычный словарь {столбец: значение}. Но у обычного словаря
+своя хэш-таблица ключей, хотя имена столбцов у всех записей таблицы
+одинаковые. Здесь для каждого набора столбцов создается класс,
+и запись строится как словарь атрибутов (__dict__) его экземпляра:
+CPython хранит ключи таких словарей один раз на класс (PEP 412,
+словари с общими ключами), а в самой записи - только значения.
+Для таблицы из нескольких столбцов это примерно на 80 байт меньше
+на запись, а значения читаются так же быстро, как из словаря.
+
+Записи остаются словарями, поэтому select, update, delete, индексы,
+журнал и сохранение работают с ними без изменений. Изменение значений
+не разделяет общие ключи; новый или удаленный ключ превращает запись
+в обычный словарь - это безопасно, но без экономии памяти.
+"""
+import keyword
+
+from primitive_db.constants import COMPACT_RECORDS
+
+# Класс записей и фабрика записей по кортежу имен столбцов
+_record_types = {}
+
+
+# Проверяет, что столбцы можно хранить как атрибуты экземпляра
+def _attribute_names(columns):
+    return all(
+        name.isidentifier()
+        and not keyword.iskeyword(name)
+        and not name.startswith("__")
+        for name in columns
+    )
+
+# Создает класс записей и фабрику записей для столбцов columns
+def _make_record_types(columns):
+    """
+    Код генерируется по именам столбцов (как в collections.namedtuple):
+    атрибуты присваиваются всегда в одном порядке, и все записи делят
+    одну таблицу ключей. Конструктор класса копирует значения из словаря,
+    фабрика принимает значения столбцов по порядку; обе возвращают
+    запись без лишних вызовов. Если имя столбца не может быть именем
+    атрибута, класса нет (None), а фабрика строит обычные словари.
+    """
+    if not COMPACT_RECORDS or not columns or not _attribute_names(columns):
+        def make_dict(*values):
+            return dict(zip(columns, values))
+        return None, make_dict
+
+    copy = "".join(f"    __record.{name} = __source[{name!r}]\n" for name in columns)
+    assign = "".join(f"    __record.{name} = {name}\n" for name in columns)
+    namespace = {}
+    exec(f"def __init__(__record, __source):\n{copy}", namespace)
+    record_class = type("Record", (), {"__init__": namespace["__init__"]})
+
+    namespace = {"__new": object.__new__, "__class": record_class}
+    exec(
+        f"def make({', '.join(columns)}):\n"
+        f"    __record = __new(__class)\n{assign}"
+        f"    return __record.__dict__\n",
+        namespace,
+    )
+    return record_class, namespace["make"]
+
+# Возвращает (класс записей или None, фабрика записей) для столбцов
+def _get_record_types(columns):
+    types = _record_types.get(columns)
+    if types is None:
+        types = _record_types.setdefault(columns, _make_record_types(columns))
+    return types
+
+# Возвращает фабрику записей: функцию (*значения столбцов) -> запись
+def record_factory(columns):
+    return _get_record_types(tuple(columns))[1]
+
+# Переводит одну запись (словарь) в компактный вид
+def compact_record(record):
+    if not COMPACT_RECORDS:
+        return record
+    record_class = _get_record_types(tuple(record))[0]
+    return record if record_class is None else record_class(record).__dict__
+
+# Переводит список записей в компактный вид (на месте)
+def compact_records(records):
+    """
+    Столбцы и их порядок берутся из первой записи. Если у всех записей
+    те же столбцы (так обычно и есть), список собирается заново одним
+    проходом; иначе записи переводятся по одной, каждая по своим
+    столбцам.
+    """
+    if not COMPACT_RECORDS or not records:
+        return records
+    columns = tuple(records[0])
+    record_class = _get_record_types(columns)[0]
+    if record_class is None:
+        return records
+    # Одинаковое число столбцов и все столбцы первой записи на месте -
+    # значит, и набор столбцов тот же
+    if set(map(len, records)) == {len(columns)}:
+        try:
+            records[:] = [record_class(record).__dict__ for record in records]
+            return records
+        except KeyError:
+            pass
+    for position, record in enumerate(records):
+        records[position] = compact_record(record)
+    return records
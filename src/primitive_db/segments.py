@@ -0,0 +1,213 @@
+"""
+Сегментированное хранение таблиц в формате JSON.
+
+Записи таблицы (упорядоченные по ID) лежат в файлах-сегментах
+data/<таблица>.segments/<номер>.json (.json.gz, .json.zst - сжатые,
+см. модуль serializer), не больше SEGMENT_ROWS записей
+в каждом. Основной файл data/<таблица>.json - манифест: next_id, версия
+таблицы и список сегментов. Для сегмента хранятся имя файла, первый ID,
+число записей в файле и удаленные ID ("надгробия").
+
+Файл сегмента после записи не меняется. При сохранении таблицы
+измененные сегменты пишутся в новые файлы, затем манифест атомарно
+заменяется, и только после этого удаляются файлы, на которые он больше
+не ссылается. Читатель, открывший старый манифест, либо прочитает его
+сегменты целиком, либо (если их уже удалили) перечитает снимок.
+
+Сохранение переписывает только сегменты с обновленными записями, хвост,
+куда дописываются новые записи, и сегменты, где надгробий стало не
+меньше VACUUM_DEAD_RATIO. Удаление из остальных сегментов только
+добавляет ID в надгробия манифеста. Очистка (vacuum) переписывает
+все сегменты с надгробиями и объединяет соседние неполные.
+"""
+import os
+from bisect import bisect_left, bisect_right
+
+from primitive_db.constants import SEGMENT_ROWS, VACUUM_DEAD_RATIO
+from primitive_db.records import compact_records
+from primitive_db.serializer import compress, decompress, dumps_records, loads
+
+
+# Ключ поиска записи по ID (записи упорядочены по ID)
+def _record_id(record):
+    return record["ID"]
+
+# Проверяет, что основной файл - манифест сегментов, а не таблица целиком
+def is_segmented(manifest):
+    return "segments" in manifest
+
+# Записывает сегмент: JSON-массив записей (сжатый, если задано compression)
+def write_segment(filepath, records, compression="none"):
+    """
+    Файл пишется под новым именем, на которое еще не ссылается манифест,
+    поэтому временный файл не нужен. Возвращает число записанных байтов.
+    """
+    content = compress(dumps_records(records), compression)
+    with open(filepath, "wb") as file:
+        file.write(content)
+        file.flush()
+        os.fsync(file.fileno())
+    return len(content)
+
+# Читает файлы сегментов манифеста (содержимое в байтах)
+def read_segment_files(directory, manifest):
+    """
+    Если файла уже нет (его удалил писатель, заменивший манифест),
+    выбрасывается FileNotFoundError: снимок нужно перечитать.
+    """
+    contents = []
+    for segment in manifest["segments"]:
+        with open(os.path.join(directory, segment["file"]), "rb") as file:
+            contents.append(file.read())
+    return contents
+
+# Собирает записи таблицы из сегментов, пропуская надгробия
+def parse_segments(manifest, contents):
+    records = []
+    for segment, content in zip(manifest["segments"], contents):
+        rows = loads(decompress(content))
+        if segment["deleted"]:
+            deleted = set(segment["deleted"])
+            rows = [record for record in rows if record["ID"] not in deleted]
+        records.extend(compact_records(rows))
+    return records
+
+# Живые записи сегмента с учетом новых надгробий
+def _live_rows(segment, new_deleted):
+    return segment["rows"] - len(segment["deleted"]) - len(new_deleted)
+
+# Распределяет изменения журнала по сегментам манифеста
+def _touched_segments(manifest, entries):
+    """
+    Возвращает (номера сегментов с обновлениями, {номер: удаленные ID}).
+    Записи журнала, уже учтенные в манифесте, и вставки пропускаются:
+    новые записи определяются по ID не меньше next_id манифеста.
+    """
+    first_ids = [segment["first_id"] for segment in manifest["segments"]]
+    base_version = manifest.get("version", 0)
+    updated = set()
+    deleted = {}
+    for entry in entries:
+        version = entry.get("version")
+        if version is not None and version <= base_version:
+            continue
+        if entry["op"] == "insert" or entry["ID"] >= manifest["next_id"]:
+            continue
+        position = bisect_right(first_ids, entry["ID"]) - 1
+        if position < 0:
+            continue
+        if entry["op"] == "update":
+            updated.add(position)
+        elif entry["op"] == "delete":
+            deleted.setdefault(position, set()).add(entry["ID"])
+    return updated, deleted
+
+# Проверяет, что все изменения записей после манифеста есть в журнале
+def log_covers_changes(manifest, entries, data):
+    """
+    Каждое изменение поднимает версию таблицы, а записи журнала хранят
+    свою версию. Если версия данных выше и манифеста, и журнала, часть
+    изменений сделана только в памяти (update или delete без имени
+    таблицы) и по журналу затронутые сегменты не найти.
+    """
+    versions = [entry.get("version") or 0 for entry in entries]
+    covered = max([manifest.get("version", 0), *versions])
+    return data.get("version", 0) <= covered
+
+# Отмечает сегменты, которые нужно переписать
+def _dirty_segments(manifest, records, updated, deleted, vacuum):
+    """
+    Возвращает список: для каждого сегмента "rewrite" (переписать),
+    "merge" (неполный, переписать вместе с соседями при очистке) или None.
+    """
+    segments = manifest["segments"]
+    dirty = []
+    for position, segment in enumerate(segments):
+        new_deleted = deleted.get(position, ())
+        dead = segment["rows"] - _live_rows(segment, new_deleted)
+        reclaim = dead and (vacuum or dead >= segment["rows"] * VACUUM_DEAD_RATIO)
+        if position in updated or reclaim:
+            dirty.append("rewrite")
+        elif vacuum and _live_rows(segment, new_deleted) < SEGMENT_ROWS:
+            dirty.append("merge")
+        else:
+            dirty.append(None)
+
+    # Новые записи дописываются в неполный хвост
+    inserted = records and records[-1]["ID"] >= manifest["next_id"]
+    if inserted and segments and dirty[-1] != "rewrite":
+        tail = len(segments) - 1
+        if _live_rows(segments[tail], deleted.get(tail, ())) < SEGMENT_ROWS:
+            dirty[tail] = "rewrite"
+    return dirty
+
+# Планирует сохранение таблицы по сегментам
+def plan_segments(manifest, records, entries, vacuum=False, extension=".json"):
+    """
+    manifest - текущий манифест (None - таблица пишется целиком),
+    records - все записи таблицы в порядке ID, entries - журнал,
+    накопленный после манифеста. vacuum=True - очистка.
+    extension - расширение имен новых файлов сегментов.
+    Возвращает (сегменты нового манифеста, следующий номер файла,
+    [(имя файла, записи)] для записи, имена файлов, ставших ненужными).
+    """
+    if manifest is None:
+        manifest = {"next_id": 0, "version": 0, "next_segment": 1, "segments": []}
+    segments = manifest["segments"]
+    updated, deleted = _touched_segments(manifest, entries)
+    dirty = _dirty_segments(manifest, records, updated, deleted, vacuum)
+
+    planned = []
+    writes = []
+    obsolete = []
+    next_segment = manifest["next_segment"]
+    tail_rewritten = False
+
+    # Делит записи на новые сегменты
+    def add_segments(rows):
+        nonlocal next_segment
+        for start in range(0, len(rows), SEGMENT_ROWS):
+            chunk = rows[start:start + SEGMENT_ROWS]
+            name = f"{next_segment:06d}{extension}"
+            next_segment += 1
+            planned.append({
+                "file": name,
+                "first_id": chunk[0]["ID"],
+                "rows": len(chunk),
+                "deleted": [],
+            })
+            writes.append((name, chunk))
+
+    position = 0
+    while position < len(segments):
+        end = position
+        while end < len(segments) and dirty[end] is not None:
+            end += 1
+        # Одиночный неполный сегмент без изменений переписывать незачем
+        if end == position or (end - position == 1 and dirty[position] == "merge"):
+            segment = segments[position]
+            new_deleted = deleted.get(position, set())
+            if new_deleted:
+                segment = dict(
+                    segment, deleted=sorted(set(segment["deleted"]) | new_deleted)
+                )
+            planned.append(segment)
+            position += 1
+            continue
+
+        # Подряд идущие сегменты переписываем вместе по актуальным записям
+        low = bisect_left(records, segments[position]["first_id"], key=_record_id)
+        if end == len(segments):
+            high = len(records)
+        else:
+            high = bisect_left(records, segments[end]["first_id"], key=_record_id)
+        add_segments(records[low:high])
+        obsolete.extend(segment["file"] for segment in segments[position:end])
+        tail_rewritten = end == len(segments)
+        position = end
+
+    # Новые записи после последнего сегмента, если хвост не переписан
+    if not tail_rewritten:
+        low = bisect_left(records, manifest["next_id"], key=_record_id)
+        add_segments(records[low:])
+    return planned, next_segment, writes, obsolete
@@ -0,0 +1,189 @@
+"""
+Запись и чтение JSON для файлов базы: сегментов таблиц, манифестов,
+журналов и метаданных.
+
+- Стиль (JSON_STYLE): compact пишет без отступов и пробелов между
+  элементами, pretty - с отступами, как раньше. Читаются оба.
+- Библиотека (JSON_BACKEND): orjson - необязательная зависимость, она
+  быстрее стандартного json в обе стороны. Если её нет, используется
+  json. orjson не поддерживает целые числа больше 64 бит: при записи
+  такие значения пишет стандартный json, а при чтении orjson читала бы
+  их как float, поэтому данные с такими числами (их ищет регулярное
+  выражение) тоже читаются стандартным json.
+- Сжатие (gzip или zstd) применяется к сегментам таблиц целиком.
+  При чтении способ определяется по первым байтам файла, поэтому
+  сжатые и несжатые сегменты могут лежать в одной таблице. zstd
+  берется из модуля compression.zstd (Python 3.14) или из пакета
+  zstandard.
+"""
+import gzip
+import json
+import re
+
+from primitive_db.constants import (
+    ENCODING,
+    GZIP_LEVEL,
+    JSON_BACKEND,
+    JSON_BACKENDS,
+    JSON_STYLE,
+    JSON_STYLES,
+    ZSTD_LEVEL,
+)
+
+try:
+    import orjson
+except ImportError:  # orjson не установлен - используется стандартный json
+    orjson = None
+
+try:
+    from compression import zstd
+    zstandard = None
+except ImportError:  # Python до 3.14 - пробуем пакет zstandard
+    zstd = None
+    try:
+        import zstandard
+    except ImportError:  # zstd недоступен, остается gzip
+        zstandard = None
+
+# Первые байты сжатых данных
+_GZIP_MAGIC = b"\x1f\x8b"
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+# Целое число вне 64 бит в значении объекта (с пробелом после ":" и без)
+_BIG_INT = re.compile(rb":[ ]?-?[0-9]{20}")
+_BIG_INT_COMPACT = re.compile(rb":-?[0-9]{20}")
+
+# Расширения файлов сегментов по способу сжатия
+_EXTENSIONS = {"none": ".json", "gzip": ".json.gz", "zstd": ".json.zst"}
+
+# Текущие настройки записи
+_settings = {"style": JSON_STYLE, "backend": JSON_BACKEND}
+
+
+# Проверяет, установлена ли orjson
+def has_orjson():
+    return orjson is not None
+
+# Проверяет, доступно ли сжатие zstd
+def has_zstd():
+    return zstd is not None or zstandard is not None
+
+# Изменяет стиль записи и библиотеку JSON
+def configure(style=None, backend=None):
+    """
+    style - compact или pretty, backend - auto, orjson или json.
+    Возвращает новые настройки.
+    """
+    if style is not None:
+        if style not in JSON_STYLES:
+            raise ValueError(f"неизвестный стиль JSON: {style}")
+        _settings["style"] = style
+    if backend is not None:
+        if backend not in JSON_BACKENDS:
+            raise ValueError(f"неизвестная библиотека JSON: {backend}")
+        if backend == "orjson" and not has_orjson():
+            raise ValueError("для orjson нужно установить пакет orjson")
+        _settings["backend"] = backend
+    return get_settings()
+
+# Текущие настройки записи
+def get_settings(resolve=True):
+    """
+    resolve=True - с библиотекой, которая будет использована, иначе -
+    как настроено (auto остается auto), например чтобы потом вернуть
+    настройки через configure.
+    """
+    if not resolve:
+        return dict(_settings)
+    return {"style": _settings["style"], "backend": _backend()}
+
+# Библиотека, которой пишется и читается JSON
+def _backend():
+    if _settings["backend"] == "auto":
+        return "orjson" if has_orjson() else "json"
+    return _settings["backend"]
+
+# Кодирует значение в JSON (байты в ENCODING)
+def dumps(value, pretty=None):
+    """
+    pretty=None - по настройке стиля. В компактном стиле результат -
+    одна строка, поэтому подходит и для журналов (строка на запись).
+    """
+    if pretty is None:
+        pretty = _settings["style"] == "pretty"
+    if _backend() == "orjson":
+        try:
+            return orjson.dumps(value, option=orjson.OPT_INDENT_2 if pretty else 0)
+        except TypeError:  # в т.ч. orjson.JSONEncodeError
+            pass
+    if pretty:
+        text = json.dumps(value, ensure_ascii=False, indent=4)
+    else:
+        text = json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+    return text.encode(ENCODING)
+
+# Кодирует одну строку журнала (компактно, с переводом строки)
+def dumps_line(value):
+    return dumps(value, pretty=False) + b"\n"
+
+# Проверяет, есть ли в JSON целые числа, которые orjson прочитает неточно
+def _has_big_ints(data):
+    # Без ": " (компактная запись) хватает более быстрого выражения
+    pattern = _BIG_INT if b": " in data else _BIG_INT_COMPACT
+    return pattern.search(data) is not None
+
+# Разбирает JSON из байтов или строки
+def loads(data):
+    if isinstance(data, str):
+        data = data.encode(ENCODING)
+    if _backend() == "orjson" and not _has_big_ints(data):
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(bytes(data).decode(ENCODING))
+
+# Кодирует записи сегмента
+def dumps_records(records):
+    """
+    В стиле pretty - JSON-массив по записи в строке (так сегменты
+    писались раньше), в компактном - массив одной строкой.
+    """
+    if _settings["style"] != "pretty":
+        return dumps(records, pretty=False)
+    lines = b",\n".join(dumps(record, pretty=False) for record in records)
+    return b"[\n" + lines + b"\n]\n"
+
+# Расширение файла сегмента для способа сжатия
+def segment_extension(method):
+    return _EXTENSIONS[method]
+
+# Проверяет, что способ сжатия известен и доступен
+def check_compression(method):
+    if method not in _EXTENSIONS:
+        raise ValueError(f"неизвестный способ сжатия: {method}")
+    if method == "zstd" and not has_zstd():
+        raise ValueError("для сжатия zstd нужно установить пакет zstandard")
+
+# Сжимает данные выбранным способом
+def compress(data, method):
+    if method == "gzip":
+        # mtime=0: одинаковые данные дают одинаковый файл
+        return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    if method == "zstd":
+        check_compression(method)
+        if zstd is not None:
+            return zstd.compress(data, level=ZSTD_LEVEL)
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return data
+
+# Распаковывает данные, если они сжаты (способ - по первым байтам)
+def decompress(data):
+    if data[:2] == _GZIP_MAGIC:
+        return gzip.decompress(data)
+    if data[:4] == _ZSTD_MAGIC:
+        check_compression("zstd")
+        if zstd is not None:
+            return zstd.decompress(data)
+        return zstandard.ZstdDecompressor().decompress(data)
+    return data
@@ -0,0 +1,470 @@
+"""
+Серверный режим (database serve): база обслуживает клиентов по
+Unix-сокету или локальному TCP-порту.
+
+Протокол строчный. Клиент отправляет команды в той же грамматике, что
+и консоль, по одной на строку (UTF-8). На каждую команду сервер отвечает
+строками JSON: для select - по строке {"record": {...}} на каждую
+найденную запись, затем всегда одна завершающая строка
+{"ok": true|false, "messages": [...]} (у select еще "count"). В messages
+попадает текст, который команда вывела бы в консоль.
+
+Все клиенты работают с одним сеансом, поэтому таблицы остаются в пуле
+буферов между командами и соединениями. Команды выполняются в пуле
+потоков: чтения одной таблицы идут параллельно, записи в таблицу
+выполняются по одной и не пересекаются с её чтениями, а команды,
+меняющие схему, выполняются в одиночку. Межпроцессные блокировки файлов
+по-прежнему действуют, так что рядом с сервером можно запускать
+и обычные процессы database.
+
+Транзакция (BEGIN ... COMMIT/ROLLBACK) принадлежит соединению. Пока она
+открыта, соединение держит блокировки записи измененных таблиц, и другие
+клиенты не видят её незафиксированных изменений. Транзакция, которую
+клиент не завершил до отключения, откатывается.
+"""
+import asyncio
+import io
+import json
+import os
+import shlex
+import signal
+import socket
+import stat
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import (
+    AsyncExitStack,
+    asynccontextmanager,
+    contextmanager,
+    suppress,
+)
+
+from primitive_db.constants import (
+    ENCODING,
+    SERVER_HOST,
+    SERVER_LINE_LIMIT,
+    SERVER_SOCKET,
+    SERVER_WORKERS,
+    TRANSACTION_LOCK_TIMEOUT,
+)
+from primitive_db.decorators import track_declined
+from primitive_db.engine import (
+    METADATA_COMMANDS,
+    TRANSACTION_COMMANDS,
+    WRITE_COMMANDS,
+    execute_command,
+    flush_session,
+    is_known_command,
+    new_session,
+    query_records,
+)
+
+# Команды, которые затрагивают весь сеанс и выполняются в одиночку
+_SESSION_COMMANDS = {"set_engine", "set_parallel", "checkpoint", "buffer_pool"}
+
+# Начало сообщений, по которым команда считается завершенной с ошибкой
+_ERROR_PREFIXES = ("Ошибка", "Неожиданная ошибка")
+
+
+class _ThreadOutput(io.TextIOBase):
+    """
+    Замена sys.stdout на время работы сервера: вывод потока, который
+    выполняет команду клиента, собирается в буфер этой команды, вывод
+    остальных потоков идет в исходный поток.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._local = threading.local()
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        buffer = getattr(self._local, "buffer", None)
+        return (self.stream if buffer is None else buffer).write(text)
+
+    def flush(self):
+        if getattr(self._local, "buffer", None) is None:
+            self.stream.flush()
+
+    @contextmanager
+    def capture(self):
+        self._local.buffer = io.StringIO()
+        try:
+            yield self._local.buffer
+        finally:
+            self._local.buffer = None
+
+
+class _ReadWriteLock:
+    """
+    Блокировка asyncio "много читателей или один писатель". Ожидающий
+    писатель не пропускает новых читателей, чтобы поток чтений
+    не откладывал запись бесконечно.
+    """
+
+    def __init__(self):
+        self._condition = asyncio.Condition()
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    @asynccontextmanager
+    async def read(self):
+        async with self._condition:
+            await self._condition.wait_for(
+                lambda: not self._writer and not self._waiting_writers
+            )
+            self._readers += 1
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self._readers -= 1
+                self._condition.notify_all()
+
+    @asynccontextmanager
+    async def write(self):
+        async with self._condition:
+            self._waiting_writers += 1
+            try:
+                await self._condition.wait_for(
+                    lambda: not self._writer and not self._readers
+                )
+            finally:
+                self._waiting_writers -= 1
+                # Если ожидание прервано, читатели не должны ждать дальше
+                self._condition.notify_all()
+            self._writer = True
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self._writer = False
+                self._condition.notify_all()
+
+
+# Определяет, какие блокировки нужны команде: (вид, таблица)
+def _command_scope(args):
+    """
+    Вид - "session" (команда выполняется в одиночку), "write" (запись
+    в таблицу) или "read".
+    """
+    command = args[0]
+    if command in METADATA_COMMANDS or command in _SESSION_COMMANDS:
+        return "session", None
+    if command.lower() == "explain":
+        # EXPLAIN [ANALYZE] select <таблица> ...
+        rest = args[1:]
+        if rest and rest[0].lower() == "analyze":
+            rest = rest[1:]
+        if len(rest) > 1 and rest[0].lower() == "select":
+            return "read", _select_table(rest)
+        return "read", None
+    if len(args) < 2:
+        return "read", None
+    if command in WRITE_COMMANDS:
+        return "write", args[1]
+    if command == "select":
+        return "read", _select_table(args)
+    return "read", None
+
+# Имя таблицы команды select: после FROM или сразу после select
+def _select_table(args):
+    for position, token in enumerate(args[1:-1], start=1):
+        if token.upper() == "FROM":
+            return args[position + 1]
+        if token.upper() in ("WHERE", "GROUP", "ORDER", "LIMIT", "OFFSET", "FORMAT"):
+            break
+    return args[1]
+
+# Захватывает блокировки сервера на время выполнения команды
+@asynccontextmanager
+async def _command_locks(state, scope, table_name):
+    if scope == "session":
+        async with state["session_lock"].write():
+            yield
+        return
+
+    async with state["session_lock"].read():
+        if table_name is None:
+            yield
+            return
+        lock = state["table_locks"].setdefault(table_name, _ReadWriteLock())
+        async with (lock.write() if scope == "write" else lock.read()):
+            yield
+
+# Захватывает блокировки для команды внутри транзакции соединения
+@asynccontextmanager
+async def _transaction_locks(state, connection, scope, table_name):
+    """
+    Блокировка чтения сеанса взята при BEGIN, блокировки записи таблиц
+    копятся в connection["locks"] до конца транзакции. Если таблица
+    занята другой транзакцией дольше TRANSACTION_LOCK_TIMEOUT секунд,
+    выбрасывается TimeoutError.
+    """
+    if table_name is None or table_name in connection["tables"]:
+        yield
+        return
+    lock = state["table_locks"].setdefault(table_name, _ReadWriteLock())
+    if scope != "write":
+        async with lock.read():
+            yield
+        return
+    await asyncio.wait_for(
+        connection["locks"].enter_async_context(lock.write()),
+        TRANSACTION_LOCK_TIMEOUT,
+    )
+    connection["tables"].add(table_name)
+    yield
+
+# Формирует завершающую строку ответа
+def _status_line(ok, messages, count=None):
+    status = {"ok": ok, "messages": messages}
+    if count is not None:
+        status["count"] = count
+    return json.dumps(status, ensure_ascii=False) + "\n"
+
+# Выполняет команду в рабочем потоке и возвращает готовый ответ
+def _run_command(state, session, user_input, is_select):
+    records = None
+    with state["output"].capture() as buffer, track_declined() as declined:
+        try:
+            if is_select:
+                records = query_records(session, user_input)
+            else:
+                execute_command(session, user_input)
+        except Exception as e:
+            print(f"Неожиданная ошибка: {e}")
+
+    messages = buffer.getvalue().splitlines()
+    ok = not any(line.startswith(_ERROR_PREFIXES) for line in messages)
+    # Операция, отклоненная без подтверждения (serve без --yes), не выполнена
+    if declined or (is_select and records is None):
+        ok = False
+
+    # Ответ сериализуем здесь же, чтобы не занимать цикл событий
+    lines = [
+        json.dumps({"record": record}, ensure_ascii=False, default=str) + "\n"
+        for record in records or ()
+    ]
+    count = len(records) if records is not None else None
+    lines.append(_status_line(ok, messages, count))
+    return "".join(lines).encode(ENCODING)
+
+# Выполняет одну строку запроса клиента; возвращает (ответ, продолжать)
+async def _serve_command(state, connection, user_input):
+    if not user_input or user_input.startswith(("#", "--")):
+        return _status_line(True, []).encode(ENCODING), True
+    try:
+        args = shlex.split(user_input)
+    except ValueError as e:
+        # Например, незакрытая кавычка в команде
+        message = f"Ошибка разбора команды: {e}"
+        return _status_line(False, [message]).encode(ENCODING), True
+    if not args:
+        return _status_line(True, []).encode(ENCODING), True
+    if args[0] == "exit":
+        return _status_line(True, ["Соединение закрыто."]).encode(ENCODING), False
+    if not is_known_command(args[0]):
+        # Ответ об ошибке не зависит от текста сообщения движка
+        message = f"Функции '{args[0]}' нет. Попробуйте снова."
+        return _status_line(False, [message]).encode(ENCODING), True
+
+    if args[0].lower() in TRANSACTION_COMMANDS:
+        return await _serve_transaction_command(state, connection, user_input), True
+
+    session = connection["session"]
+    scope, table_name = _command_scope(args)
+    loop = asyncio.get_running_loop()
+    if session["transaction"] is None:
+        locks = _command_locks(state, scope, table_name)
+    elif scope == "session":
+        message = (
+            f"Ошибка: команда {args[0]} недоступна внутри транзакции "
+            f"(завершите её командой COMMIT или ROLLBACK)."
+        )
+        return _status_line(False, [message]).encode(ENCODING), True
+    else:
+        locks = _transaction_locks(state, connection, scope, table_name)
+
+    try:
+        async with locks:
+            response = await loop.run_in_executor(
+                state["executor"],
+                _run_command,
+                state,
+                session,
+                user_input,
+                args[0] == "select",
+            )
+    except TimeoutError:
+        message = (
+            f'Ошибка: таблица "{table_name}" занята другой транзакцией, '
+            f"команда не выполнена."
+        )
+        return _status_line(False, [message]).encode(ENCODING), True
+    return response, True
+
+# Выполняет BEGIN, COMMIT или ROLLBACK соединения
+async def _serve_transaction_command(state, connection, user_input):
+    session = connection["session"]
+    loop = asyncio.get_running_loop()
+    if session["transaction"] is None:
+        # Пока транзакция открыта, схема и настройки сеанса не меняются
+        await connection["locks"].enter_async_context(state["session_lock"].read())
+    try:
+        response = await loop.run_in_executor(
+            state["executor"], _run_command, state, session, user_input, False
+        )
+    finally:
+        if session["transaction"] is None:
+            await _release_transaction_locks(connection)
+    return response
+
+# Снимает блокировки сервера, которые держала транзакция соединения
+async def _release_transaction_locks(connection):
+    locks, connection["locks"] = connection["locks"], AsyncExitStack()
+    connection["tables"] = set()
+    await locks.aclose()
+
+# Откатывает транзакцию, которую клиент не завершил до отключения
+async def _abort_transaction(state, connection):
+    if connection["session"]["transaction"] is None:
+        return
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(
+        state["executor"],
+        _run_command,
+        state,
+        connection["session"],
+        "ROLLBACK",
+        False,
+    )
+    await _release_transaction_locks(connection)
+
+# Обслуживает одно соединение клиента
+async def _handle_client(state, reader, writer):
+    task = asyncio.current_task()
+    state["clients"].add(task)
+    # Сеанс соединения разделяет с общим метаданные и пул буферов,
+    # но транзакция у каждого соединения своя
+    connection = {
+        "session": dict(state["session"], transaction=None),
+        "locks": AsyncExitStack(),
+        "tables": set(),
+    }
+    try:
+        while True:
+            try:
+                line = await reader.readline()
+            except ValueError:
+                # Строка длиннее SERVER_LINE_LIMIT - дальше поток не разобрать
+                message = "Ошибка: слишком длинная команда."
+                writer.write(_status_line(False, [message]).encode(ENCODING))
+                await writer.drain()
+                break
+            if not line:
+                break
+
+            user_input = line.decode(ENCODING, errors="replace").strip()
+            response, proceed = await _serve_command(state, connection, user_input)
+            writer.write(response)
+            await writer.drain()
+            if not proceed:
+                break
+    except (ConnectionError, asyncio.CancelledError):
+        pass
+    finally:
+        with suppress(asyncio.CancelledError):
+            await _abort_transaction(state, connection)
+        state["clients"].discard(task)
+        writer.close()
+        with suppress(ConnectionError, asyncio.CancelledError):
+            await writer.wait_closed()
+
+# Убирает файл сокета, оставшийся от завершившегося сервера
+def _remove_stale_socket(socket_path):
+    try:
+        mode = os.stat(socket_path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise FileExistsError(f"{socket_path} существует и не является сокетом")
+
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+    except (ConnectionRefusedError, FileNotFoundError):
+        os.remove(socket_path)
+        return
+    finally:
+        probe.close()
+    raise FileExistsError(f"сервер уже запущен на сокете {socket_path}")
+
+# Запускает сервер и обслуживает клиентов до остановки
+async def _serve(socket_path, host, port, workers):
+    state = {
+        "session": new_session(),
+        "output": _ThreadOutput(sys.stdout),
+        "executor": ThreadPoolExecutor(workers, thread_name_prefix="db-worker"),
+        "session_lock": _ReadWriteLock(),
+        "table_locks": {},
+        "clients": set(),
+    }
+
+    async def handle(reader, writer):
+        await _handle_client(state, reader, writer)
+
+    if port is not None:
+        server = await asyncio.start_server(
+            handle, host, port, limit=SERVER_LINE_LIMIT
+        )
+        address = f"{host}:{port}"
+    else:
+        _remove_stale_socket(socket_path)
+        server = await asyncio.start_unix_server(
+            handle, socket_path, limit=SERVER_LINE_LIMIT
+        )
+        # Подключаться к базе может только владелец сокета
+        os.chmod(socket_path, 0o600)
+        address = socket_path
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        with suppress(NotImplementedError):
+            loop.add_signal_handler(signal_number, stop.set)
+
+    sys.stdout = state["output"]
+    try:
+        print(f"Сервер запущен: {address} (Ctrl+C - остановка)", flush=True)
+        async with server:
+            await stop.wait()
+            server.close()
+            # Прерываем соединения: начатые команды дорабатывают в потоках
+            for task in list(state["clients"]):
+                task.cancel()
+            await asyncio.gather(*state["clients"], return_exceptions=True)
+    finally:
+        state["executor"].shutdown(wait=True)
+        # Основные файлы таблиц, измененных через журнал, обновляем при выходе
+        flush_session(state["session"])
+        sys.stdout = state["output"].stream
+        if port is None:
+            with suppress(FileNotFoundError):
+                os.remove(socket_path)
+    print("Сервер остановлен.")
+
+# Запуск серверного режима
+def serve(socket_path=None, host=None, port=None, workers=SERVER_WORKERS):
+    """
+    Без port сервер слушает Unix-сокет socket_path (по умолчанию
+    SERVER_SOCKET), с port - TCP-порт на host (по умолчанию только
+    локальный интерфейс). Работает до SIGINT/SIGTERM.
+    """
+    if port is None:
+        socket_path = socket_path or SERVER_SOCKET
+    asyncio.run(_serve(socket_path, host or SERVER_HOST, port, workers))
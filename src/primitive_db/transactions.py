@@ -0,0 +1,291 @@
+"""
+Транзакции: BEGIN, COMMIT и ROLLBACK.
+
+Внутри транзакции изменения (insert, update, delete) применяются
+к таблицам в памяти сеанса, а записи для журналов таблиц копятся
+в буфере транзакции. Каждая изменяемая таблица блокируется до конца
+транзакции и закрепляется в пуле буферов, поэтому незафиксированные
+изменения не попадают на диск, а другие процессы не меняют эти таблицы
+и читают их состояние до транзакции.
+
+COMMIT дописывает все изменения транзакции одной строкой в общий журнал
+транзакций и сбрасывает его на диск (fsync) - с этого момента транзакция
+зафиксирована. Затем изменения переносятся в журналы таблиц, а в журнал
+транзакций дописывается отметка о переносе. Если процесс упал между
+этими шагами, перенос повторяет recover_transactions (при запуске
+сеанса и перед записью); повторно дописанные записи журнала таблицы
+при чтении пропускаются по версии.
+
+Групповая фиксация: одновременные COMMIT (потоки сервера) не ждут
+каждый свой fsync - один сброс на диск подтверждает все строки,
+дописанные в журнал к его началу.
+
+ROLLBACK отбрасывает буфер: измененные в памяти таблицы убираются
+из пула и при следующем обращении читаются с диска.
+"""
+import json
+import os
+import threading
+import uuid
+from contextlib import ExitStack, contextmanager
+
+from primitive_db.bufferpool import (
+    discard_table,
+    mark_dirty,
+    peek_table,
+    pin_table,
+    unpin_table,
+)
+from primitive_db.constants import (
+    DATA_DIR,
+    ENCODING,
+    TRANSACTION_JOURNAL,
+    TRANSACTION_LOCK_TIMEOUT,
+)
+from primitive_db.locks import file_lock, lock_owner
+from primitive_db.utils import (
+    buffered_table_log,
+    ensure_data_dir,
+    table_lock,
+    write_table_log,
+)
+
+# Открытый журнал транзакций процесса и счетчики групповой фиксации:
+# written - строк фиксации дописано, synced - из них сброшено на диск
+_journal = {
+    "fd": None,
+    "path": None,
+    "written": 0,
+    "synced": 0,
+    "syncing": False,
+    "commits": 0,
+    "fsyncs": 0,
+}
+_journal_condition = threading.Condition()
+
+
+# Путь к журналу транзакций
+def get_journal_path():
+    return os.path.join(DATA_DIR, TRANSACTION_JOURNAL)
+
+# Возвращает дескриптор журнала транзакций, открывая его при первом обращении
+def _journal_fd():
+    """
+    Журнал только дописывается (O_APPEND) и очищается на месте, без
+    замены файла, поэтому дескриптор остается действительным. Путь
+    сравнивается абсолютный: после смены текущей директории открывается
+    журнал новой базы.
+    """
+    path = os.path.abspath(get_journal_path())
+    with _journal_condition:
+        if _journal["fd"] is None or _journal["path"] != path:
+            if _journal["fd"] is not None:
+                os.close(_journal["fd"])
+            ensure_data_dir()
+            _journal["fd"] = os.open(
+                path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644
+            )
+            _journal["path"] = path
+        return _journal["fd"]
+
+# Дописывает строку в журнал транзакций
+def _append_journal(fd, line):
+    data = (json.dumps(line, ensure_ascii=False) + "\n").encode(ENCODING)
+    with file_lock(get_journal_path()):
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+
+# Дожидается, пока строка с номером ticket будет сброшена на диск
+def _wait_synced(fd, ticket):
+    """
+    Первый ожидающий поток становится ведущим и делает fsync за всех,
+    чьи строки уже дописаны; остальные ждут его результата.
+    """
+    with _journal_condition:
+        while _journal["synced"] < ticket:
+            if _journal["syncing"]:
+                _journal_condition.wait()
+                continue
+            _journal["syncing"] = True
+            target = _journal["written"]
+            _journal_condition.release()
+            try:
+                os.fsync(fd)
+            finally:
+                _journal_condition.acquire()
+                _journal["syncing"] = False
+                _journal_condition.notify_all()
+            _journal["synced"] = max(_journal["synced"], target)
+            _journal["fsyncs"] += 1
+
+# Надежно записывает фиксацию транзакции в журнал транзакций
+def _write_commit(transaction_id, entries):
+    fd = _journal_fd()
+    _append_journal(fd, {"txid": transaction_id, "tables": entries})
+    with _journal_condition:
+        _journal["written"] += 1
+        ticket = _journal["written"]
+    _wait_synced(fd, ticket)
+    with _journal_condition:
+        _journal["commits"] += 1
+
+# Читает журнал транзакций: (неперенесенные фиксации по порядку, все ли строки
+# перенесены)
+def _read_journal():
+    try:
+        file = open(get_journal_path(), "rb")
+    except FileNotFoundError:
+        return [], True
+
+    commits = {}
+    applied = set()
+    with file:
+        for line in file:
+            # Оборванная сбоем строка фиксации не была подтверждена
+            if not line.endswith(b"\n"):
+                break
+            try:
+                item = json.loads(line.decode(ENCODING))
+            except ValueError:
+                break
+            if "applied" in item:
+                applied.add(item["applied"])
+            else:
+                commits[item["txid"]] = item
+    pending = [item for txid, item in commits.items() if txid not in applied]
+    return pending, not pending
+
+# Очищает журнал транзакций, если все фиксации в нем перенесены
+def _truncate_journal():
+    path = get_journal_path()
+    with file_lock(path):
+        _, complete = _read_journal()
+        if complete and os.path.exists(path):
+            os.truncate(path, 0)
+
+# Переносит изменения зафиксированной транзакции в журналы таблиц
+def _apply_commit(transaction_id, entries, pool=None):
+    """
+    Вызывается под блокировками всех таблиц транзакции. pool - пул
+    буферов с актуальными данными таблиц (для слияния журнала).
+    """
+    for table_name, table_entries in entries.items():
+        data = None if pool is None else peek_table(pool, table_name)
+        write_table_log(table_name, table_entries, data)
+    _append_journal(_journal_fd(), {"applied": transaction_id})
+
+# Доводит до конца фиксации, прерванные сбоем
+def recover_transactions():
+    """
+    Вызывается при запуске сеанса и перед изменениями таблиц. Пока
+    журнал транзакций пуст, стоит одной проверки размера файла.
+    Возвращает число восстановленных транзакций.
+    """
+    try:
+        if os.path.getsize(get_journal_path()) == 0:
+            return 0
+    except FileNotFoundError:
+        return 0
+
+    with file_lock(get_journal_path()):
+        pending, _ = _read_journal()
+    recovered = 0
+    for item in pending:
+        # Блокировки берем в одном порядке; журнал перечитываем под ними:
+        # живой процесс мог сам завершить перенос, пока мы ждали
+        with ExitStack() as stack:
+            for table_name in sorted(item["tables"]):
+                stack.enter_context(table_lock(table_name))
+            with file_lock(get_journal_path()):
+                still_pending = {
+                    other["txid"] for other in _read_journal()[0]
+                }
+            if item["txid"] in still_pending:
+                _apply_commit(item["txid"], item["tables"])
+                recovered += 1
+    _truncate_journal()
+    return recovered
+
+# Начинает транзакцию
+def begin_transaction():
+    recover_transactions()
+    return {
+        "id": uuid.uuid4().hex,
+        # Записи журналов по таблицам в порядке изменений
+        "entries": {},
+        # Заблокированные и закрепленные в пуле таблицы
+        "tables": [],
+        "locks": ExitStack(),
+    }
+
+# Выполняет блок с блокировками и буфером журналов транзакции
+@contextmanager
+def transaction_scope(transaction):
+    with lock_owner(transaction["id"]), buffered_table_log(transaction["entries"]):
+        yield
+
+# Блокирует таблицу до конца транзакции и закрепляет её в пуле
+def lock_table(transaction, pool, table_name, timeout=TRANSACTION_LOCK_TIMEOUT):
+    """
+    Возвращает False, если таблицу не удалось заблокировать за timeout
+    секунд (её держит другая транзакция или процесс).
+    """
+    if table_name in transaction["tables"]:
+        return True
+    with lock_owner(transaction["id"]):
+        try:
+            transaction["locks"].enter_context(table_lock(table_name, timeout=timeout))
+        except TimeoutError:
+            return False
+    pin_table(pool, table_name)
+    transaction["tables"].append(table_name)
+    return True
+
+# Снимает закрепления и блокировки транзакции
+def _release(transaction, pool, committed):
+    for table_name in transaction["tables"]:
+        if committed and table_name in transaction["entries"]:
+            # Журнал таблицы изменился нами - обновляем подпись в пуле
+            mark_dirty(pool, table_name)
+        elif not committed:
+            discard_table(pool, table_name)
+        unpin_table(pool, table_name)
+    with lock_owner(transaction["id"]):
+        transaction["locks"].close()
+
+# Фиксирует транзакцию
+def commit_transaction(transaction, pool):
+    """
+    Возвращает число измененных таблиц. Если записать фиксацию
+    не удалось, транзакция откатывается, а ошибка передается дальше.
+    """
+    entries = transaction["entries"]
+    if not entries:
+        _release(transaction, pool, committed=True)
+        return 0
+
+    try:
+        _write_commit(transaction["id"], entries)
+    except BaseException:
+        _release(transaction, pool, committed=False)
+        raise
+
+    try:
+        # Транзакция уже зафиксирована: при ошибке переноса его завершит
+        # восстановление. Блокировки таблиц держит транзакция
+        with lock_owner(transaction["id"]):
+            _apply_commit(transaction["id"], entries, pool)
+    finally:
+        _release(transaction, pool, committed=True)
+    _truncate_journal()
+    return len(entries)
+
+# Откатывает транзакцию
+def rollback_transaction(transaction, pool):
+    _release(transaction, pool, committed=False)
+
+# Статистика фиксаций: число COMMIT и выполненных для них fsync
+def get_commit_stats():
+    with _journal_condition:
+        return {"commits": _journal["commits"], "fsyncs": _journal["fsyncs"]}
@@ -1,23 +1,95 @@
+import csv
+import heapq
 import json
 import os
+import sys
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+from operator import itemgetter
 
-from primitive_db.constants import DATA_DIR, ENCODING
-from primitive_db.decorators import handle_db_errors
+from primitive_db import metrics
+from primitive_db.columnar import (
+    iter_scan_table,
+    read_header,
+    read_rows_by_id,
+    read_schema,
+    read_table,
+    write_table,
+)
+from primitive_db.constants import (
+    COLUMNAR_EXTENSION,
+    DATA_DIR,
+    ENCODING,
+    IMPORT_FORMATS,
+    LOG_COMPACT_SIZE,
+    LOG_EXTENSION,
+    OPTIONS_KEY,
+    SEGMENTS_EXTENSION,
+    SNAPSHOT_RETRIES,
+)
+from primitive_db.decorators import handle_db_errors, log_time
+from primitive_db.indexes import build_indexes
+from primitive_db.locks import file_lock
+from primitive_db.parallel import scan_file
+from primitive_db.records import compact_record, compact_records
+from primitive_db.segments import (
+    is_segmented,
+    log_covers_changes,
+    parse_segments,
+    plan_segments,
+    read_segment_files,
+    write_segment,
+)
+from primitive_db.serializer import (
+    check_compression,
+    dumps,
+    dumps_line,
+    loads,
+    segment_extension,
+)
+
+# Буфер записей журналов текущего потока (см. buffered_table_log)
+_log_buffer = threading.local()
 
 
 # Загружает данные из JSON-файла
 def load_metadata(filepath):
     try:
-        with open(filepath, "r", encoding="utf-8") as file:
-            return json.load(file)
+        with open(filepath, "rb") as file:
+            return loads(file.read())
     except FileNotFoundError:
         return {}
 
 # Сохраняет переданные данные в JSON-файл
 @handle_db_errors
 def save_metadata(filepath, data):
-    with open(filepath, "w", encoding="utf-8") as file:
-        json.dump(data, file, indent=4, ensure_ascii=False)
+    """
+    Файл пишется через временный и заменяется переименованием, поэтому
+    другие процессы видят либо старые, либо новые метаданные целиком.
+    """
+    with file_lock(filepath):
+        tmp_path = _temporary_path(filepath)
+        with open(tmp_path, "wb") as file:
+            file.write(dumps(data))
+        _replace_file(tmp_path, filepath)
+
+# Возвращает имена таблиц без служебных разделов метаданных
+def get_table_names(metadata):
+    return [name for name in metadata if name != OPTIONS_KEY]
+
+# Проверяет, что таблица существует
+def table_exists(metadata, table_name):
+    return table_name in metadata and table_name != OPTIONS_KEY
+
+# Возвращает настройки таблицы (создает пустые при необходимости)
+def get_table_options(metadata, table_name):
+    return metadata.setdefault(OPTIONS_KEY, {}).setdefault(table_name, {})
+
+# Возвращает определения индексов таблицы {столбец: вид}
+def get_index_definitions(metadata, table_name):
+    return metadata.get(OPTIONS_KEY, {}).get(table_name, {}).get("indexes", {})
 
 # Создает директорию для данных если её нет
 @handle_db_errors
@@ -29,66 +101,812 @@ def ensure_data_dir():
 def get_table_data_path(table_name):
     return os.path.join(DATA_DIR, f"{table_name}.json")
 
+# Получает путь к файлу таблицы в колоночном формате
+def get_columnar_data_path(table_name):
+    return os.path.join(DATA_DIR, f"{table_name}{COLUMNAR_EXTENSION}")
+
+# Получает путь к каталогу сегментов таблицы в формате JSON
+def get_segments_dir(table_name):
+    return os.path.join(DATA_DIR, f"{table_name}{SEGMENTS_EXTENSION}")
+
+# Определяет формат хранения таблицы по имеющемуся файлу
+def get_table_format(table_name):
+    if os.path.exists(get_columnar_data_path(table_name)):
+        return "columnar"
+    return "json"
+
+# Порядок столбцов колоночного файла: как ключи записи, ID последним
+def _columnar_schema(schema):
+    columns = [(name, col_type) for name, col_type in schema.items() if name != "ID"]
+    return columns + [("ID", "int")]
+
+# Получает путь к журналу изменений таблицы
+def get_table_log_path(table_name):
+    return os.path.join(DATA_DIR, f"{table_name}{LOG_EXTENSION}")
+
+# Блокировка таблицы для записи (или разделяемая - для чтения)
+def table_lock(table_name, shared=False, timeout=None):
+    """
+    Все изменения файлов таблицы выполняются под исключительной
+    блокировкой; блокировка повторно входима в пределах потока
+    (или владельца, см. locks.lock_owner).
+    """
+    ensure_data_dir()
+    return file_lock(os.path.join(DATA_DIR, table_name), shared, timeout)
+
+# Применяет одну запись журнала к данным таблицы
+def _apply_log_entry(data, positions, entry, base_version):
+    """
+    Записи с версией не выше base_version уже есть в основном файле
+    и пропускаются (так бывает, если журнал прочитан до того, как другой
+    процесс слил его с основным файлом). Записи с версией ниже уже
+    примененной - повторно дописанные при восстановлении транзакции -
+    тоже пропускаются. Записи без версии идемпотентны, поэтому их
+    повторное применение ничего не меняет.
+    """
+    records = data["records"]
+    op = entry["op"]
+    version = entry.get("version")
+    if version is not None and (
+        version <= base_version or version < data["version"]
+    ):
+        return
+    data["version"] = max(data["version"], version or 0)
+
+    if op == "insert":
+        record = compact_record(entry["record"])
+        # Запись с таким ID уже есть в основном файле
+        if record["ID"] < data["next_id"]:
+            return
+        positions[record["ID"]] = len(records)
+        records.append(record)
+        data["next_id"] = record["ID"] + 1
+    elif op == "update":
+        index = positions.get(entry["ID"])
+        if index is not None:
+            records[index].update(entry["values"])
+    elif op == "delete":
+        index = positions.pop(entry["ID"], None)
+        if index is not None:
+            records[index] = None
+
+# Читает записи журнала таблицы
+def _read_table_log(table_name):
+    """
+    Незавершенная последняя строка (запись, которую другой процесс еще
+    дописывает, или оборванная сбоем) пропускается. Журнал при этом
+    не меняется: хвост отрезает следующий писатель (_repair_table_log).
+    """
+    try:
+        file = open(get_table_log_path(table_name), "rb")
+    except FileNotFoundError:
+        return []
+
+    entries = []
+    size = 0
+    with file:
+        for line in file:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                entries.append(loads(line))
+            except ValueError:
+                print(f'Предупреждение: журнал таблицы "{table_name}" '
+                      f'поврежден, записи после сбоя пропущены.')
+                break
+            size += len(line)
+    metrics.increment("bytes_read", size)
+    return entries
+
+# Отрезает оборванный после сбоя хвост журнала (вызывается под блокировкой)
+def _repair_table_log(table_name):
+    """
+    Без этого следующая запись склеилась бы с мусором в одну строку.
+    Обычно проверяется только последний байт файла.
+    """
+    log_path = get_table_log_path(table_name)
+    try:
+        file = open(log_path, "r+b")
+    except FileNotFoundError:
+        return
+
+    with file:
+        size = file.seek(0, os.SEEK_END)
+        if size == 0:
+            return
+        file.seek(size - 1)
+        if file.read(1) == b"\n":
+            return
+
+        valid_size = 0
+        file.seek(0)
+        for line in file:
+            try:
+                if not line.endswith(b"\n"):
+                    raise ValueError("строка не завершена")
+                loads(line)
+            except ValueError:
+                break
+            valid_size += len(line)
+        print(f'Предупреждение: журнал таблицы "{table_name}" '
+              f'поврежден, хвост отброшен.')
+        file.truncate(valid_size)
+
+# Восстанавливает состояние таблицы, проигрывая журнал поверх основного файла
+def _replay_table_log(table_name, data, entries=None):
+    data.setdefault("version", 0)
+    if entries is None:
+        entries = _read_table_log(table_name)
+    if not entries:
+        return data
+
+    base_version = data["version"]
+    positions = {record["ID"]: i for i, record in enumerate(data["records"])}
+    for entry in entries:
+        _apply_log_entry(data, positions, entry, base_version)
+
+    data["records"] = [record for record in data["records"] if record is not None]
+    return data
+
+# Проверяет, что открытый файл - все еще текущая версия файла по пути
+def _is_current_file(file, filepath):
+    try:
+        stat = os.stat(filepath)
+    except FileNotFoundError:
+        return file is None
+    if file is None:
+        return False
+    opened = os.fstat(file.fileno())
+    return (stat.st_dev, stat.st_ino) == (opened.st_dev, opened.st_ino)
+
+# Открывает согласованный снимок таблицы: основной файл и журнал к нему
+def _open_snapshot(table_name):
+    """
+    Возвращает (открытый основной файл или None, формат, записи журнала).
+    Основной файл заменяется только переименованием, поэтому открытый
+    файл остается неизменной версией. Если после чтения журнала по пути
+    лежит уже другой файл (таблицу слили или перевели в другой формат),
+    чтение повторяется; после SNAPSHOT_RETRIES попыток снимок читается
+    под разделяемой блокировкой. Писатели читателей не задерживают.
+    Основной файл закрывает вызывающая сторона.
+    """
+    for attempt in range(SNAPSHOT_RETRIES + 1):
+        locked = attempt == SNAPSHOT_RETRIES
+        with table_lock(table_name, shared=True) if locked else nullcontext():
+            table_format = get_table_format(table_name)
+            if table_format == "columnar":
+                filepath = get_columnar_data_path(table_name)
+            else:
+                filepath = get_table_data_path(table_name)
+            try:
+                base_file = open(filepath, "rb")
+            except FileNotFoundError:
+                base_file = None
+            entries = _read_table_log(table_name)
+
+            if locked or (
+                get_table_format(table_name) == table_format
+                and _is_current_file(base_file, filepath)
+            ):
+                return base_file, table_format, entries
+        if base_file is not None:
+            base_file.close()
+
+# Читает согласованный снимок таблицы вместе с сегментами
+def _read_snapshot(table_name):
+    """
+    Возвращает (формат, основной файл, манифест, сегменты, записи журнала).
+    Основной файл колоночной таблицы возвращается открытым (закрывает
+    вызывающая сторона). У таблицы в формате JSON основной файл уже
+    прочитан и разобран (манифест или, в старом формате, вся таблица),
+    а сегменты прочитаны в байтах. Если сегмент удалил писатель,
+    заменивший манифест после нашего чтения, снимок перечитывается;
+    последняя попытка - под разделяемой блокировкой.
+    """
+    for attempt in range(SNAPSHOT_RETRIES + 1):
+        locked = attempt == SNAPSHOT_RETRIES
+        with table_lock(table_name, shared=True) if locked else nullcontext():
+            base_file, table_format, entries = _open_snapshot(table_name)
+            if base_file is None or table_format == "columnar":
+                return table_format, base_file, None, [], entries
+            with base_file:
+                content = base_file.read()
+            metrics.increment("bytes_read", len(content))
+            manifest = loads(content)
+            if not is_segmented(manifest):
+                return table_format, None, manifest, [], entries
+            try:
+                contents = read_segment_files(get_segments_dir(table_name), manifest)
+            except FileNotFoundError:
+                if locked:
+                    raise
+                continue
+            metrics.increment("bytes_read", sum(len(content) for content in contents))
+            return table_format, None, manifest, contents, entries
+
 # Загружает данные таблицы
-def load_table_data(table_name):
+@log_time
+def load_table_data(table_name, index_defs=None, columns=None):
+    """
+    Собирает таблицу из основного файла и журнала и строит индексы
+    (первичный по ID и перечисленные в index_defs).
+    columns - столбцы, которые нужны запросу: для колоночного формата
+    остальные не читаются (записи из журнала могут содержать и их).
+    Такие неполные данные нельзя сохранять обратно.
+    """
     ensure_data_dir()
+    with metrics.stage("чтение файлов"):
+        _, base_file, manifest, contents, entries = _read_snapshot(table_name)
+
+    with metrics.stage("разбор") as current:
+        if manifest is not None and is_segmented(manifest):
+            data = {
+                key: value
+                for key, value in manifest.items()
+                if key not in ("segments", "next_segment")
+            }
+            data["records"] = parse_segments(manifest, contents)
+        elif manifest is not None:
+            # Таблица в старом формате: все записи в основном файле
+            data = manifest
+            compact_records(data["records"])
+        elif base_file is None:
+            data = {"next_id": 1, "records": []}
+        else:
+            # Колоночный файл читается и разбирается вместе; учитываем
+            # весь файл, хотя часть столбцов может не читаться
+            with base_file:
+                metrics.increment("bytes_read", os.fstat(base_file.fileno()).st_size)
+                data = read_table(base_file, columns)
+        current.set_rows(len(data["records"]))
+
+    with metrics.stage("применение журнала") as current:
+        data = _replay_table_log(table_name, data, entries)
+        current.set_rows(len(data["records"]))
+    with metrics.stage("построение индексов"):
+        return build_indexes(data, index_defs)
+
+# Подпись файла: (mtime_ns, размер) или None, если файла нет
+def get_file_signature(filepath):
+    try:
+        stat = os.stat(filepath)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+# Подпись файлов таблицы: подписи основного файла и журнала
+def get_table_signature(table_name):
+    """
+    Меняется при любой записи в файлы таблицы, в том числе другим
+    процессом или вручную.
+    """
+    return (
+        get_file_signature(get_columnar_data_path(table_name)),
+        get_file_signature(get_table_data_path(table_name)),
+        get_file_signature(get_table_log_path(table_name)),
+    )
+
+# Проверяет, можно ли читать таблицу через mmap без загрузки целиком
+def supports_mapped_scan(table_name):
+    # Колоночный файл хранит числа в little-endian и читается без копирования
+    return get_table_format(table_name) == "columnar" and sys.byteorder == "little"
+
+# Выборка из таблицы в колоночном формате через mmap
+def scan_table_data(table_name, where, parallel=False, fields=None):
+    """
+    where - скомпилированное условие (planner.Where).
+    parallel=True - разрешить просмотр большого файла по частям
+    в нескольких процессах (если он включен, см. модуль parallel).
+    fields - столбцы записей результата (None - все; ID должен
+    входить в список, по нему записи сливаются с журналом).
+    Проверяет условие прямо по отображенному в память файлу и создает
+    записи только для подходящих строк. Строки, затронутые журналом,
+    берутся из файла, к ним применяется журнал, и затем они проверяются
+    условием.
+    Возвращает (итератор записей в порядке ID, версия таблицы). Записи
+    читаются по мере перебора, поэтому выборку можно прервать, не
+    просматривая весь файл.
+    """
+    if where.unsatisfiable:
+        # Условие невыполнимо по схеме - файл не просматриваем
+        return iter(()), get_mapped_table_version(table_name)
+    base_file, _, entries = _open_snapshot(table_name)
+    touched_ids = {
+        entry["record"]["ID"] if entry["op"] == "insert" else entry["ID"]
+        for entry in entries
+    }
+
+    try:
+        touched, header = read_rows_by_id(base_file, touched_ids)
+    except BaseException:
+        base_file.close()
+        raise
+    metrics.increment("rows_scanned", header["rows"])
+    overlay = {
+        "next_id": header["next_id"],
+        "version": header["version"],
+        "records": touched,
+    }
+    _replay_table_log(table_name, overlay, entries)
+
+    def record_id(record):
+        return record["ID"]
+
+    def scan():
+        # Файл снимка закрывается, когда перебор закончен или прерван
+        with base_file:
+            if parallel:
+                yield from scan_file(base_file, where, touched_ids, fields)
+            else:
+                yield from iter_scan_table(
+                    base_file, where, touched_ids, fields=fields
+                )
+
+    matched = scan()
+    extra = sorted(
+        (record for record in overlay["records"] if where.predicate(record)),
+        key=record_id,
+    )
+    if fields is not None:
+        extra = [{name: record[name] for name in fields} for record in extra]
+    if extra:
+        matched = heapq.merge(matched, extra, key=record_id)
+    return matched, overlay["version"]
+
+# Заголовок колоночного файла таблицы (число строк, версия, столбцы)
+def get_mapped_table_header(table_name):
+    with open(get_columnar_data_path(table_name), "rb") as file:
+        return read_header(file)
+
+# Возвращает текущую версию таблицы, читая только заголовок и журнал
+def get_mapped_table_version(table_name):
+    """
+    Если основного файла нет, таблица считается пустой: версия 0
+    (или из журнала).
+    """
+    base_file, _, entries = _open_snapshot(table_name)
+    version = 0
+    if base_file is not None:
+        with base_file:
+            version = read_header(base_file)["version"]
+    for entry in entries:
+        version = max(version, entry.get("version", 0))
+    return version
+
+# Число записей таблицы по манифесту или заголовку, без чтения записей
+def get_stored_row_count(table_name):
+    """
+    Возвращает None, если журнал таблицы не пуст (записи нужно
+    пересчитать) или таблица в старом формате JSON (манифеста нет).
+    """
+    log_path = get_table_log_path(table_name)
+    if os.path.exists(log_path) and os.path.getsize(log_path) > 0:
+        return None
+    if get_table_format(table_name) == "columnar":
+        return get_mapped_table_header(table_name)["rows"]
     filepath = get_table_data_path(table_name)
+    if not os.path.exists(filepath):
+        return 0
+    manifest = _read_manifest(filepath)
+    if manifest is None:
+        return None
+    return sum(
+        segment["rows"] - len(segment["deleted"]) for segment in manifest["segments"]
+    )
+
+# Отбрасывает служебные ключи (начинаются с "_"), которые не пишутся на диск
+def _persistent_part(data):
+    return {key: value for key, value in data.items() if not key.startswith("_")}
+
+# Имя временного файла для атомарной записи (свое у каждого процесса)
+def _temporary_path(filepath):
+    return f"{filepath}.{os.getpid()}.tmp"
+
+# Сбрасывает временный файл на диск и атомарно ставит его на место основного
+def _replace_file(tmp_path, filepath):
+    with open(tmp_path, "rb") as file:
+        os.fsync(file.fileno())
+    os.replace(tmp_path, filepath)
+
+# Читает манифест сегментов таблицы (None - его нет или формат старый)
+def _read_manifest(filepath):
     try:
-        with open(filepath, "r", encoding=ENCODING) as file:
-            return json.load(file)
+        with open(filepath, "rb") as file:
+            manifest = loads(file.read())
     except FileNotFoundError:
-        return {"next_id": 1, "records": []}
+        return None
+    return manifest if is_segmented(manifest) else None
+
+# Записывает таблицу в формате JSON по сегментам (под блокировкой таблицы)
+def _write_segments(table_name, data, vacuum=False, rewrite=False):
+    """
+    Переписываются только сегменты, затронутые журналом после прошлого
+    сохранения (см. модуль segments), поэтому журнал удаляется только
+    после записи. Если манифеста еще нет или таблица в старом формате
+    (целиком в основном файле), она пишется заново. vacuum=True -
+    очистка: сегменты переписываются без удаленных записей, а файлы,
+    на которые манифест не ссылается, удаляются. rewrite=True - все
+    сегменты пишутся заново (например, после смены сжатия); так же
+    таблица пишется, если журнал покрывает не все изменения в data
+    (см. segments.log_covers_changes).
+    Новые сегменты сжимаются способом из data["compression"].
+    Возвращает (прежний манифест или None, новый манифест).
+    """
+    filepath = get_table_data_path(table_name)
+    directory = get_segments_dir(table_name)
+    manifest = _read_manifest(filepath)
+    entries = [] if manifest is None else _read_table_log(table_name)
+    if manifest is not None and not log_covers_changes(manifest, entries, data):
+        rewrite = True
+    planned = manifest
+    if rewrite and manifest is not None:
+        # Без сегментов все записи считаются новыми; номера файлов
+        # продолжаются, чтобы не совпасть с файлами старого манифеста
+        planned = dict(manifest, next_id=0, segments=[])
+    compression = data.get("compression", "none")
+    segments, next_segment, writes, obsolete = plan_segments(
+        planned, data["records"], entries, vacuum, segment_extension(compression)
+    )
+
+    os.makedirs(directory, exist_ok=True)
+    for name, records in writes:
+        size = write_segment(os.path.join(directory, name), records, compression)
+        metrics.increment("bytes_written", size)
+
+    new_manifest = {
+        key: value for key, value in _persistent_part(data).items() if key != "records"
+    }
+    new_manifest["next_segment"] = next_segment
+    new_manifest["segments"] = segments
+    tmp_path = _temporary_path(filepath)
+    with open(tmp_path, "wb") as file:
+        file.write(dumps(new_manifest))
+    metrics.increment("bytes_written", os.path.getsize(tmp_path))
+    _replace_file(tmp_path, filepath)
+
+    # Старые файлы удаляем только после замены манифеста
+    if vacuum or rewrite or manifest is None:
+        referenced = {segment["file"] for segment in segments}
+        obsolete = [name for name in os.listdir(directory) if name not in referenced]
+    for name in obsolete:
+        _remove_if_exists(os.path.join(directory, name))
+    return manifest, new_manifest
+
+# Записывает основной файл таблицы в нужном формате
+def _write_base_file(table_name, data, table_format, columns=None):
+    """
+    Колоночный файл пишется целиком через временный файл, таблица
+    в формате JSON - по сегментам (см. _write_segments).
+    """
+    if table_format != "columnar":
+        _write_segments(table_name, data)
+        return
+    filepath = get_columnar_data_path(table_name)
+    tmp_path = _temporary_path(filepath)
+    write_table(tmp_path, data, columns or read_schema(filepath))
+    metrics.increment("bytes_written", os.path.getsize(tmp_path))
+    _replace_file(tmp_path, filepath)
+
+# Удаляет файл, если он существует
+def _remove_if_exists(filepath):
+    if os.path.exists(filepath):
+        os.remove(filepath)
+
+# Удаляет каталог сегментов таблицы вместе с файлами
+def _remove_segments(table_name):
+    directory = get_segments_dir(table_name)
+    if os.path.isdir(directory):
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+        os.rmdir(directory)
+
+# Суммарный размер файлов сегментов таблицы в байтах
+def _segments_size(table_name):
+    directory = get_segments_dir(table_name)
+    if not os.path.isdir(directory):
+        return 0
+    return sum(
+        os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory)
+    )
 
 # Сохраняет данные таблицы
 @handle_db_errors
+@log_time
 def save_table_data(table_name, data):
-    ensure_data_dir()
-    filepath = get_table_data_path(table_name)
-    with open(filepath, "w", encoding=ENCODING) as file:
-        json.dump(data, file, indent=4, ensure_ascii=False)
+    """
+    Переносит изменения на диск и очищает журнал: таблица в формате
+    JSON переписывает только сегменты, затронутые журналом, колоночный
+    файл перезаписывается целиком. Запись идет через новые или временные
+    файлы, чтобы сбой не оставил таблицу наполовину, а читатели видели
+    либо старую, либо новую версию целиком.
+    data должны быть актуальны: вызывающая сторона держит блокировку
+    таблицы с момента чтения, иначе изменения других процессов потеряются.
+    """
+    with table_lock(table_name):
+        _write_base_file(table_name, data, get_table_format(table_name))
+        _remove_if_exists(get_table_log_path(table_name))
+    return True
+
+# Готовит файлы новой таблицы в выбранном формате
+@handle_db_errors
+def init_table_storage(table_name, schema, table_format="json"):
+    """
+    Удаляет файлы, оставшиеся от одноименной удаленной таблицы.
+    Для колоночного формата сразу создает пустой файл со схемой,
+    по которому потом определяется формат таблицы.
+    """
+    with table_lock(table_name):
+        _remove_if_exists(get_table_data_path(table_name))
+        _remove_if_exists(get_columnar_data_path(table_name))
+        _remove_if_exists(get_table_log_path(table_name))
+        _remove_segments(table_name)
+        if table_format == "columnar":
+            empty = {"next_id": 1, "version": 0, "records": []}
+            _write_base_file(table_name, empty, "columnar", _columnar_schema(schema))
+
+# Переводит таблицу в другой формат хранения
+@handle_db_errors
+def convert_table_format(table_name, schema, table_format):
+    """
+    Новый основной файл пишется раньше, чем удаляется старый, поэтому
+    после сбоя таблица читается либо в старом, либо в новом формате.
+    """
+    with table_lock(table_name):
+        data = load_table_data(table_name)
+        old_format = get_table_format(table_name)
+        _write_base_file(table_name, data, table_format, _columnar_schema(schema))
+        if old_format == "columnar" and table_format == "json":
+            _remove_if_exists(get_columnar_data_path(table_name))
+        elif table_format == "columnar":
+            _remove_if_exists(get_table_data_path(table_name))
+            _remove_segments(table_name)
+        _remove_if_exists(get_table_log_path(table_name))
 
+# Направляет записи журналов таблиц в буфер на время блока with
+@contextmanager
+def buffered_table_log(buffer):
+    """
+    buffer - словарь {таблица: [записи журнала]}. Пока поток выполняет
+    блок, append_table_log не пишет в журналы, а копит записи в буфере
+    (так транзакция собирает свои изменения до COMMIT).
+    """
+    previous = getattr(_log_buffer, "value", None)
+    _log_buffer.value = buffer
+    try:
+        yield
+    finally:
+        _log_buffer.value = previous
+
+# Дописывает изменения в журнал таблицы
+@handle_db_errors
+def append_table_log(table_name, entries, data=None, durable=False, compact=True):
+    """
+    Добавляет записи журнала (по одной строке на операцию) в конец файла
+    одной операцией записи. durable=True дополнительно сбрасывает файл
+    на диск (fsync).
+    Если журнал вырос больше LOG_COMPACT_SIZE и compact=True, он сливается
+    с основным файлом. data - полное текущее состояние таблицы; если его
+    нет, таблица для слияния загружается заново.
+    Запись идет под блокировкой таблицы. Внутри транзакции записи только
+    копятся в её буфере (см. buffered_table_log).
+    """
+    if not entries:
+        return
+    buffer = getattr(_log_buffer, "value", None)
+    if buffer is not None:
+        buffer.setdefault(table_name, []).extend(entries)
+        return
+    write_table_log(table_name, entries, data, durable, compact)
+
+# Записывает изменения в журнал таблицы (ошибки передаются вызывающей стороне)
+def write_table_log(table_name, entries, data=None, durable=False, compact=True):
+    """
+    Параметры - как у append_table_log, но буфер транзакции не учитывается.
+    """
+    log_path = get_table_log_path(table_name)
+    lines = b"".join(dumps_line(entry) for entry in entries)
+    with table_lock(table_name):
+        _repair_table_log(table_name)
+        with open(log_path, "ab") as file:
+            file.write(lines)
+            metrics.increment("bytes_written", len(lines))
+            if durable:
+                file.flush()
+                os.fsync(file.fileno())
+
+        if compact and os.path.getsize(log_path) > LOG_COMPACT_SIZE:
+            if data is None:
+                data = load_table_data(table_name)
+            save_table_data(table_name, data)
+
+# Сливает журнал таблицы с основным файлом
+@handle_db_errors
+def compact_table(table_name):
+    with table_lock(table_name):
+        save_table_data(table_name, load_table_data(table_name))
+
+# Очищает таблицу от удаленных записей и сливает её журнал
+@handle_db_errors
+def vacuum_table(table_name):
+    """
+    Сегменты с удаленными записями (надгробиями) переписываются без них,
+    соседние неполные сегменты объединяются, файлы, на которые манифест
+    не ссылается (остатки после сбоя), удаляются. Колоночная таблица
+    надгробий не хранит и просто переписывается.
+    Возвращает {"reclaimed": освобождено записей, "segments": (было, стало)};
+    для колоночной таблицы "segments" - None.
+    """
+    with table_lock(table_name):
+        data = load_table_data(table_name)
+        if get_table_format(table_name) == "columnar":
+            save_table_data(table_name, data)
+            return {"reclaimed": 0, "segments": None}
+        old, new = _write_segments(table_name, data, vacuum=True)
+        _remove_if_exists(get_table_log_path(table_name))
+
+    if old is None:
+        return {"reclaimed": 0, "segments": (0, len(new["segments"]))}
+    # Записи в старых файлах минус живые из них (с ID до next_id)
+    stored = sum(segment["rows"] for segment in old["segments"])
+    live = bisect_left(data["records"], old["next_id"], key=itemgetter("ID"))
+    return {
+        "reclaimed": stored - live,
+        "segments": (len(old["segments"]), len(new["segments"])),
+    }
+
+# Меняет сжатие сегментов таблицы в формате JSON
+@handle_db_errors
+def set_table_compression(table_name, method):
+    """
+    method - gzip, zstd или none. Способ хранится в манифесте, и им
+    сжимаются все сегменты, которые пишутся потом. Сейчас же все
+    сегменты переписываются, а журнал сливается с ними.
+    Возвращает (размер сегментов до, после) в байтах.
+    """
+    check_compression(method)
+    with table_lock(table_name):
+        if get_table_format(table_name) == "columnar":
+            raise ValueError("сжатие доступно только для таблиц в формате json")
+        before = _segments_size(table_name)
+        data = load_table_data(table_name)
+        data["compression"] = method
+        _write_segments(table_name, data, rewrite=True)
+        _remove_if_exists(get_table_log_path(table_name))
+        return before, _segments_size(table_name)
+
+
+# Построчно читает файл импорта (CSV с заголовком или JSON Lines)
+def iter_import_rows(filepath):
+    """
+    Возвращает генератор пар (номер строки, {столбец: значение});
+    для строки, которую не удалось разобрать, вместо словаря - None.
+    Формат определяется по расширению: .csv или .jsonl/.ndjson.
+    Файл читается потоком, целиком в память не загружается.
+    """
+    extension = os.path.splitext(filepath)[1].lower()
+    if extension not in IMPORT_FORMATS:
+        raise ValueError(
+            f"неизвестный формат файла {filepath}, ожидается .csv или .jsonl"
+        )
+
+    with open(filepath, "r", encoding=ENCODING, newline="") as file:
+        if IMPORT_FORMATS[extension] == "csv":
+            reader = csv.DictReader(file)
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for line_number, line in enumerate(file, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    yield line_number, json.loads(line)
+                except json.JSONDecodeError:
+                    # Битая строка не прерывает импорт, её отбросит вызывающий
+                    yield line_number, None
+
+# Приблизительный размер результата в байтах (список записей-словарей)
+def approximate_size(value):
+    size = sys.getsizeof(value)
+    if isinstance(value, list):
+        for item in value:
+            size += sys.getsizeof(item)
+            if isinstance(item, dict):
+                size += sum(sys.getsizeof(v) for v in item.values())
+    return size
 
 # Функция с замыканием для кэширования результатов
-def create_cacher():
+def create_cacher(max_size=None, max_bytes=None, sizeof=approximate_size):
     """
     Создает функцию кэширования с замыканием.
+    Кэш вытесняет давно не использованные записи (LRU), когда число
+    записей превышает max_size или их суммарный размер - max_bytes.
+    None означает отсутствие ограничения.
     """
-    # Кэш хранится в замыкании
-    cache = {}
+    # Кэш хранится в замыкании: ключ -> (результат, размер)
+    cache = OrderedDict()
+    limits = {"max_size": max_size, "max_bytes": max_bytes}
+    counters = {"hits": 0, "misses": 0, "evictions": 0, "bytes": 0}
+    lock = threading.RLock()
+
+    def evict():
+        """Вытесняет старые записи, пока кэш не уложится в лимиты"""
+        while cache and (
+            (limits["max_size"] is not None and len(cache) > limits["max_size"])
+            or (limits["max_bytes"] is not None
+                and counters["bytes"] > limits["max_bytes"])
+        ):
+            _, (_, size) = cache.popitem(last=False)
+            counters["bytes"] -= size
+            counters["evictions"] += 1
 
     def cache_result(key, value_func):
         """
         Функция для кэширования результатов.
+        Безопасна для вызова из нескольких потоков; сам результат
+        вычисляется вне блокировки кэша.
         """
-        # Проверяем, есть ли результат в кэше
-        if key in cache:
-            print(f"[CACHE HIT] Возвращен кэшированный результат для ключа: {key}")
-            return cache[key]
+        with lock:
+            # Проверяем, есть ли результат в кэше
+            if key in cache:
+                counters["hits"] += 1
+                cache.move_to_end(key)
+                return cache[key][0]
+            counters["misses"] += 1
 
         # Если результата нет, вызываем функцию для получения данных
-        print(f"[CACHE MISS] Вычисление результата для ключа: {key}")
         result = value_func()
 
-        # Сохраняем результат в кэш
-        cache[key] = result
+        # Сохраняем результат в кэш и вытесняем лишнее
+        size = sizeof(result)
+        with lock:
+            if key in cache:
+                # Тот же результат успел вычислить другой поток
+                counters["bytes"] -= cache[key][1]
+            cache[key] = (result, size)
+            counters["bytes"] += size
+            evict()
 
         return result
 
     # Добавляем методы для управления кэшем
     def clear_cache():
         """Очистить весь кэш"""
-        cache.clear()
-        print("[CACHE] Кэш очищен")
+        with lock:
+            cache.clear()
+            counters["bytes"] = 0
+        metrics.increment("cache_clears")
+
+    def resize_cache(max_size=None, max_bytes=None):
+        """Изменить лимиты кэша"""
+        limits["max_size"] = max_size
+        limits["max_bytes"] = max_bytes
+        with lock:
+            evict()
+
+    def contains_key(key):
+        """Проверить, есть ли результат в кэше (порядок LRU не меняется)"""
+        with lock:
+            return key in cache
 
     def get_cache_stats():
         """Получить статистику кэша"""
+        lookups = counters["hits"] + counters["misses"]
         return {
             "size": len(cache),
-            "keys": list(cache.keys())
+            "bytes": counters["bytes"],
+            "max_size": limits["max_size"],
+            "max_bytes": limits["max_bytes"],
+            "hits": counters["hits"],
+            "misses": counters["misses"],
+            "evictions": counters["evictions"],
+            "hit_ratio": counters["hits"] / lookups if lookups else 0.0,
+            "keys": list(cache.keys()),
         }
 
     # Добавляем дополнительные методы к функции
     cache_result.clear = clear_cache
+    cache_result.resize = resize_cache
     cache_result.stats = get_cache_stats
+    cache_result.contains = contains_key
 
-    return cache_result
\ No newline at end of file
+    return cache_result
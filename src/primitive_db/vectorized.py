@@ -0,0 +1,196 @@
+"""
+Векторное выполнение условий WHERE на NumPy.
+
+Столбцы таблицы хранятся в служебном ключе "_columns" данных таблицы
+в виде массивов: int - int64, bool - bool, str - коды словаря (int32).
+Массивы строятся лениво, только для столбцов из условия, и действуют,
+пока версия таблицы совпадает с "_columns_version". NumPy - необязательная
+зависимость: без неё модуль сообщает, что недоступен, и используется
+обычный перебор записей.
+"""
+import operator
+
+try:
+    import numpy as np
+except ImportError:  # NumPy не установлен - векторное выполнение недоступно
+    np = None
+
+COLUMNS_KEY = "_columns"
+COLUMNS_VERSION_KEY = "_columns_version"
+
+# Отметка об отсутствии столбца в записи
+_MISSING = object()
+
+_OPERATORS = {
+    "=": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+
+# Проверяет, установлен ли NumPy
+def is_available():
+    return np is not None
+
+# Кодирует значения столбца в массив; None - если типы значений смешаны
+def _encode_column(values):
+    kinds = {type(value) for value in values}
+    if kinds == {object}:
+        return {"kind": "missing"}
+    if kinds <= {bool}:
+        return {"kind": "bool", "array": np.array(values, dtype=bool)}
+    if kinds <= {int}:
+        try:
+            return {"kind": "int", "array": np.array(values, dtype=np.int64)}
+        except OverflowError:
+            return None
+    if kinds <= {str}:
+        lookup = {}
+        codes = np.fromiter(
+            (lookup.setdefault(value, len(lookup)) for value in values),
+            dtype=np.int32,
+            count=len(values),
+        )
+        return {"kind": "str", "array": codes, "lookup": lookup}
+    return None
+
+# Возвращает закодированный столбец, строя его при первом обращении
+def _get_column(table_data, name):
+    version = table_data.get("version", 0)
+    if table_data.get(COLUMNS_VERSION_KEY) != version:
+        table_data[COLUMNS_KEY] = {}
+        table_data[COLUMNS_VERSION_KEY] = version
+
+    columns = table_data[COLUMNS_KEY]
+    if name not in columns:
+        columns[name] = _encode_column(
+            [record.get(name, _MISSING) for record in table_data["records"]]
+        )
+    return columns[name]
+
+# Сравнение по оператору условия с учетом семантики обычного перебора
+_NUMPY_OPERATORS = {
+    "=": lambda array, value: array == value,
+    "!=": lambda array, value: array != value,
+    "<": lambda array, value: array < value,
+    "<=": lambda array, value: array <= value,
+    ">": lambda array, value: array > value,
+    ">=": lambda array, value: array >= value,
+}
+
+# Маска строк, где значение столбца удовлетворяет оператору
+def _compare_mask(column, op, value, rows):
+    """
+    Возвращает None, если сравнение нельзя выполнить на массиве.
+    """
+    kind = column["kind"]
+    if kind == "missing":
+        return np.zeros(rows, dtype=bool)
+
+    if kind == "str":
+        # Сравниваем уникальные значения словаря и отбираем их коды
+        codes = []
+        for item, code in column["lookup"].items():
+            try:
+                if _OPERATORS[op](item, value):
+                    codes.append(code)
+            except TypeError:
+                pass
+        return np.isin(column["array"], codes)
+
+    if isinstance(value, str):
+        # Число со строкой равно не бывает, а упорядочить их нельзя
+        return np.full(rows, op == "!=", dtype=bool)
+    if not isinstance(value, int):
+        return None
+    if kind == "bool" and op in ("=", "!=") and value not in (True, False):
+        return np.full(rows, op == "!=", dtype=bool)
+    try:
+        return _NUMPY_OPERATORS[op](column["array"], np.int64(value))
+    except OverflowError:
+        return None
+
+# Маска строк для узла дерева условия
+def _node_mask(table_data, node, rows):
+    kind = node[0]
+    if kind in ("and", "or"):
+        masks = [_node_mask(table_data, child, rows) for child in node[1]]
+        if any(mask is None for mask in masks):
+            return None
+        combine = np.logical_and if kind == "and" else np.logical_or
+        return combine.reduce(masks)
+
+    column = _get_column(table_data, node[1])
+    if column is None:
+        return None
+    if kind == "in":
+        masks = [_compare_mask(column, "=", value, rows) for value in node[2]]
+        if any(mask is None for mask in masks):
+            return None
+        if not masks:
+            return np.zeros(rows, dtype=bool)
+        return np.logical_or.reduce(masks)
+    return _compare_mask(column, node[2], node[3], rows)
+
+# Номера строк, подходящих под условие
+def match_positions(table_data, where):
+    """
+    where - скомпилированное условие (planner.Where).
+    Возвращает массив номеров строк в порядке записей или None,
+    если какой-то столбец условия не удалось представить массивом.
+    """
+    rows = len(table_data["records"])
+    if where.ast is None:
+        return np.arange(rows)
+    mask = _node_mask(table_data, where.ast, rows)
+    if mask is None:
+        return None
+    return np.flatnonzero(mask)
+
+# Выбирает записи по номерам строк
+def take_records(table_data, positions):
+    records = table_data["records"]
+    return [records[position] for position in positions.tolist()]
+
+# Переносит обновление записей в массивы столбцов
+def apply_update(table_data, positions, values):
+    """
+    values - новые значения столбцов, уже записанные в записи.
+    Массивы обновляются по маске и остаются действительными
+    для новой версии таблицы.
+    """
+    columns = table_data.get(COLUMNS_KEY, {})
+    for name, value in values.items():
+        column = columns.get(name)
+        if column is None:
+            continue
+        kind = column["kind"]
+        if kind == "int" and type(value) is int:
+            try:
+                column["array"][positions] = value
+                continue
+            except OverflowError:
+                pass
+        elif kind == "bool" and type(value) is bool:
+            column["array"][positions] = value
+            continue
+        elif kind == "str" and type(value) is str:
+            lookup = column["lookup"]
+            column["array"][positions] = lookup.setdefault(value, len(lookup))
+            continue
+        # Тип нового значения не подходит массиву - перестроим при надобности
+        del columns[name]
+    table_data[COLUMNS_VERSION_KEY] = table_data.get("version", 0)
+
+# Удаляет строки по маске из записей и из массивов столбцов
+def apply_delete(table_data, positions):
+    keep = np.ones(len(table_data["records"]), dtype=bool)
+    keep[positions] = False
+    table_data["records"] = take_records(table_data, np.flatnonzero(keep))
+    for column in table_data.get(COLUMNS_KEY, {}).values():
+        if column is not None and "array" in column:
+            column["array"] = column["array"][keep]
+    table_data[COLUMNS_VERSION_KEY] = table_data.get("version", 0)
@@ -0,0 +1,56 @@
+"""
+Общие фикстуры тестов.
+
+Файлы базы (data/, db_meta.json) лежат в текущей директории, поэтому
+каждый тест работает в своей пустой временной директории. Опасные
+операции подтверждаются без вопросов, а кэш select очищается между
+тестами: его ключи (таблица, версия) повторяются в разных тестах.
+"""
+import pytest
+
+from primitive_db.core import clear_select_cache
+from primitive_db.decorators import get_confirmation_mode, set_confirmation_mode
+from primitive_db.engine import (
+    close_session,
+    execute_command,
+    new_session,
+    query_records,
+)
+
+
+# Пустая рабочая директория и подтверждение без вопросов
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    mode = get_confirmation_mode()
+    set_confirmation_mode("yes")
+    clear_select_cache()
+    yield tmp_path
+    set_confirmation_mode(mode)
+    clear_select_cache()
+
+# Сеанс работы с базой, как у консоли или пакетного режима
+@pytest.fixture
+def session():
+    session = new_session()
+    yield session
+    close_session(session)
+
+# Выполняет команды в сеансе и возвращает их вывод
+@pytest.fixture
+def run(session, capsys):
+    def run_commands(*commands):
+        capsys.readouterr()
+        for command in commands:
+            execute_command(session, command)
+        return capsys.readouterr().out
+
+    return run_commands
+
+# Выполняет select в сеансе и возвращает записи (None - ошибка в команде)
+@pytest.fixture
+def query(session):
+    def run_query(command):
+        return query_records(session, command)
+
+    return run_query
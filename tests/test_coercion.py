@@ -0,0 +1,101 @@
+"""
+Приведение значений insert, литералов WHERE и значений SET к типам
+столбцов таблицы.
+"""
+import pytest
+
+from primitive_db.coercion import coerce_literal, row_converter
+from primitive_db.planner import bind_where, compile_where_text
+
+
+# Таблица с записью каждого типа в строковом и числовом столбцах
+@pytest.fixture(params=["json", "columnar"])
+def users(request, run):
+    table_format = "" if request.param == "json" else " format=columnar"
+    run(
+        f"create_table users name:str age:int active:bool{table_format}",
+        "insert users 5 28 true",
+        "insert users b 30 false",
+        "checkpoint",
+    )
+    return "users"
+
+
+# Литерал-строка по столбцу int сравнивается как число
+def test_string_literal_matches_int_column(users, query):
+    assert query("select users WHERE age = '28'") == [
+        {"name": "5", "age": 28, "active": True, "ID": 1}
+    ]
+    rows = query("select users WHERE age IN ('28', 30)")
+    assert [row["ID"] for row in rows] == [1, 2]
+
+# Число по столбцу str сравнивается как строка, логическое - по bool
+def test_literals_are_coerced_to_column_type(users, query):
+    assert [row["ID"] for row in query("select users WHERE name = 5")] == [1]
+    assert [row["ID"] for row in query("select users WHERE active = 'no'")] == [2]
+
+# Значение, которое нельзя привести к типу, не совпадает ни с чем
+def test_unsatisfiable_condition_returns_nothing(users, query, run):
+    assert query("select users WHERE age = 'abc'") == []
+    assert query("select users WHERE missing = 1") == []
+    rows = query("select users WHERE age = 'abc' OR age = 30")
+    assert [row["ID"] for row in rows] == [2]
+    assert "невыполнимо" in run("explain select users WHERE age = 'abc'")
+
+# Значения SET приводятся к типу столбца; чужой столбец и ID - ошибка
+def test_set_values_are_coerced(users, run, query):
+    run("update users SET age = '40' WHERE name = b")
+    assert query("select users WHERE name = b")[0]["age"] == 40
+
+    assert run("update users SET age = abc WHERE name = b").startswith(
+        "Ошибка: Некорректное значение 'abc'"
+    )
+    assert run("update users SET missing = 1 WHERE name = b").startswith(
+        'Ошибка: Столбец "missing" не найден'
+    )
+    assert run("update users SET ID = 7 WHERE name = b").startswith(
+        'Ошибка: Столбец "ID" изменять нельзя.'
+    )
+    assert query("select users WHERE ID = 2")[0]["age"] == 40
+
+# Значения insert переводятся функцией, собранной для схемы
+def test_row_converter():
+    convert = row_converter({"name": "str", "age": "int", "active": "bool"})
+
+    assert convert(["a", "28", "Yes"]) == (
+        {"name": "a", "age": 28, "active": True},
+        None,
+    )
+    record, error = convert(["a", "x", "true"])
+    assert record is None
+    assert error == "Ошибка: Некорректное значение 'x' для столбца 'age' типа 'int'."
+    assert row_converter({"name": "str", "age": "int"}) is row_converter(
+        {"name": "str", "age": "int"}
+    )
+
+# Литерал условия или SET по типу столбца
+@pytest.mark.parametrize(
+    ("value", "col_type", "expected"),
+    [
+        ("28", "int", 28),
+        (28, "str", "28"),
+        (True, "str", "true"),
+        (1, "bool", True),
+        ("no", "bool", False),
+    ],
+)
+def test_coerce_literal(value, col_type, expected):
+    assert coerce_literal(value, col_type) == expected
+
+# Логическое значение не число, а произвольное число - не логическое
+@pytest.mark.parametrize(("value", "col_type"), [(True, "int"), (2, "bool")])
+def test_coerce_literal_rejects(value, col_type):
+    with pytest.raises(ValueError):
+        coerce_literal(value, col_type)
+
+# Привязка к схеме отмечает условие, которое не может выполниться
+def test_bind_where_marks_unsatisfiable():
+    schema = {"ID": "int", "age": "int"}
+
+    assert bind_where(compile_where_text("age = 'abc'"), schema).unsatisfiable
+    assert not bind_where(compile_where_text("age = '28'"), schema).unsatisfiable
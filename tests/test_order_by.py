@@ -0,0 +1,115 @@
+"""
+ORDER BY, LIMIT и OFFSET в select, в том числе с GROUP BY.
+"""
+import pytest
+
+# Возраст записей: повторы проверяют порядок равных значений по ID
+AGES = [30, 20, 40, 20, 50, 30, 10]
+
+
+# Таблица users с записями AGES в выбранном формате
+@pytest.fixture(params=["json", "columnar"])
+def users(request, run):
+    table_format = "" if request.param == "json" else " format=columnar"
+    run(f"create_table users name:str age:int{table_format}")
+    run(*(f"insert users n{number} {age}" for number, age in enumerate(AGES, 1)))
+    run("checkpoint")
+    return "users"
+
+# ID записей в порядке возраста (равные - по ID), как должен вернуть select
+def _expected_ids(descending=False):
+    ids = sorted(range(1, len(AGES) + 1), key=lambda record_id: AGES[record_id - 1])
+    if descending:
+        ids = sorted(ids, key=lambda record_id: -AGES[record_id - 1])
+    return ids
+
+# ID записей результата
+def _ids(rows):
+    return [row["ID"] for row in rows]
+
+
+# ORDER BY по возрастанию и убыванию, равные значения - в порядке ID
+@pytest.mark.parametrize("descending", [False, True])
+def test_order_by(users, query, descending):
+    direction = " DESC" if descending else ""
+
+    rows = query(f"select users ORDER BY age{direction}")
+
+    assert _ids(rows) == _expected_ids(descending)
+
+# Страница упорядоченной выборки (LIMIT и OFFSET)
+@pytest.mark.parametrize("descending", [False, True])
+def test_order_by_with_limit_and_offset(users, query, descending):
+    direction = " DESC" if descending else ""
+
+    rows = query(f"select users ORDER BY age{direction} LIMIT 3 OFFSET 2")
+
+    assert _ids(rows) == _expected_ids(descending)[2:5]
+
+# ORDER BY вместе с условием и списком столбцов без столбца сортировки
+def test_order_by_with_where_and_projection(users, query):
+    rows = query("select name FROM users WHERE age >= 30 ORDER BY age DESC LIMIT 2")
+
+    assert rows == [{"name": "n5"}, {"name": "n3"}]
+
+# LIMIT без ORDER BY - первые записи в порядке ID
+def test_limit_without_order(users, query):
+    assert _ids(query("select users LIMIT 2 OFFSET 3")) == [4, 5]
+
+# По сортированному индексу страница набирается без сортировки
+@pytest.mark.parametrize("descending", [False, True])
+def test_order_by_sorted_index(run, query, descending):
+    run("create_table users name:str age:int")
+    run(*(f"insert users n{number} {age}" for number, age in enumerate(AGES, 1)))
+    run("create_index users age sorted")
+    direction = " DESC" if descending else ""
+    command = f"select users ORDER BY age{direction} LIMIT 4"
+
+    assert "сортированный индекс, без сортировки" in run(f"explain {command}")
+    assert _ids(query(command)) == _expected_ids(descending)[:4]
+    # Индекс следит за изменениями записей
+    run("update users SET age = 5 WHERE name = n5")
+    assert _ids(query(command))[:1] == ([3] if descending else [5])
+
+# Без индекса страница отбирается кучей, а не сортировкой всей выборки
+def test_order_by_limit_uses_heap(run):
+    run("create_table users name:str age:int", "insert users a 1")
+
+    output = run("explain select users ORDER BY age LIMIT 3 OFFSET 1")
+
+    assert "отбор первых 4 записей кучей" in output
+
+# GROUP BY с ORDER BY по ключу группы и страницей групп
+def test_group_order_by_with_limit(users, query):
+    rows = query(
+        "select age, COUNT(*) FROM users GROUP BY age ORDER BY age DESC "
+        "LIMIT 2 OFFSET 1"
+    )
+
+    assert rows == [{"age": 40, "COUNT(*)": 1}, {"age": 30, "COUNT(*)": 2}]
+
+# ORDER BY с агрегатами возможен только по ключу группы
+def test_group_order_by_other_column_is_rejected(users, run):
+    output = run("select age, COUNT(*) FROM users GROUP BY age ORDER BY name")
+
+    assert "ORDER BY с агрегатами возможен только по столбцу GROUP BY" in output
+
+
+# ORDER BY по ключу группы, которого нет в списке select
+def test_group_order_by_key_not_selected(run, query):
+    run(
+        "create_table users name:str age:int",
+        "insert users a 30",
+        "insert users b 20",
+        "insert users c 30",
+    )
+
+    rows = query("select COUNT(*) FROM users GROUP BY age ORDER BY age")
+    assert rows == [{"COUNT(*)": 1}, {"COUNT(*)": 2}]
+
+    rows = query("select COUNT(*) FROM users GROUP BY age ORDER BY age DESC LIMIT 1")
+    assert rows == [{"COUNT(*)": 2}]
+
+    # Повтор из кэша select не теряет ключ группы
+    rows = query("select age, COUNT(*) FROM users GROUP BY age ORDER BY age DESC")
+    assert rows == [{"age": 30, "COUNT(*)": 2}, {"age": 20, "COUNT(*)": 1}]
@@ -0,0 +1,109 @@
+"""
+Сегменты таблиц в формате JSON: надгробия удаленных записей,
+частичная перезапись при сохранении и очистка (vacuum).
+"""
+import os
+
+import pytest
+
+from primitive_db import core, segments
+from primitive_db.serializer import loads
+from primitive_db.utils import (
+    compact_table,
+    get_segments_dir,
+    get_table_data_path,
+    load_table_data,
+    save_table_data,
+    vacuum_table,
+)
+
+
+# Маленькие сегменты, чтобы таблица из десятка записей занимала несколько
+@pytest.fixture(autouse=True)
+def small_segments(monkeypatch):
+    monkeypatch.setattr(segments, "SEGMENT_ROWS", 4)
+
+# Таблица из 12 записей в трех сегментах
+@pytest.fixture
+def users(run):
+    run("create_table users name:str age:int")
+    run(*(f"insert users n{number} {number}" for number in range(1, 13)))
+    compact_table("users")
+    return "users"
+
+# Манифест сегментов таблицы
+def _manifest(table_name):
+    with open(get_table_data_path(table_name), "rb") as file:
+        return loads(file.read())
+
+# Имена файлов сегментов по манифесту
+def _files(table_name):
+    return [segment["file"] for segment in _manifest(table_name)["segments"]]
+
+# ID записей таблицы
+def _ids(table_name):
+    return [record["ID"] for record in load_table_data(table_name)["records"]]
+
+
+# Таблица пишется сегментами по SEGMENT_ROWS записей
+def test_table_is_split_into_segments(users):
+    manifest = _manifest(users)
+
+    assert [segment["first_id"] for segment in manifest["segments"]] == [1, 5, 9]
+    assert [segment["rows"] for segment in manifest["segments"]] == [4, 4, 4]
+    assert sorted(os.listdir(get_segments_dir(users))) == sorted(_files(users))
+
+# Удаление записывает надгробие, а файл сегмента не переписывается
+def test_delete_adds_tombstone(run, users):
+    files = _files(users)
+
+    run("delete users WHERE name = n6")
+    compact_table(users)
+
+    assert _files(users) == files
+    assert _manifest(users)["segments"][1]["deleted"] == [6]
+    assert 6 not in _ids(users)
+
+# Обновление переписывает только сегмент измененной записи
+def test_update_rewrites_only_touched_segment(run, users):
+    files = _files(users)
+
+    run("update users SET age = 100 WHERE name = n10")
+    compact_table(users)
+
+    new_files = _files(users)
+    assert new_files[:2] == files[:2]
+    assert new_files[2] != files[2]
+    record = load_table_data(users)["records"][9]
+    assert (record["name"], record["age"]) == ("n10", 100)
+
+# Изменения в памяти без журнала тоже попадают на диск
+def test_in_memory_changes_are_saved(users):
+    data = load_table_data(users)
+    core.update(data, {"age": 100}, {"name": "n2"})
+    core.delete(data, {"name": "n7"})
+
+    save_table_data(users, data)
+
+    records = {record["ID"]: record for record in load_table_data(users)["records"]}
+    assert records[2]["age"] == 100
+    assert 7 not in records
+
+# Очистка убирает надгробия, объединяет неполные сегменты и старые файлы
+def test_vacuum_reclaims_deleted_records(run, users, monkeypatch):
+    # Сохранение само не переписывает сегменты с надгробиями
+    monkeypatch.setattr(segments, "VACUUM_DEAD_RATIO", 1.0)
+    # Два последних сегмента становятся неполными и объединяются
+    run("delete users WHERE age IN (6, 7, 11, 12)")
+    compact_table(users)
+    ids = _ids(users)
+
+    result = vacuum_table(users)
+
+    assert result["reclaimed"] == 4
+    manifest = _manifest(users)
+    assert all(not segment["deleted"] for segment in manifest["segments"])
+    assert sum(segment["rows"] for segment in manifest["segments"]) == len(ids)
+    assert result["segments"] == (3, 2)
+    assert sorted(os.listdir(get_segments_dir(users))) == sorted(_files(users))
+    assert _ids(users) == ids == [1, 2, 3, 4, 5, 8, 9, 10]
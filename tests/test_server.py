@@ -0,0 +1,142 @@
+"""
+Протокол серверного режима: строки записей select и завершающая строка
+{"ok", "messages"} для каждой команды клиента.
+"""
+import asyncio
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from primitive_db import server
+from primitive_db.constants import ENCODING, SERVER_LINE_LIMIT
+from primitive_db.decorators import set_confirmation_mode
+from primitive_db.engine import close_session, new_session
+
+# Сокет в рабочей директории теста: относительный путь не упирается
+# в ограничение длины пути Unix-сокета
+SOCKET_PATH = "db.sock"
+
+
+# Запускает сервер на время работы клиента, как _serve, но без сигналов
+async def _with_server(client):
+    state = {
+        "session": new_session(),
+        "output": server._ThreadOutput(sys.stdout),
+        "executor": ThreadPoolExecutor(2),
+        "session_lock": server._ReadWriteLock(),
+        "table_locks": {},
+        "clients": set(),
+    }
+
+    async def handle(reader, writer):
+        await server._handle_client(state, reader, writer)
+
+    unix_server = await asyncio.start_unix_server(
+        handle, SOCKET_PATH, limit=SERVER_LINE_LIMIT
+    )
+    sys.stdout = state["output"]
+    try:
+        async with unix_server:
+            reader, writer = await asyncio.open_unix_connection(SOCKET_PATH)
+            try:
+                return await client(reader, writer)
+            finally:
+                writer.close()
+                await writer.wait_closed()
+    finally:
+        sys.stdout = state["output"].stream
+        state["executor"].shutdown(wait=True)
+        close_session(state["session"])
+
+# Отправляет команду и читает ответ: (записи select, строка состояния)
+async def _send(reader, writer, command):
+    writer.write(command.encode(ENCODING) + b"\n")
+    await writer.drain()
+    records = []
+    while "record" in (line := json.loads(await reader.readline())):
+        records.append(line["record"])
+    return records, line
+
+# Отправляет команды по одной и возвращает ответ на каждую
+def _exchange(*commands):
+    async def client(reader, writer):
+        return [await _send(reader, writer, command) for command in commands]
+
+    return asyncio.run(_with_server(client))
+
+# Строки состояния ответов
+def _statuses(*commands):
+    return [status for _, status in _exchange(*commands)]
+
+
+# Выполненная команда отвечает ok: true и выводом команды в messages
+def test_successful_command():
+    status, = _statuses("create_table users name:str age:int")
+
+    assert status["ok"] is True
+    assert any("users" in message for message in status["messages"])
+    assert "count" not in status
+
+# select отвечает строками записей и count в строке состояния
+def test_select_streams_records():
+    *_, (records, status) = _exchange(
+        "create_table users name:str age:int",
+        "insert users a 30",
+        "insert users b 20",
+        "select users WHERE age > 10 ORDER BY age",
+    )
+
+    assert records == [
+        {"name": "b", "age": 20, "ID": 2},
+        {"name": "a", "age": 30, "ID": 1},
+    ]
+    assert status["ok"] is True
+    assert status["count"] == 2
+
+# Ошибки, неизвестные команды и ошибки разбора отвечают ok: false
+@pytest.mark.parametrize(
+    "command",
+    [
+        "insert users a notanumber",
+        "select missing",
+        "frobnicate users",
+        'insert users "a 30',
+    ],
+)
+def test_errors_are_not_ok(command):
+    *_, status = _statuses("create_table users name:str age:int", command)
+
+    assert status["ok"] is False
+    assert status["messages"]
+
+# Операция, отклоненная без подтверждения (serve без --yes), не выполнена
+@pytest.mark.parametrize(
+    "command", ["delete users WHERE name = a", "drop_table users"]
+)
+def test_declined_confirmation_is_not_ok(command):
+    async def client(reader, writer):
+        await _send(reader, writer, "create_table users name:str age:int")
+        await _send(reader, writer, "insert users a 30")
+        set_confirmation_mode("no")
+        _, status = await _send(reader, writer, command)
+        _, select = await _send(reader, writer, "select users")
+        return status, select
+
+    declined, select = asyncio.run(_with_server(client))
+
+    assert declined["ok"] is False
+    assert any("отменена" in message for message in declined["messages"])
+    assert select["count"] == 1
+
+# exit отвечает ok: true и закрывает соединение
+def test_exit_closes_connection():
+    async def client(reader, writer):
+        _, status = await _send(reader, writer, "exit")
+        return status, await reader.readline()
+
+    status, rest = asyncio.run(_with_server(client))
+
+    assert status == {"ok": True, "messages": ["Соединение закрыто."]}
+    assert rest == b""
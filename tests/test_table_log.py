@@ -0,0 +1,93 @@
+"""
+Журнал изменений таблицы: проигрывание при загрузке, слияние
+с основным файлом и восстановление после оборванной записи.
+"""
+import os
+
+from primitive_db import utils
+from primitive_db.utils import (
+    append_table_log,
+    compact_table,
+    get_table_data_path,
+    get_table_log_path,
+    load_table_data,
+)
+
+
+# Имена и возраст записей таблицы в порядке ID
+def _rows(table_name):
+    return [
+        (record["ID"], record["name"], record["age"])
+        for record in load_table_data(table_name)["records"]
+    ]
+
+
+# Изменения пишутся в журнал и проигрываются при загрузке
+def test_changes_are_replayed_from_log(run):
+    run(
+        "create_table users name:str age:int",
+        "insert users a 30",
+        "insert users b 20",
+        "update users SET age = 31 WHERE name = a",
+        "delete users WHERE name = b",
+    )
+
+    assert os.path.getsize(get_table_log_path("users")) > 0
+    assert not os.path.exists(get_table_data_path("users"))
+    assert _rows("users") == [(1, "a", 31)]
+
+# compact переносит журнал в основной файл и удаляет журнал
+def test_compact_merges_log(run):
+    run(
+        "create_table users name:str age:int",
+        "insert users a 30",
+        "insert users b 20",
+        "update users SET age = 21 WHERE name = b",
+    )
+    before = _rows("users")
+
+    compact_table("users")
+
+    assert not os.path.exists(get_table_log_path("users"))
+    assert os.path.exists(get_table_data_path("users"))
+    assert _rows("users") == before == [(1, "a", 30), (2, "b", 21)]
+
+# Оборванная последняя строка пропускается и отрезается следующей записью
+def test_torn_log_tail_is_skipped_and_repaired(run):
+    run("create_table users name:str age:int", "insert users a 30")
+    with open(get_table_log_path("users"), "ab") as file:
+        file.write(b'{"op":"insert","record":{"name":"b"')
+
+    assert _rows("users") == [(1, "a", 30)]
+
+    output = run("insert users c 40")
+
+    assert "хвост отброшен" in output
+    assert _rows("users") == [(1, "a", 30), (2, "c", 40)]
+    with open(get_table_log_path("users"), "rb") as file:
+        assert all(line.endswith(b"\n") for line in file)
+
+# Записи журнала, уже учтенные в основном файле, повторно не применяются
+def test_log_entries_below_base_version_are_skipped(run):
+    run("create_table users name:str age:int", "insert users a 30")
+    compact_table("users")
+    version = load_table_data("users")["version"]
+
+    # Например, журнал, прочитанный до слияния другим процессом
+    append_table_log(
+        "users",
+        [{"op": "update", "ID": 1, "values": {"age": 99}, "version": version}],
+    )
+
+    assert _rows("users") == [(1, "a", 30)]
+
+# Журнал больше LOG_COMPACT_SIZE сливается с основным файлом сам
+def test_large_log_is_compacted(run, monkeypatch):
+    monkeypatch.setattr(utils, "LOG_COMPACT_SIZE", 200)
+    run("create_table users name:str age:int")
+
+    run(*(f"insert users n{number} {number}" for number in range(10)))
+
+    assert os.path.getsize(get_table_log_path("users")) <= 200
+    assert os.path.exists(get_table_data_path("users"))
+    assert [row[1] for row in _rows("users")] == [f"n{n}" for n in range(10)]
@@ -0,0 +1,103 @@
+"""
+Транзакции: BEGIN, COMMIT, ROLLBACK и восстановление фиксаций,
+прерванных сбоем, по журналу транзакций.
+"""
+import os
+
+from primitive_db import transactions
+from primitive_db.engine import close_session
+from primitive_db.transactions import get_journal_path, recover_transactions
+from primitive_db.utils import get_table_log_path, load_table_data, write_table_log
+
+
+# Имена и возраст записей таблицы на диске в порядке ID
+def _rows(table_name):
+    return [
+        (record["ID"], record["name"], record["age"])
+        for record in load_table_data(table_name)["records"]
+    ]
+
+
+# Зафиксированные изменения попадают на диск только после COMMIT
+def test_commit_applies_changes(run, query):
+    run("create_table users name:str age:int", "insert users a 30")
+
+    run(
+        "BEGIN",
+        "insert users b 20",
+        "update users SET age = 31 WHERE name = a",
+    )
+    assert _rows("users") == [(1, "a", 30)]
+    # Сеанс транзакции видит свои изменения
+    assert len(query("select users")) == 2
+
+    output = run("COMMIT")
+
+    assert "Транзакция зафиксирована (изменено таблиц: 1)" in output
+    assert _rows("users") == [(1, "a", 31), (2, "b", 20)]
+    assert os.path.getsize(get_journal_path()) == 0
+
+# ROLLBACK отбрасывает изменения и в памяти сеанса, и на диске
+def test_rollback_discards_changes(run, query):
+    run("create_table users name:str age:int", "insert users a 30")
+    log_size = os.path.getsize(get_table_log_path("users"))
+
+    run("BEGIN", "insert users b 20", "delete users WHERE name = a")
+    assert query("select users") == [{"name": "b", "age": 20, "ID": 2}]
+
+    output = run("ROLLBACK")
+
+    assert output.splitlines() == ["Транзакция отменена."]
+    assert query("select users") == [{"name": "a", "age": 30, "ID": 1}]
+    assert os.path.getsize(get_table_log_path("users")) == log_size
+    assert _rows("users") == [(1, "a", 30)]
+
+# Команды, которые пишут файлы напрямую, внутри транзакции запрещены
+def test_non_transactional_command_is_rejected(run):
+    run("create_table users name:str age:int", "BEGIN")
+
+    output = run("compact users")
+
+    assert output.startswith("Ошибка: команда compact недоступна")
+    run("ROLLBACK")
+
+# Незавершенная транзакция откатывается при закрытии сеанса
+def test_open_transaction_is_rolled_back_on_close(run, session):
+    run("create_table users name:str age:int", "BEGIN", "insert users a 30")
+
+    close_session(session)
+
+    assert session["transaction"] is None
+    assert _rows("users") == []
+
+# Фиксация, записанная в журнал транзакций до сбоя, переносится при запуске
+def test_recovery_applies_journaled_commit(run):
+    run("create_table users name:str age:int", "insert users a 30")
+    version = load_table_data("users")["version"] + 1
+    entry = {"op": "update", "ID": 1, "values": {"age": 31}, "version": version}
+
+    # Сбой после записи фиксации, но до переноса в журналы таблиц
+    transactions._write_commit("crashed", {"users": [entry]})
+
+    assert recover_transactions() == 1
+    assert _rows("users") == [(1, "a", 31)]
+    assert os.path.getsize(get_journal_path()) == 0
+    assert recover_transactions() == 0
+
+# Повторный перенос уже перенесенных записей ничего не меняет
+def test_recovery_after_partial_apply_is_idempotent(run):
+    run("create_table users name:str age:int", "insert users a 30")
+    version = load_table_data("users")["version"] + 1
+    entries = {
+        "users": [
+            {"op": "insert", "record": {"name": "b", "age": 20, "ID": 2},
+             "version": version},
+        ]
+    }
+
+    # Сбой после переноса в журнал таблицы, но до отметки о переносе
+    transactions._write_commit("crashed", entries)
+    write_table_log("users", entries["users"])
+
+    assert recover_transactions() == 1
+    assert _rows("users") == [(1, "a", 30), (2, "b", 20)]